@@ -1,21 +1,38 @@
 import logging
 import os
-import pickle
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 
-from definitions import NODE_ID_COL_NAME, ROOT_DIR, OSM_ID_COL_NAME
-from graph_preparation.create_turns_database import create_all_possible_turns
+import attack_parameters
+from definitions import NODE_ID_COL_NAME, ROOT_DIR, OSM_ID_COL_NAME, MAJOR_ROADS_TIER, NO_SERVICE_ROADS_TIER, \
+    ALL_ROADS_TIER
+from graph_preparation import create_turns_database, database_parameters
+from graph_preparation.create_turns_database import create_all_possible_turns, create_turns_at_intersections, \
+    create_roundabout_turns, combine_turns
+from graph_preparation.helper import connections_between_intersections, create_road_segments, road_class_tiers, \
+    create_turns_over_multiple_segments, create_roundabouts_database
 from graph_preparation.helper.connections_between_intersections import create_connections_between_intersections
 from graph_preparation.helper.create_road_segments import RoadSegmentElement, create_all_road_segments
-from osm_to_csv.osm_handler import WayHandler, TrafficLightHandler, RoundaboutHandler
-from utils import log
+from graph_preparation.helper.create_turns_over_multiple_segments import get_additional_turns_over_short_segments
+from graph_preparation.helper.reachability_tables import REACHABILITY_TABLES_PATH, create_reachability_tables, \
+    write_reachability_tables
+from graph_preparation.helper.road_class_tiers import get_turns_of_tier
+from graph_preparation.schema import RoadElements
+from osm_to_csv import osm_handler, osm_helper, osm_properties, clip_area as clip_area_module
+from osm_to_csv.clip_area import ClipArea
+from osm_to_csv.osm_handler import WayHandler, TrafficLightHandler, RoundaboutHandler, StreetNetworkHandler, \
+    StreamingWayHandler, SPARSE_MEM_ARRAY, get_location_index, set_pbf_decoding_threads
+from utils import log, angle_helper, distance_helper, functions
+from utils.build_cache import BuildStage, BuildCache, hash_file
+from utils.distance_helper import VINCENTY
+from utils.network_bundle import NETWORK_BUNDLE_PATH, write_network_bundle, load_network_bundle
 
 """ 
 For Usage, set 
-    a) the OSM_FILE variable: a path that refers to a raw osm dump export
+    a) the OSM_FILE variable: a path that refers to a raw osm dump export (.osm or .osm.pbf)
     b) the TARGET_LOCATION variable: a describing name for the location of the street network like a city name
+    c) optionally the CLIP_AREA variable: an area of interest to restrict the street network to
 """
 
 ######################################################################
@@ -26,6 +43,36 @@ OSM_FILE = ROOT_DIR + "/data/osm_export_12_04_21/Q1_Regensburg.osm"
 # Set target location name
 TARGET_LOCATION = "Regensburg"
 
+# Parse the osm file once for all csv files instead of running a separate handler for each of them
+PARSE_IN_SINGLE_PASS = True
+
+# Write ways and nodes directly to disk in two passes instead of keeping them in memory; needed for large extracts
+STREAM_WAYS_TO_DISK = False
+
+# Accuracy mode to calculate distances between nodes of ways: GEODESIC, VINCENTY or HAVERSINE
+DISTANCE_MODE = VINCENTY
+
+# Index to store node locations while parsing ways: SPARSE_MEM_ARRAY for small extracts, the file-backed
+# SPARSE_FILE_ARRAY or DENSE_FILE_ARRAY for large extracts, whose node locations don't fit into the RAM
+LOCATION_INDEX = SPARSE_MEM_ARRAY
+
+# Number of threads to decode blocks of a .osm.pbf file in parallel
+PBF_DECODING_THREADS = os.cpu_count()
+
+# Restrict the street network to an area of interest instead of the whole osm file, e.g.
+#   ClipArea.from_bbox(min_lat, min_lng, max_lat, max_lng)
+#   ClipArea.from_geojson(ROOT_DIR + "/data/area.geojson")
+#   ClipArea.from_wkt("POLYGON((12.05 48.99, 12.15 48.99, 12.15 49.05, 12.05 49.05, 12.05 48.99))")
+# None uses the whole osm file
+CLIP_AREA = None
+
+# Cache the output of each build stage, so a rerun only repeats the stages, whose inputs or parameters changed
+USE_BUILD_CACHE = True
+
+# Precompute the straight travel paths from each segment up to database_parameters.MAX_REACHABILITY_DISTANCE, so the
+# attack matches turn pairs by a range query instead of exploring the paths; costs build time and disk space
+CREATE_REACHABILITY_TABLES = False
+
 
 ######################################################################
 # define path to the target directory where files should be stored
@@ -33,8 +80,17 @@ BASE_TARGET_DIR = ROOT_DIR + '/data/target_maps/'
 CSV_DIR = '/csv'
 TURNS_DB_DIR = '/db'
 
-FILE_TARGET_DIR = ROOT_DIR + "/data/target_maps/" + TARGET_LOCATION
-SEGMENT_TO_OSM_DICT_NAME = '/db/segment_to_osm_ids.pickle'
+FILE_TARGET_DIR = BASE_TARGET_DIR + TARGET_LOCATION
+LOCATION_INDEX_FILE_NAME = '/node_locations.idx'
+BUILD_CACHE_DIR = '/cache'
+
+# stages of the street network build
+PARSE_STAGE = 'parse'
+CONNECTIONS_STAGE = 'connections'
+SEGMENTS_STAGE = 'segments'
+TURNS_STAGE = 'turns'
+SHORT_SEGMENT_TURNS_STAGE = 'short_segment_turns'
+ROUNDABOUTS_STAGE = 'roundabouts'
 
 
 ######################################################################
@@ -50,45 +106,152 @@ def __create_segment_id_to_osm_nodes_map(road_segments: [RoadSegmentElement], no
     return segment_id_to_osm_nodes
 
 
-if __name__ == '__main__':
-    log.setup(log_filename=ROOT_DIR + "/osm_to_csv/csv_creator.log")
-    log = logging.getLogger(__name__)
-
-    # Create target dirs for csv and image files
-    csv_target_dir = BASE_TARGET_DIR + TARGET_LOCATION + CSV_DIR
-    db_target_dir = BASE_TARGET_DIR + TARGET_LOCATION + TURNS_DB_DIR
+def parse_osm_file(osm_file: str, target_dir: str, clip_area: Optional[ClipArea] = None):
+    """ Parse an osm file dump to the csv files of the target dir, that are processed later """
+    logger = logging.getLogger(__name__)
+    csv_target_dir = target_dir + CSV_DIR
     if not os.path.exists(csv_target_dir):
         os.makedirs(csv_target_dir)
+
+    set_pbf_decoding_threads(PBF_DECODING_THREADS)
+    location_index_file = target_dir + LOCATION_INDEX_FILE_NAME
+    idx = get_location_index(LOCATION_INDEX, location_index_file)
+    if STREAM_WAYS_TO_DISK:
+        TrafficLightHandler(osm_file, csv_target_dir, logger, clip_area=clip_area)
+        RoundaboutHandler(osm_file, csv_target_dir, logger, idx=idx, clip_area=clip_area)
+        StreamingWayHandler(osm_file, csv_target_dir, logger, distance_mode=DISTANCE_MODE, idx=idx,
+                            clip_area=clip_area)
+    elif PARSE_IN_SINGLE_PASS:
+        StreetNetworkHandler(osm_file, csv_target_dir, logger, distance_mode=DISTANCE_MODE, idx=idx,
+                             clip_area=clip_area)
+    else:
+        TrafficLightHandler(osm_file, csv_target_dir, logger, clip_area=clip_area)
+        RoundaboutHandler(osm_file, csv_target_dir, logger, idx=idx, clip_area=clip_area)
+        WayHandler(osm_file, csv_target_dir, logger, distance_mode=DISTANCE_MODE, idx=idx, clip_area=clip_area)
+    if os.path.exists(location_index_file):
+        os.remove(location_index_file)
+
+
+def load_csv_files(target_dir: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """ Load the ways, nodes, traffic lights and roundabouts created by parsing the osm file """
+    ways = pd.read_csv(target_dir + CSV_DIR + '/ways.csv')
+    ways.drop_duplicates(inplace=True)
+    nodes = pd.read_csv(target_dir + CSV_DIR + '/nodes.csv')
+    traffic_lights = pd.read_csv(target_dir + CSV_DIR + '/traffic_lights.csv')
+    roundabouts = pd.read_csv(target_dir + CSV_DIR + '/roundabouts.csv')
+    return ways, nodes, traffic_lights, roundabouts
+
+
+def store_street_network(target_dir: str, turns: pd.DataFrame, all_road_segments: [RoadSegmentElement],
+                         nodes: pd.DataFrame):
+    """ Store turns, road segments, nodes and the osm ids on road segments in a single bundle for the attack """
+    logger = logging.getLogger(__name__)
+    # turns are tagged with their road class tier, so the attack can run on the reduced street graph of a tier
+    for tier in [MAJOR_ROADS_TIER, NO_SERVICE_ROADS_TIER, ALL_ROADS_TIER]:
+        logger.info("Road tier %d contains %d turns" % (tier, len(get_turns_of_tier(turns, tier))))
+
+    db_target_dir = target_dir + TURNS_DB_DIR
     if not os.path.exists(db_target_dir):
         os.makedirs(db_target_dir)
 
-    # 1. Run parsing osm file dump to csv files that will be processed later
-    t = TrafficLightHandler(OSM_FILE, csv_target_dir, log)
-    r = RoundaboutHandler(OSM_FILE, csv_target_dir, log)
-    w = WayHandler(OSM_FILE, csv_target_dir, log)
+    road_segments_df = pd.DataFrame.from_records([road_segment.to_dict() for road_segment in all_road_segments])
+    road_segments_df.set_index('segment_id', inplace=True)
+    node_to_osm_id = nodes.set_index(NODE_ID_COL_NAME)[OSM_ID_COL_NAME].to_dict()
+    segments_to_osm_nodes = __create_segment_id_to_osm_nodes_map(all_road_segments, node_to_osm_id)
+    write_network_bundle(target_dir + NETWORK_BUNDLE_PATH, turns, road_segments_df, nodes, segments_to_osm_nodes)
+    if CREATE_REACHABILITY_TABLES:
+        store_reachability_tables(target_dir)
+
 
-    # 2. Load newly created csv files
-    ways = pd.read_csv(FILE_TARGET_DIR + CSV_DIR + '/ways.csv')
-    ways.drop_duplicates(inplace=True)
-    nodes = pd.read_csv(FILE_TARGET_DIR + CSV_DIR + '/nodes.csv')
-    traffic_lights = pd.read_csv(FILE_TARGET_DIR + CSV_DIR + '/traffic_lights.csv')
-    roundabouts = pd.read_csv(FILE_TARGET_DIR + CSV_DIR + '/roundabouts.csv')
+def store_reachability_tables(target_dir: str):
+    """ Precompute the reachability tables of the network bundle in the target dir """
+    network = load_network_bundle(target_dir + NETWORK_BUNDLE_PATH)
+    reachability_tables = create_reachability_tables(network.straight_successors,
+                                                     int(network.segments_df.index.max()) + 1)
+    write_reachability_tables(target_dir + REACHABILITY_TABLES_PATH, reachability_tables,
+                              network.straight_successors)
 
-    # 3. Run scripts to create the street network
+
+def build_street_network(target_dir: str):
+    """ Create the street network from the csv files of the target dir and store it as network bundle there """
+    ways, nodes, traffic_lights, roundabouts = load_csv_files(target_dir)
+
+    # Run scripts to create the street network
     all_intersection_connections = create_connections_between_intersections(ways, nodes, traffic_lights, roundabouts)
     all_road_segments = create_all_road_segments(all_intersection_connections)
     turns = create_all_possible_turns(all_road_segments, nodes, ways, roundabouts)
 
-    # Store turns database for attack
-    turns.to_csv(FILE_TARGET_DIR + TURNS_DB_DIR + '/turns_df.csv', index=False)
+    store_street_network(target_dir, turns, all_road_segments, nodes)
 
-    # Store road_segments database for attack
-    road_segments_df = pd.DataFrame.from_records([road_segment.to_dict() for road_segment in all_road_segments])
-    road_segments_df.set_index('segment_id', inplace=True)
-    road_segments_df.to_csv(FILE_TARGET_DIR + TURNS_DB_DIR + '/road_segments_df.csv', index=False)
 
-    # Store a dict to retrieve all osm ids on road segments
-    node_to_osm_id = nodes.set_index(NODE_ID_COL_NAME)[OSM_ID_COL_NAME].to_dict()
-    segments_to_osm_nodes = __create_segment_id_to_osm_nodes_map(all_road_segments, node_to_osm_id)
-    with open(FILE_TARGET_DIR + SEGMENT_TO_OSM_DICT_NAME, 'wb') as dump_file:
-        pickle.dump(segments_to_osm_nodes, dump_file)
+def create_build_stages(osm_file: str, target_dir: str, clip_area: Optional[ClipArea]) -> [BuildStage]:
+    """
+    The DAG of the street network build. Each stage lists the parameters it reads, so changing e.g. a threshold for
+    turns over short segments only reruns that stage.
+    """
+
+    def parse(osm_file_path: str = osm_file):
+        parse_osm_file(osm_file_path, target_dir, clip_area)
+        return load_csv_files(target_dir)
+
+    return [
+        BuildStage(PARSE_STAGE, parse,
+                   parameters={'osm_file': hash_file(osm_file), 'distance_mode': DISTANCE_MODE,
+                               'clip_area': repr(clip_area)},
+                   code_modules=[osm_handler, osm_helper, osm_properties, clip_area_module, distance_helper]),
+        BuildStage(CONNECTIONS_STAGE,
+                   lambda csv_files: create_connections_between_intersections(*csv_files),
+                   inputs=[PARSE_STAGE],
+                   code_modules=[connections_between_intersections, RoadElements]),
+        BuildStage(SEGMENTS_STAGE, create_all_road_segments,
+                   inputs=[CONNECTIONS_STAGE],
+                   parameters={'TURN_THRESHOLD': attack_parameters.TURN_THRESHOLD,
+                               'THRESHOLD_DISTANCE_FOR_POINTS': database_parameters.THRESHOLD_DISTANCE_FOR_POINTS,
+                               'MINIMUM_DISTANCE_FOR_SPLIT': database_parameters.MINIMUM_DISTANCE_FOR_SPLIT,
+                               'ROAD_CLASS_TIERS': database_parameters.ROAD_CLASS_TIERS},
+                   code_modules=[create_road_segments, RoadElements, road_class_tiers, angle_helper, distance_helper]),
+        BuildStage(TURNS_STAGE,
+                   lambda road_segments, csv_files: create_turns_at_intersections(road_segments, csv_files[1]),
+                   inputs=[SEGMENTS_STAGE, PARSE_STAGE],
+                   parameters={'SMALL_ANGLE_THRESHOLD': database_parameters.SMALL_ANGLE_THRESHOLD,
+                               'MIN_DISTANCE_OF_ADJACENT_NODES': database_parameters.MIN_DISTANCE_OF_ADJACENT_NODES,
+                               'MIN_DISTANCE_STRAIGHT_TRAVEL': database_parameters.MIN_DISTANCE_STRAIGHT_TRAVEL},
+                   code_modules=[create_turns_database, RoadElements, angle_helper]),
+        BuildStage(SHORT_SEGMENT_TURNS_STAGE, get_additional_turns_over_short_segments,
+                   inputs=[SEGMENTS_STAGE, TURNS_STAGE],
+                   parameters={'SHORT_SEGMENT_LENGTH_THRESHOLD': database_parameters.SHORT_SEGMENT_LENGTH_THRESHOLD,
+                               'SHORT_SEGMENT_TURN_THRESHOLD': database_parameters.SHORT_SEGMENT_TURN_THRESHOLD},
+                   code_modules=[create_turns_over_multiple_segments]),
+        BuildStage(ROUNDABOUTS_STAGE,
+                   lambda road_segments, csv_files: create_roundabout_turns(road_segments, csv_files[1], csv_files[0],
+                                                                            csv_files[3]),
+                   inputs=[SEGMENTS_STAGE, PARSE_STAGE],
+                   code_modules=[create_roundabouts_database, RoadElements, angle_helper, functions]),
+    ]
+
+
+def build_street_network_with_cache(osm_file: str, target_dir: str, clip_area: Optional[ClipArea] = None):
+    """ Parse the osm file and create the street network, while skipping all stages with a cached output """
+    build_cache = BuildCache(create_build_stages(osm_file, target_dir, clip_area), target_dir + BUILD_CACHE_DIR)
+
+    all_road_segments = build_cache.get_output(SEGMENTS_STAGE)
+    turns = combine_turns(build_cache.get_output(TURNS_STAGE), build_cache.get_output(SHORT_SEGMENT_TURNS_STAGE),
+                          build_cache.get_output(ROUNDABOUTS_STAGE), all_road_segments)
+
+    store_street_network(target_dir, turns, all_road_segments, build_cache.get_output(PARSE_STAGE)[1])
+
+
+def create_street_network(osm_file: str, target_dir: str, clip_area: Optional[ClipArea] = None):
+    """ Parse the osm file and create the street network in the target dir """
+    if USE_BUILD_CACHE:
+        build_street_network_with_cache(osm_file, target_dir, clip_area)
+    else:
+        parse_osm_file(osm_file, target_dir, clip_area)
+        build_street_network(target_dir)
+
+
+if __name__ == '__main__':
+    log.setup(log_filename=ROOT_DIR + "/osm_to_csv/csv_creator.log")
+
+    # 1. Run parsing osm file dump to csv files and 2. create the street network from the csv files
+    create_street_network(OSM_FILE, FILE_TARGET_DIR, CLIP_AREA)
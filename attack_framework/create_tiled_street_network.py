@@ -0,0 +1,136 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from attack_framework.create_street_network import create_street_network, store_reachability_tables, \
+    BASE_TARGET_DIR, CREATE_REACHABILITY_TABLES, LOCATION_INDEX, LOCATION_INDEX_FILE_NAME, PBF_DECODING_THREADS
+from definitions import ROOT_DIR
+from graph_preparation.network_tiles import TileGrid, stitch_tiles
+from osm_to_csv.clip_area import ClipArea
+from osm_to_csv.osm_handler import TileExtractHandler, EXTRACT_FILE_EXTENSION, get_location_index, \
+    set_pbf_decoding_threads
+from utils import log
+from utils.network_bundle import NETWORK_BUNDLE_PATH, load_network_bundle, write_network_bundle
+
+"""
+Build the street network of a large region tile by tile and stitch the tiles to a single network bundle.
+For Usage, set
+    a) the OSM_FILE variable: a path that refers to a raw osm dump export (.osm or .osm.pbf) of the region
+    b) the TARGET_LOCATION variable: a describing name for the location of the street network like a region name
+    c) the AREA_BBOX variable: the bounding box of the region, that is split into TILE_ROWS x TILE_COLS tiles
+To build the tiles on multiple machines, let TILES_DIR refer to a shared directory and give each machine a share of the
+tiles in TILES_TO_BUILD with STITCH_TILES disabled. Run it once more with STITCH_TILES after all tiles are built.
+The OSM_FILE is read once to split it into an osm extract per tile, each tile is built from its own extract.
+The settings of create_street_network.py like LOCATION_INDEX apply to the build of each tile.
+"""
+
+######################################################################
+
+# SET OSM FILE TO PARSE HERE
+OSM_FILE = ROOT_DIR + "/data/osm_export_12_04_21/Bavaria.osm.pbf"
+
+# Set target location name
+TARGET_LOCATION = "Bavaria"
+
+# (min_lat, min_lng, max_lat, max_lng) of the region
+AREA_BBOX = (47.27, 8.97, 50.57, 13.84)
+TILE_ROWS = 4
+TILE_COLS = 4
+
+# Margin in meters, that the osm data of a tile extends beyond its core; should exceed the length of most segments
+TILE_OVERLAP_MARGIN = 2000.0
+
+# Indices of the tiles to build in this run; None builds all tiles
+TILES_TO_BUILD = None
+
+# Number of tiles built in parallel, each tile uses a process pool for its graph preparation itself
+TILE_PROCESSES = 1
+
+# Stitch all built tiles to the network bundle of the region
+STITCH_TILES = True
+
+######################################################################
+
+FILE_TARGET_DIR = BASE_TARGET_DIR + TARGET_LOCATION
+TILES_DIR = FILE_TARGET_DIR + '/tiles'
+TILE_GRID_FILE_NAME = '/tile_grid.json'
+TILE_DIR_NAME = '/tile_%d'
+TILE_EXTRACT_FILE_NAME = '/osm_extract' + EXTRACT_FILE_EXTENSION
+
+
+######################################################################
+
+
+def get_tile_grid(tiles_dir: str) -> TileGrid:
+    """ Plan the tiles once in the shared tiles dir, so all machines build the tiles of the same grid """
+    tile_grid = TileGrid(*AREA_BBOX, TILE_ROWS, TILE_COLS, TILE_OVERLAP_MARGIN)
+    tile_grid_file = tiles_dir + TILE_GRID_FILE_NAME
+    if not os.path.exists(tile_grid_file):
+        os.makedirs(tiles_dir, exist_ok=True)
+        tile_grid.store(tile_grid_file)
+    elif TileGrid.load(tile_grid_file).to_dict() != tile_grid.to_dict():
+        raise Exception("The tile grid in %s differs from the current settings. Remove the tiles dir to build the "
+                        "tiles of a new grid." % tile_grid_file)
+    return tile_grid
+
+
+def split_osm_file(osm_file: str, tiles_dir: str, tile_grid: TileGrid, tile_indices):
+    """ Split the osm file in a single pass into the osm extracts of the tiles within their overlap margin """
+    tile_dirs = [tiles_dir + TILE_DIR_NAME % tile_index for tile_index in tile_indices]
+    for tile_dir in tile_dirs:
+        os.makedirs(tile_dir, exist_ok=True)
+
+    set_pbf_decoding_threads(PBF_DECODING_THREADS)
+    location_index_file = tiles_dir + LOCATION_INDEX_FILE_NAME
+    TileExtractHandler(osm_file, [tile_grid.get_tile_bbox(tile_index) for tile_index in tile_indices],
+                       [tile_dir + TILE_EXTRACT_FILE_NAME for tile_dir in tile_dirs],
+                       idx=get_location_index(LOCATION_INDEX, location_index_file))
+    if os.path.exists(location_index_file):
+        os.remove(location_index_file)
+
+
+def build_tile(tiles_dir: str, tile_grid: TileGrid, tile_index: int):
+    """ Build the network bundle of a tile from its osm extract, that is clipped to its core and overlap margin """
+    print("Start building tile %d of %d:" % (tile_index, tile_grid.tile_count))
+    tile_dir = tiles_dir + TILE_DIR_NAME % tile_index
+    create_street_network(tile_dir + TILE_EXTRACT_FILE_NAME, tile_dir,
+                          ClipArea.from_bbox(*tile_grid.get_tile_bbox(tile_index)))
+
+
+def stitch_tile_bundles(tiles_dir: str, tile_grid: TileGrid, target_dir: str):
+    """ Stitch the network bundles of all tiles to the network bundle of the region """
+    missing_tiles = [tile_index for tile_index in range(tile_grid.tile_count)
+                     if not os.path.exists(tiles_dir + TILE_DIR_NAME % tile_index + NETWORK_BUNDLE_PATH)]
+    if missing_tiles:
+        raise Exception("Tiles %s aren't built yet." % missing_tiles)
+
+    tile_bundles = [load_network_bundle(tiles_dir + TILE_DIR_NAME % tile_index + NETWORK_BUNDLE_PATH)
+                    for tile_index in range(tile_grid.tile_count)]
+    turns, road_segments_df, nodes, segments_to_osm_nodes = stitch_tiles(tile_grid, tile_bundles)
+
+    os.makedirs(os.path.dirname(target_dir + NETWORK_BUNDLE_PATH), exist_ok=True)
+    write_network_bundle(target_dir + NETWORK_BUNDLE_PATH, turns, road_segments_df, nodes, segments_to_osm_nodes)
+    if CREATE_REACHABILITY_TABLES:
+        store_reachability_tables(target_dir)
+
+
+if __name__ == '__main__':
+    log.setup(log_filename=ROOT_DIR + "/osm_to_csv/csv_creator.log")
+    logger = logging.getLogger(__name__)
+
+    grid = get_tile_grid(TILES_DIR)
+    tiles_to_build = range(grid.tile_count) if TILES_TO_BUILD is None else TILES_TO_BUILD
+
+    # 1. Split the osm file into the extracts of the tiles to build
+    split_osm_file(OSM_FILE, TILES_DIR, grid, tiles_to_build)
+
+    # 2. Build the network of each tile from its extract in separate processes
+    with ProcessPoolExecutor(TILE_PROCESSES) as executor:
+        builds = [executor.submit(build_tile, TILES_DIR, grid, tile_index) for tile_index in tiles_to_build]
+        for build in builds:
+            build.result()
+    logger.info("Built %d tiles of %s" % (len(builds), TARGET_LOCATION))
+
+    # 3. Stitch the tiles to the network of the region
+    if STITCH_TILES:
+        stitch_tile_bundles(TILES_DIR, grid, FILE_TARGET_DIR)
@@ -1,13 +1,14 @@
-import pickle
 import timeit
 
 import pandas as pd
 
-from definitions import LAT_COL_NAME, LNG_COL_NAME, NODE_ID_COL_NAME, OSM_ID_COL_NAME, ROOT_DIR
+from definitions import ROOT_DIR
+from graph_preparation.helper.reachability_tables import REACHABILITY_TABLES_PATH, load_reachability_tables
 from sensor_analyze.preprocess_trip import SensorPreprocessor
-from trajectory_attack.create_route_candidates import RouteCandidateCreator
+from trajectory_attack.create_route_candidates import create_route_candidates_on_tiers
 from trajectory_attack.rank_route_candidates import get_ranked_route_candidates
 from utils.eval_helper import create_osm_path
+from utils.network_bundle import NETWORK_BUNDLE_PATH, TURN_CENTERS_INDEX, load_network_bundle
 
 # TODO remove again
 FILE_NAME = 'Route_F5'
@@ -22,6 +23,12 @@ AREA_TARGET_PATH = ROOT_DIR + "/data/target_maps/" + TARGET_LOCATION
 JSON_SENSOR_FILE_PATH = ROOT_DIR + "/data/Regensburg/" + FILE_NAME + ".json"
 GPS_TRIP_FILE_PATH = ROOT_DIR + "/data/Regensburg/" + FILE_NAME + ".html"
 
+# Restrict the attack to the rough area of the trip with a RegionPrior of trajectory_attack/helper/region_prior.py, e.g.
+#   RegionPrior(RadiusArea(49.01, 12.10, 3000.0))
+#   RegionPrior(ClipArea.from_geojson(ROOT_DIR + "/data/district.geojson"), turn_areas={0: RadiusArea(...)})
+# None searches the whole street network
+REGION_PRIOR = None
+
 
 def map_turns_to_intersection_id(route_candidates: [[int]], turns_df: pd.DataFrame) -> [[int]]:
     """ Get the corresponding intersection_ids for a sequence of turn_ids """
@@ -31,16 +38,17 @@ def map_turns_to_intersection_id(route_candidates: [[int]], turns_df: pd.DataFra
 
 if __name__ == '__main__':
     # Step 1: Load street network information
-    turns_df = pd.read_csv(AREA_TARGET_PATH + "/db/turns_df.csv")
-    segments_df = pd.read_csv(AREA_TARGET_PATH + "/db/road_segments_df.csv")
+    network = load_network_bundle(AREA_TARGET_PATH + NETWORK_BUNDLE_PATH)
+    turns_df = network.turns_df
+    segments_df = network.segments_df
+    # optional precomputed paths, see CREATE_REACHABILITY_TABLES of create_street_network.py
+    reachability_tables = load_reachability_tables(AREA_TARGET_PATH + REACHABILITY_TABLES_PATH,
+                                                   network.straight_successors)
 
     # Some helper variables to debug and/or display geographical locations in lat+lng
-    nodes_df = pd.read_csv(AREA_TARGET_PATH + "/csv/nodes.csv")
-    node_to_osm_id = nodes_df.set_index(NODE_ID_COL_NAME)[OSM_ID_COL_NAME].to_dict()
-    node_id_to_latlng = nodes_df.set_index(NODE_ID_COL_NAME)[[LAT_COL_NAME, LNG_COL_NAME]].apply(
-        tuple, axis=1).to_dict()
-    with open(AREA_TARGET_PATH + '/db/segment_to_osm_ids.pickle', 'rb') as dump_file:
-        segment_to_osm_ids = pickle.load(dump_file)
+    node_to_osm_id = network.node_id_to_osm_id
+    node_id_to_latlng = network.node_id_to_latlng
+    segment_to_osm_ids = network.segment_to_osm_ids
 
     # Step 2: Preprocess sensor readings
     start_time = timeit.default_timer()
@@ -54,8 +62,11 @@ if __name__ == '__main__':
 
     # Step 3: Retrieve route candidates
     start_time = timeit.default_timer()
-    route_candidates_creator = RouteCandidateCreator(turn_sequence, turns_df)
-    route_candidates = route_candidates_creator.create_new_route_candidates()
+    # runs on the road class tiers set in attack_parameters.ATTACK_ROAD_TIERS
+    route_candidates_creator, route_candidates = create_route_candidates_on_tiers(
+        turn_sequence, turns_df, straight_successors=network.straight_successors,
+        reachability_tables=reachability_tables, region_prior=REGION_PRIOR,
+        turn_center_index=network.spatial_indexes.get(TURN_CENTERS_INDEX))
     end_time = timeit.default_timer()
     print("Created %d route candidates in %.4f seconds." % (len(route_candidates), (end_time - start_time)))
 
@@ -1,16 +1,17 @@
 import timeit
 from typing import Tuple
 
-import geopy.distance
 import pandas as pd
 
-from definitions import LAT_COL_NAME, LNG_COL_NAME, NODE_ID_COL_NAME, OSM_ID_COL_NAME
+from definitions import NODE_ID_COL_NAME, OSM_ID_COL_NAME
 from definitions import ROOT_DIR
+from graph_preparation.helper.reachability_tables import REACHABILITY_TABLES_PATH, load_reachability_tables
 from schema.RouteCandidateModel import RouteCandidateModel
 from schema.sensor_models import SensorTurnModel, TrafficLightModel, RoundaboutTurnModel
 from trajectory_attack.create_route_candidates import RouteCandidateCreator
 from trajectory_attack.rank_route_candidates import get_ranked_route_candidates
 from utils.eval_helper import create_osm_path
+from utils.network_bundle import NETWORK_BUNDLE_PATH, TURN_CENTERS_INDEX, NetworkBundle, load_network_bundle
 
 """
 Set turns, traffic lights and name of sensor readings that should be inferred
@@ -50,11 +51,9 @@ def map_turns_to_intersection_id(route_candidates: [[int]], turns_df: pd.DataFra
     return [[turn_to_intersection_id[node] for node in route] for route in route_candidates]
 
 
-# noinspection PyTypeChecker
-def get_near_intersections(turns_df: pd.DataFrame, point: Tuple[float, float]) -> pd.DataFrame:
-    near_turns_mask = pd.Series([geopy.distance.distance(point, center).m
-                                 for center in zip(turns_df['intersection_lat'], turns_df['intersection_lng'])])
-    return turns_df[near_turns_mask < 20.0]
+def get_near_intersections(network: NetworkBundle, point: Tuple[float, float]) -> pd.DataFrame:
+    """ all turns at intersections within 20 meters of a (lat, lng) point """
+    return network.turns_df.loc[network.spatial_indexes[TURN_CENTERS_INDEX].query_radius(*point, 20.0)]
 
 
 def get_ranked_route(all_ranked_routes: [RouteCandidateModel],
@@ -76,22 +75,22 @@ if __name__ == '__main__':
     pd.set_option('display.width', 1000)
 
     # database creation
-    turns = pd.read_csv(FILE_TARGET_DIR + "/db/turns_df.csv")
-    nodes_df = pd.read_csv(FILE_TARGET_DIR + "/csv/nodes.csv")
-    segments_df = pd.read_csv(FILE_TARGET_DIR + "/db/road_segments_df.csv")
+    network = load_network_bundle(FILE_TARGET_DIR + NETWORK_BUNDLE_PATH)
+    turns = network.turns_df
+    nodes_df = network.nodes_df
+    segments_df = network.segments_df
+    reachability_tables = load_reachability_tables(FILE_TARGET_DIR + REACHABILITY_TABLES_PATH,
+                                                   network.straight_successors)
 
     # helper dicts for debugging
-    node_to_osm_id = nodes_df.set_index(NODE_ID_COL_NAME)[OSM_ID_COL_NAME].to_dict()
+    node_to_osm_id = network.node_id_to_osm_id
     osm_to_node_id = nodes_df.set_index(OSM_ID_COL_NAME)[NODE_ID_COL_NAME].to_dict()
-    node_id_to_latlng = nodes_df.set_index(NODE_ID_COL_NAME)[[LAT_COL_NAME, LNG_COL_NAME]].apply(
-        tuple, axis=1).to_dict()
-    import pickle
-
-    with open(FILE_TARGET_DIR + '/db/segment_to_osm_ids.pickle', 'rb') as dump_file:
-        segment_to_osm_ids = pickle.load(dump_file)
+    node_id_to_latlng = network.node_id_to_latlng
+    segment_to_osm_ids = network.segment_to_osm_ids
 
     start_time = timeit.default_timer()
-    route_candidates_creator = RouteCandidateCreator(sensor_turns, turns)
+    route_candidates_creator = RouteCandidateCreator(sensor_turns, turns, network.straight_successors,
+                                                     reachability_tables)
     new_route_candidates = route_candidates_creator.create_new_route_candidates()
     end_time = timeit.default_timer()
     print("Created %d route candidates in %.4f seconds." % (len(new_route_candidates), (end_time - start_time)))
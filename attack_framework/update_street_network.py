@@ -0,0 +1,85 @@
+import os
+from typing import List, Optional
+
+from attack_framework.create_street_network import OSM_FILE, FILE_TARGET_DIR, CLIP_AREA, CSV_DIR, BUILD_CACHE_DIR, \
+    PARSE_STAGE, CONNECTIONS_STAGE, SEGMENTS_STAGE, TURNS_STAGE, SHORT_SEGMENT_TURNS_STAGE, ROUNDABOUTS_STAGE, \
+    parse_osm_file, load_csv_files, create_build_stages, store_street_network
+from definitions import ROOT_DIR
+from graph_preparation.create_turns_database import create_roundabout_turns, combine_turns
+from graph_preparation.helper.create_turns_over_multiple_segments import get_additional_turns_over_short_segments
+from graph_preparation.network_update import assign_stable_node_ids, find_dirty_nodes, update_connections, \
+    update_road_segments, update_turns
+from osm_to_csv.clip_area import ClipArea
+from osm_to_csv.osm_handler import WAYS_CSV_NAME, NODES_CSV_NAME, apply_osm_changes
+from utils import log
+from utils.build_cache import BuildCache
+
+"""
+Update the street network of a previous build with osm change files (.osc) instead of building it anew. Node ids and
+road segment ids of the unaffected parts of the street network stay stable.
+For Usage, set
+    a) the CHANGE_FILES variable: the osm change files to apply in their order, e.g. the weekly diffs of the osm export
+    b) the UPDATED_OSM_FILE variable: a path to write the osm file with the changes applied to, which has to differ
+       from OSM_FILE, e.g. named after the last change file
+The previous build is read from the build cache of create_street_network.py with its settings like OSM_FILE,
+TARGET_LOCATION and CLIP_AREA. Set OSM_FILE of create_street_network.py to UPDATED_OSM_FILE afterwards, so the next
+update continues from this one, and give the next update its own UPDATED_OSM_FILE.
+"""
+
+######################################################################
+
+# SET OSM CHANGE FILES TO APPLY HERE
+CHANGE_FILES = [ROOT_DIR + "/data/osm_export_12_04_21/Q1_Regensburg_changes.osc"]
+
+# the osm file of the previous build with the changes applied
+UPDATED_OSM_FILE = ROOT_DIR + "/data/osm_export_12_04_21/Q1_Regensburg_updated.osm"
+
+
+######################################################################
+
+
+def update_street_network(osm_file: str, change_files: List[str], updated_osm_file: str, target_dir: str,
+                          clip_area: Optional[ClipArea] = None):
+    """
+    Apply osm change files to the street network built from osm_file in the target dir. The csv files are parsed anew
+    from the updated osm file, but only the connections, road segments and turns affected by the changes are created
+    anew. The turns over short segments and through roundabouts are derived from all turns and road segments again.
+    """
+    cache_dir = target_dir + BUILD_CACHE_DIR
+    previous_build = BuildCache(create_build_stages(osm_file, target_dir, clip_area), cache_dir)
+    previous_csv_files = previous_build.get_output(PARSE_STAGE)
+
+    # 1. parse the updated osm file and keep the node ids of the previous build
+    apply_osm_changes(osm_file, change_files, updated_osm_file)
+    parse_osm_file(updated_osm_file, target_dir, clip_area)
+    csv_files = assign_stable_node_ids(previous_csv_files[1], load_csv_files(target_dir))
+    ways, nodes, traffic_lights, roundabouts = csv_files
+    ways.to_csv(os.path.join(target_dir + CSV_DIR, WAYS_CSV_NAME), index=False)
+    nodes.to_csv(os.path.join(target_dir + CSV_DIR, NODES_CSV_NAME), index=False)
+
+    # 2. create the connections, road segments and turns at the dirty nodes anew
+    dirty_nodes = find_dirty_nodes(previous_csv_files, csv_files)
+    all_intersection_connections, replaced_connections, created_connections = update_connections(
+        previous_build.get_output(CONNECTIONS_STAGE), previous_csv_files[1], csv_files, dirty_nodes)
+    all_road_segments, changed_intersections = update_road_segments(
+        previous_build.get_output(SEGMENTS_STAGE), replaced_connections, created_connections)
+    turns = update_turns(previous_build.get_output(TURNS_STAGE), all_road_segments, nodes, changed_intersections)
+    short_segment_turns = get_additional_turns_over_short_segments(all_road_segments, turns)
+    roundabout_turns = create_roundabout_turns(all_road_segments, nodes, ways, roundabouts)
+
+    # 3. cache the results as the stage outputs of the updated osm file, so the next update continues from them
+    updated_build = BuildCache(create_build_stages(updated_osm_file, target_dir, clip_area), cache_dir)
+    for stage_name, output in [(PARSE_STAGE, csv_files), (CONNECTIONS_STAGE, all_intersection_connections),
+                               (SEGMENTS_STAGE, all_road_segments), (TURNS_STAGE, turns),
+                               (SHORT_SEGMENT_TURNS_STAGE, short_segment_turns),
+                               (ROUNDABOUTS_STAGE, roundabout_turns)]:
+        updated_build.set_output(stage_name, output)
+
+    store_street_network(target_dir, combine_turns(turns, short_segment_turns, roundabout_turns, all_road_segments),
+                         all_road_segments, nodes)
+
+
+if __name__ == '__main__':
+    log.setup(log_filename=ROOT_DIR + "/osm_to_csv/csv_creator.log")
+
+    update_street_network(OSM_FILE, CHANGE_FILES, UPDATED_OSM_FILE, FILE_TARGET_DIR, CLIP_AREA)
@@ -1,6 +1,11 @@
 """
 General parameters about the attack to retrieve Routes can be set here
 """
+from definitions import ALL_ROADS_TIER
+
+# Road class tiers of the street graph the attack runs on one after another, until route candidates are found, e.g.
+# [MAJOR_ROADS_TIER, ALL_ROADS_TIER] runs on major roads first and falls back to the full street graph
+ATTACK_ROAD_TIERS = [ALL_ROADS_TIER]
 
 # An angle at an intersection has to reach this threshold to be accepted as a turn
 TURN_THRESHOLD = 30.0
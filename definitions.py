@@ -43,5 +43,12 @@ START_ID_COL_NAME = ':START_ID'
 END_ID_COL_NAME = ':END_ID'
 AGGREGATED_DISTANCE_COL_NAME = 'aggregated_distance:double'
 SPEED_LIMIT_COL_NAME = 'speedlimit:int'
+HIGHWAY_COL_NAME = 'highway:string'
 
 RADIUS_OF_EARTH = 6378.1
+
+# Road class tiers of the street graph; tiers are nested, so a tier contains the road classes of all lower tiers
+MAJOR_ROADS_TIER = 0
+NO_SERVICE_ROADS_TIER = 1
+# contains all streets, also road classes not listed in the ROAD_CLASS_TIERS of the database parameters
+ALL_ROADS_TIER = 2
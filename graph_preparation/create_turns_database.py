@@ -1,8 +1,8 @@
 import timeit
-from multiprocessing import Pool
-from typing import Tuple, List
+from collections import defaultdict
+from typing import Tuple, List, Dict, Optional, Iterable
 
-import geopy.distance
+import numpy as np
 import pandas as pd
 
 from definitions import NODE_ID_COL_NAME, LAT_COL_NAME, LNG_COL_NAME
@@ -11,71 +11,89 @@ from graph_preparation.database_parameters import SMALL_ANGLE_THRESHOLD, MIN_DIS
     MIN_DISTANCE_OF_ADJACENT_NODES
 from graph_preparation.helper.create_road_segments import RoadSegmentElement
 from graph_preparation.helper.create_turns_over_multiple_segments import get_additional_turns_over_short_segments
-from graph_preparation.schema.RoadElements import TurnElement
-from utils.angle_helper import calc_turn_angle
+from graph_preparation.helper.road_class_tiers import add_road_tiers_to_turns
+from graph_preparation.schema.RoadElements import TurnElement, RoundaboutElement
+from utils.angle_helper import calc_turn_angles, project_to_tangent_plane
 from utils.functions import flatten_list
+from utils.worker_pool import map_with_shared_state, get_worker_state
+
+
+# positions of the nodes on a segment, the small angles at them and whether a longer straight distance follows
+SmallAngles = Tuple[List[Tuple[float, float]], np.ndarray, List[bool]]
+# columns, that identify a turn like TurnElement.__hash__, to remove duplicated turns
+TURN_IDENTITY_COLUMNS = ['angle', 'end_direction', 'distance_before', 'distance_after', 'start_lat', 'start_lng',
+                         'intersection_lat', 'intersection_lng', 'end_lat', 'end_lng']
 
 
 class TurnDatabaseCreator(object):
+    """
+    Creates the turns at an intersection only from the road segments incident to it, so the creator itself holds no
+    road segments and workers look up the segments of the intersections they process in the shared state.
+    """
 
-    def __init__(self, road_segments: [RoadSegmentElement]):
-        self.road_segments = road_segments
+    def create_turns_at_intersection(self, intersection_id: int, intersection_position: Tuple[float, float],
+                                     possible_starts: [RoadSegmentElement],
+                                     possible_targets: [RoadSegmentElement]) -> List[TurnElement]:
+        """
+        :param possible_starts: all segments, FROM WHERE the current intersection can be REACHED
+        :param possible_targets: all segments, that can be REACHED FROM THE current intersection
+        """
+        # skip the target, as u-turn on the same road-segment is not possible
+        segment_pairs = [(current_start, current_target)
+                         for current_target in possible_targets
+                         for current_start in possible_starts
+                         if current_start.start_id != current_target.end_id]
+        if not segment_pairs:
+            return []
+
+        # first angles between two segments from the two adjacent nodes of the intersection
+        direct_angles = calc_turn_angles([start.nodes_on_segment[-2].position for start, _ in segment_pairs],
+                                         [intersection_position] * len(segment_pairs),
+                                         [target.nodes_on_segment[1].position for _, target in segment_pairs])
+
+        # small angles only depend on the segment, so calculate them once for each segment
+        start_segment_angles = {current_start.segment_id: self.__get_small_angles_on_start_segment(
+            current_start, intersection_position) for current_start in possible_starts}
+        target_segment_angles = {current_target.segment_id: self.__get_small_angles_on_target_segment(
+            current_target, intersection_position) for current_target in possible_targets}
 
-    def create_turns_at_intersection(self, intersection_id: int, intersection_position: Tuple[float, float]) \
-            -> List[TurnElement]:
         turns_at_intersection = []
-
-        # retrieve all intersections, that can be REACHED FROM THE current intersection
-        possible_targets = [road_segment for road_segment in self.road_segments
-                            if road_segment.start_id == intersection_id]
-        # retrieve all intersections, FROM WHERE the current intersection can be REACHED
-        possible_starts = [road_segment for road_segment in self.road_segments
-                           if road_segment.end_id == intersection_id]
-
-        for current_target in possible_targets:
-            for current_start in possible_starts:
-                # skip the target, as u-turn on the same road-segment is not possible
-                if current_start.start_id == current_target.end_id:
-                    continue
-
-                turn_angle, curvature_angle, start_point, end_point = self.__calc_curr_turn_angle(current_start,
-                                                                                                  current_target,
-                                                                                                  intersection_position)
-                curvature = curvature_angle + current_target.road_curvature
-
-                turns_at_intersection.append(
-                    TurnElement(seg_start_id=current_start.segment_id, seg_target_id=current_target.segment_id,
-                                intersection_id=intersection_id, angle=turn_angle,
-                                end_direction=current_target.driving_direction,
-                                distance_before=current_start.distance, distance_after=current_target.distance,
-                                start=start_point, center=intersection_position,
-                                end=end_point,
-                                curvature=curvature)
-                )
+        for (current_start, current_target), direct_angle in zip(segment_pairs, direct_angles.tolist()):
+            turn_angle, start_point, end_point = self.__calc_curr_turn_angle(
+                current_start, current_target, direct_angle, start_segment_angles[current_start.segment_id],
+                target_segment_angles[current_target.segment_id])
+            curvature = direct_angle + current_target.road_curvature
+
+            turns_at_intersection.append(
+                TurnElement(seg_start_id=current_start.segment_id, seg_target_id=current_target.segment_id,
+                            intersection_id=intersection_id, angle=turn_angle,
+                            end_direction=current_target.driving_direction,
+                            distance_before=current_start.distance, distance_after=current_target.distance,
+                            start=start_point, center=intersection_position,
+                            end=end_point,
+                            curvature=curvature)
+            )
 
         return turns_at_intersection
 
     # noinspection PyMethodMayBeStatic
     def __calc_curr_turn_angle(self, start_segment: RoadSegmentElement, target_segment: RoadSegmentElement,
-                               intersection_position: Tuple[float, float]) -> Tuple[float,
-                                                                                    float,
-                                                                                    Tuple[float, float],
-                                                                                    Tuple[float, float]]:
+                               direct_angle: float, small_angles_on_start_segment: SmallAngles,
+                               small_angles_on_target_segment: SmallAngles) -> Tuple[float,
+                                                                                     Tuple[float, float],
+                                                                                     Tuple[float, float]]:
         """
 
         :param start_segment: the segment from where the vehicle is coming
         :param target_segment: the segment where the vehicle is driving afterwards
-        :param intersection_position: the intersection point connecting both segments
+        :param direct_angle: the angle between the two adjacent nodes of the intersection
         :return: - the angle at the intersection
                  - the start of the possible turn
                  - the end of the possible turn
         """
         curr_start_position = start_segment.nodes_on_segment[-2].position
         curr_end_position = target_segment.nodes_on_segment[1].position
-        # first angle between two segments
-        turn_angle = calc_turn_angle(curr_start_position, intersection_position, curr_end_position)
-        # angle from two adjacent nodes from intersection
-        direct_angle = turn_angle
+        turn_angle = direct_angle
 
         # check direction of possible turn
         if turn_angle > SMALL_ANGLE_THRESHOLD:
@@ -83,148 +101,203 @@ class TurnDatabaseCreator(object):
         elif turn_angle < - SMALL_ANGLE_THRESHOLD:
             is_right_turn = False
         else:
-            return turn_angle, direct_angle, curr_start_position, curr_end_position
+            return turn_angle, curr_start_position, curr_end_position
 
-        # calculate additional small angles on start segment, if needed
-        angles_on_start_segment, curr_start_position = self.__get_turn_angles_on_start_segment(
-            start_segment, intersection_position, curr_start_position, is_right_turn, not is_right_turn)
+        # sum up additional small angles on start segment, if needed
+        angles_on_start_segment, curr_start_position = sum_small_angles(
+            small_angles_on_start_segment, curr_start_position, is_right_turn)
 
-        # calculate additional small angles on target segment, if needed
-        angles_on_end_segment, curr_end_position = self.__get_turn_angles_on_target_segment(
-            target_segment, intersection_position, curr_end_position, is_right_turn, not is_right_turn)
+        # sum up additional small angles on target segment, if needed
+        angles_on_end_segment, curr_end_position = sum_small_angles(
+            small_angles_on_target_segment, curr_end_position, is_right_turn)
 
         # add summed up angles on each of the segments
         turn_angle += angles_on_start_segment + angles_on_end_segment
 
-        return turn_angle, direct_angle, curr_start_position, curr_end_position
+        return turn_angle, curr_start_position, curr_end_position
 
     # noinspection PyMethodMayBeStatic
-    def __get_turn_angles_on_start_segment(self, start_segment: RoadSegmentElement,
-                                           intersection_position: Tuple[float, float],
-                                           curr_start_position: Tuple[float, float], is_right_turn: bool,
-                                           is_left_turn: bool) -> Tuple[float, Tuple[float, float]]:
+    def __get_small_angles_on_start_segment(self, start_segment: RoadSegmentElement,
+                                            intersection_position: Tuple[float, float]) -> SmallAngles:
         """
-        Check all small angles on target segment. Stop summing small angles up, if:
-        - angle is too small
-        - change in direction occured
-        - distance between center and target point exceeds a specific threshold, meaning turn started with this angle
-        @:return - the summed up angle
-                 - the position where the possible turn starts
+        Get all small angles on the start segment, that could add up to a turn at the intersection. The list has to
+        be iterated in reverse, as this is the start segment leading to the current intersection.
         """
-        angle_on_start_segment = 0.0
         # no angles on segment, if there are not at least 3 points
-        if len(start_segment.nodes_on_segment) > 2:
-            target_position = intersection_position
-            center_position = curr_start_position
-            # list has to be iterated in reverse, as this is the start segment leading to the current intersection
-            for start in reversed(start_segment.nodes_on_segment[:-2]):
-                if geopy.distance.distance(start.position, center_position).m < MIN_DISTANCE_OF_ADJACENT_NODES:
-                    continue
-
-                curr_start_position = start.position
-                next_angle = calc_turn_angle(curr_start_position, center_position, target_position)
-                # condition checks to continue calculation on segment
-                if is_right_turn and next_angle > SMALL_ANGLE_THRESHOLD:
-                    angle_on_start_segment += next_angle
-                elif is_left_turn and next_angle < -SMALL_ANGLE_THRESHOLD:
-                    angle_on_start_segment += next_angle
-                else:
-                    break
-                # early exit condition: turn starts here, as before this angle a longer straight distance occurs
-                if geopy.distance.distance(curr_start_position, center_position).m > MIN_DISTANCE_STRAIGHT_TRAVEL:
-                    break
-
-                # update helper variables
-                target_position = center_position
-                center_position = curr_start_position
-
-        return angle_on_start_segment, curr_start_position
+        if len(start_segment.nodes_on_segment) <= 2:
+            return [], np.empty(0), []
+
+        candidates = [node.position for node in reversed(start_segment.nodes_on_segment[:-2])]
+        starts, centers, targets, is_straight_travel = find_small_angle_nodes(
+            candidates, start_segment.nodes_on_segment[-2].position, intersection_position)
+        return starts, calc_turn_angles(starts, centers, targets), is_straight_travel
 
     # noinspection PyMethodMayBeStatic
-    def __get_turn_angles_on_target_segment(self, target_segment: RoadSegmentElement,
-                                            intersection_position: Tuple[float, float],
-                                            curr_target_position: Tuple[float, float], is_right_turn: bool,
-                                            is_left_turn: bool) -> Tuple[float, Tuple[float, float]]:
-        """
-        Check all small angles on target segment. Stop summing small angles up, if:
-        - angle is too small
-        - change in direction occured
-        - distance between center and target point exceeds a specific threshold, meaning turn ended with this angle
-        @:return - the summed up angle
-                 - the position where the possible turn ends
-        """
-        angle_on_target_segment = 0.0
+    def __get_small_angles_on_target_segment(self, target_segment: RoadSegmentElement,
+                                             intersection_position: Tuple[float, float]) -> SmallAngles:
+        """ Get all small angles on the target segment, that could add up to a turn at the intersection """
         # no angles on segment, if there are not at least 3 points
-        if len(target_segment.nodes_on_segment) > 2:
-            start_position = intersection_position
-            center_position = curr_target_position
-
-            for target in target_segment.nodes_on_segment[2:]:
-                if geopy.distance.distance(target.position, center_position).m < MIN_DISTANCE_OF_ADJACENT_NODES:
-                    continue
-
-                curr_target_position = target.position
-                next_angle = calc_turn_angle(start_position, center_position, curr_target_position)
-                # condition checks to continue calculation on segment
-                if is_right_turn and next_angle > SMALL_ANGLE_THRESHOLD:
-                    angle_on_target_segment += next_angle
-                elif is_left_turn and next_angle < -SMALL_ANGLE_THRESHOLD:
-                    angle_on_target_segment += next_angle
-                else:
-                    break
-                # early exit condition: turn ends here, as after this angle a longer straight distance occurs
-                if geopy.distance.distance(center_position, curr_target_position).m > MIN_DISTANCE_STRAIGHT_TRAVEL:
-                    break
-
-                # update helper variables
-                start_position = center_position
-                center_position = curr_target_position
-
-        return angle_on_target_segment, curr_target_position
+        if len(target_segment.nodes_on_segment) <= 2:
+            return [], np.empty(0), []
 
+        candidates = [node.position for node in target_segment.nodes_on_segment[2:]]
+        targets, centers, starts, is_straight_travel = find_small_angle_nodes(
+            candidates, target_segment.nodes_on_segment[1].position, intersection_position)
+        return targets, calc_turn_angles(starts, centers, targets), is_straight_travel
 
-def create_all_possible_turns(road_segments: [RoadSegmentElement],
-                              nodes_df: pd.DataFrame,
-                              ways_df: pd.DataFrame,
-                              roundabouts_df: pd.DataFrame) -> pd.DataFrame:
+
+def find_small_angle_nodes(candidates: [Tuple[float, float]], first_center: Tuple[float, float],
+                           first_far_position: Tuple[float, float]) \
+        -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]], List[Tuple[float, float]], List[bool]]:
     """
-    Endpoint for creating all possible turns for the given data
+    Walk along the candidate nodes of a segment away from the intersection and collect the node triples of possible
+    small angles. Nodes too close to the current center are skipped, and the walk stops at the first node, after
+    which a longer straight distance occurs, as a turn can't start or end any further away.
+    @:return - the near, center and far position of each triple, where far is the one nearer to the intersection
+             - whether a longer straight distance occurs between near and center of each triple
+    """
+    nears, centers, fars, is_straight_travel = [], [], [], []
+    if not candidates:
+        return nears, centers, fars, is_straight_travel
+
+    center_position, far_position = first_center, first_far_position
+    for candidate in candidates:
+        # distance in the tangent plane of the center
+        distance = float(np.hypot(*project_to_tangent_plane([candidate], center_position)[0]))
+        if distance < MIN_DISTANCE_OF_ADJACENT_NODES:
+            continue
+
+        nears.append(candidate)
+        centers.append(center_position)
+        fars.append(far_position)
+        is_straight_travel.append(distance > MIN_DISTANCE_STRAIGHT_TRAVEL)
+        if distance > MIN_DISTANCE_STRAIGHT_TRAVEL:
+            break
+
+        far_position = center_position
+        center_position = candidate
+
+    return nears, centers, fars, is_straight_travel
+
+
+def sum_small_angles(small_angles: SmallAngles, curr_position: Tuple[float, float],
+                     is_right_turn: bool) -> Tuple[float, Tuple[float, float]]:
+    """
+    Sum up the small angles on a segment in the direction of the turn. Stop summing small angles up, if:
+    - angle is too small
+    - change in direction occured
+    - distance between center and the next point exceeds a specific threshold, meaning turn started/ended here
+    @:return - the summed up angle
+             - the position where the possible turn starts/ends
+    """
+    summed_angle = 0.0
+    for curr_position, next_angle, is_straight_travel in zip(*small_angles):
+        # condition checks to continue calculation on segment
+        if is_right_turn and next_angle > SMALL_ANGLE_THRESHOLD:
+            summed_angle += next_angle
+        elif not is_right_turn and next_angle < -SMALL_ANGLE_THRESHOLD:
+            summed_angle += next_angle
+        else:
+            break
+        # early exit condition: turn starts/ends here, as after this angle a longer straight distance occurs
+        if is_straight_travel:
+            break
+
+    return summed_angle, curr_position
+
+
+def index_road_segments_by_intersection(road_segments: [RoadSegmentElement]) \
+        -> Tuple[Dict[int, List[RoadSegmentElement]], Dict[int, List[RoadSegmentElement]]]:
+    """ map each intersection to the segments starting and to the segments ending at it in the original order """
+    segments_by_start_id = defaultdict(list)
+    segments_by_end_id = defaultdict(list)
+    for road_segment in road_segments:
+        segments_by_start_id[road_segment.start_id].append(road_segment)
+        segments_by_end_id[road_segment.end_id].append(road_segment)
+    return segments_by_start_id, segments_by_end_id
+
+
+def __create_turns_at_intersection(intersection_id: int) -> List[TurnElement]:
+    """ create the turns at an intersection in a worker with the shared creator, node positions and segment index """
+    turn_database_creator, node_id_to_latlng, segments_by_start_id, segments_by_end_id = get_worker_state()
+    return turn_database_creator.create_turns_at_intersection(intersection_id, node_id_to_latlng[intersection_id],
+                                                              segments_by_end_id.get(intersection_id, []),
+                                                              segments_by_start_id.get(intersection_id, []))
+
+
+def create_turns_at_intersections(road_segments: [RoadSegmentElement], nodes_df: pd.DataFrame,
+                                  intersection_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """
+    Create the turns between the road segments at all intersections
+    :param intersection_ids: only create the turns at these intersections, e.g. for an update
     """
     print('Start creating Turn Database:')
     start_time = timeit.default_timer()
     # Retrieve all intersection_ids from the RoadSegments, as a RoadSegment always starts at an Intersection
     intersections_id_set = set([road_segment.start_id for road_segment in road_segments])
+    if intersection_ids is not None:
+        intersections_id_set.intersection_update(intersection_ids)
 
-    turn_database_creator = TurnDatabaseCreator(road_segments)
+    turn_database_creator = TurnDatabaseCreator()
+    segments_by_start_id, segments_by_end_id = index_road_segments_by_intersection(road_segments)
 
     # map nodes from node_id to their corresponding (lat, lng)
-    node_id_to_latlng = nodes_df.set_index(NODE_ID_COL_NAME)[[LAT_COL_NAME, LNG_COL_NAME]].apply(
+    intersections_df = nodes_df[nodes_df[NODE_ID_COL_NAME].isin(intersections_id_set)]
+    node_id_to_latlng = intersections_df.set_index(NODE_ID_COL_NAME)[[LAT_COL_NAME, LNG_COL_NAME]].apply(
         tuple, axis=1).to_dict()
-    intersection_details = [(intersection_id, node_id_to_latlng[intersection_id])
-                            for intersection_id in intersections_id_set]
-
-    with Pool() as pool:
-        all_turns = pool.starmap(turn_database_creator.create_turns_at_intersection,
-                                 intersection_details)
+    # workers receive the read-only lookups once, so only intersection ids are sent with the tasks
+    all_turns = map_with_shared_state(__create_turns_at_intersection, intersections_id_set,
+                                      (turn_database_creator, node_id_to_latlng, segments_by_start_id,
+                                       segments_by_end_id))
     all_turns = flatten_list(all_turns)
 
     end_time = timeit.default_timer()
     print('Created %d turns in %.4f seconds.' % (len(all_turns), (end_time - start_time)))
 
-    all_turns = all_turns + get_additional_turns_over_short_segments(road_segments, all_turns)
+    return pd.DataFrame.from_records([turn.to_dict() for turn in all_turns])
 
-    all_roundabouts = create_roundabout_units(nodes_df, ways_df, roundabouts_df, road_segments)
+
+def create_roundabout_turns(road_segments: [RoadSegmentElement],
+                            nodes_df: pd.DataFrame,
+                            ways_df: pd.DataFrame,
+                            roundabouts_df: pd.DataFrame) -> [RoundaboutElement]:
+    """ Create the turn units through all roundabouts """
+    segments_by_start_id, segments_by_end_id = index_road_segments_by_intersection(road_segments)
+    return create_roundabout_units(nodes_df, ways_df, roundabouts_df, segments_by_start_id, segments_by_end_id)
+
+
+def combine_turns(turns_df: pd.DataFrame,
+                  short_segment_turns_df: pd.DataFrame,
+                  roundabouts: [RoundaboutElement],
+                  road_segments: [RoadSegmentElement]) -> pd.DataFrame:
+    """ Unite the turns at intersections, over short segments and through roundabouts to the turns database """
+    normal_turns_dict = pd.concat([turns_df, short_segment_turns_df], ignore_index=True)
 
     # remove edge case of duplicates
-    all_turns = set(all_turns)
-    all_roundabouts = set(all_roundabouts)
+    normal_turns_dict = normal_turns_dict.drop_duplicates(subset=TURN_IDENTITY_COLUMNS, ignore_index=True)
+    all_roundabouts = set(roundabouts)
 
-    # convert turns to dataFrames and set is_roundabout attribute
-    normal_turns_dict = pd.DataFrame.from_records([turn.to_dict() for turn in all_turns])
+    # convert roundabouts to dataFrames and set is_roundabout attribute
     normal_turns_dict['is_roundabout'] = False
-    roundabout_turns_dict = pd.DataFrame.from_records([roundabout.to_dict() for roundabout in all_roundabouts])
-    roundabout_turns_dict['is_roundabout'] = True
+    all_turns_df = normal_turns_dict
+    # an empty frame without columns would turn the id columns into floats on concatenation
+    if all_roundabouts:
+        roundabout_turns_dict = pd.DataFrame.from_records([roundabout.to_dict() for roundabout in all_roundabouts])
+        roundabout_turns_dict['is_roundabout'] = True
+        all_turns_df = pd.concat([normal_turns_dict, roundabout_turns_dict], ignore_index=True)
 
-    # return unified dataframe containing all turns and roundabouts
-    return pd.concat([normal_turns_dict, roundabout_turns_dict], ignore_index=True)
+    # return unified dataframe containing all turns and roundabouts, tagged with the road class tier they belong to
+    return add_road_tiers_to_turns(all_turns_df, {segment.segment_id: segment.road_tier for segment in road_segments})
 
+
+def create_all_possible_turns(road_segments: [RoadSegmentElement],
+                              nodes_df: pd.DataFrame,
+                              ways_df: pd.DataFrame,
+                              roundabouts_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Endpoint for creating all possible turns for the given data
+    """
+    turns_df = create_turns_at_intersections(road_segments, nodes_df)
+    short_segment_turns_df = get_additional_turns_over_short_segments(road_segments, turns_df)
+    roundabouts = create_roundabout_turns(road_segments, nodes_df, ways_df, roundabouts_df)
+    return combine_turns(turns_df, short_segment_turns_df, roundabouts, road_segments)
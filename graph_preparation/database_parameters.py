@@ -1,6 +1,7 @@
 """
 General parameters about the creation of the database can be set here
 """
+from definitions import MAJOR_ROADS_TIER, NO_SERVICE_ROADS_TIER
 
 """ Parameters for Road Segment splitting """
 # to estimate the first/last point of a segment, they should be x meters before a node of the
@@ -23,3 +24,17 @@ MIN_DISTANCE_STRAIGHT_TRAVEL = 10.0
 # before and after the segment are too close to each other to be distincted as two turns
 SHORT_SEGMENT_LENGTH_THRESHOLD = 30.0
 SHORT_SEGMENT_TURN_THRESHOLD = 15.0
+
+""" Parameters for road class tiers"""
+# the road classes of the tiers in definitions.py; an attack on a lower tier runs on a reduced street graph with fewer
+# intersections and turns, road classes not listed here are only part of the ALL_ROADS_TIER
+ROAD_CLASS_TIERS = {
+    MAJOR_ROADS_TIER: ['motorway', 'motorway_link', 'motorway_junction', 'trunk', 'trunk_link', 'primary',
+                       'primary_link', 'secondary', 'secondary_link', 'tertiary', 'tertiary_link'],
+    NO_SERVICE_ROADS_TIER: ['unclassified', 'residential', 'living_street', 'mini_roundabout', 'road'],
+}
+
+""" Parameters for reachability tables"""
+# the reachability tables store the straight travel paths from each segment up to this distance in meters; turn pairs
+# with a larger measured distance between them are matched by exploring the paths during the attack
+MAX_REACHABILITY_DISTANCE = 1500.0
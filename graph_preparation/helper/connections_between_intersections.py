@@ -1,13 +1,15 @@
 import timeit
-from multiprocessing import Pool
-from typing import Optional
+from typing import Optional, Iterable
 
+import numpy as np
 import pandas as pd
 
 from definitions import LABEL_COL_NAME, NODE_ID_COL_NAME, LAT_COL_NAME, LNG_COL_NAME, START_ID_COL_NAME, \
-    END_ID_COL_NAME, SPEED_LIMIT_COL_NAME, AGGREGATED_DISTANCE_COL_NAME, INTERSECTION, OSM_ID_COL_NAME
+    END_ID_COL_NAME, SPEED_LIMIT_COL_NAME, AGGREGATED_DISTANCE_COL_NAME, INTERSECTION, OSM_ID_COL_NAME, \
+    HIGHWAY_COL_NAME
 from graph_preparation.schema.RoadElements import IntersectionConnectionElement, NodeOnIntersectionConnectionElement
 from utils.functions import flatten_list
+from utils.worker_pool import map_with_shared_state, get_worker_state
 
 
 class IntersectionConnectionsCreator(object):
@@ -16,7 +18,8 @@ class IntersectionConnectionsCreator(object):
                  roundabouts_df: pd.DataFrame):
         # remove all ways within roundabouts, as roundabouts are handled separately
         roundabout_ids = roundabouts_df[OSM_ID_COL_NAME].unique()
-        self.ways_df = ways_df[~ways_df[OSM_ID_COL_NAME].isin(roundabout_ids)]
+        ways_df = ways_df[~ways_df[OSM_ID_COL_NAME].isin(roundabout_ids)]
+        self.__create_adjacency(ways_df, nodes_df[NODE_ID_COL_NAME].max() + 1)
 
         # store a set of traffic light nodes for fast checking
         self.traffic_light_nodes = set(nodes_df.merge(
@@ -27,33 +30,58 @@ class IntersectionConnectionsCreator(object):
             tuple, axis=1).to_dict()
 
         # store all node_id's of intersections in a set for faster check
-        self.intersections_df = nodes_df[nodes_df[LABEL_COL_NAME] == INTERSECTION]
-        self.intersections_id_set = set(self.intersections_df[NODE_ID_COL_NAME].unique())
+        intersections_df = nodes_df[nodes_df[LABEL_COL_NAME] == INTERSECTION]
+        self.intersections_id_set = set(intersections_df[NODE_ID_COL_NAME].unique())
+
+    def __create_adjacency(self, ways_df: pd.DataFrame, num_nodes: int):
+        """
+        Store the ways in compressed sparse row format: the ways starting at node_id are at the positions
+        adjacency_offsets[node_id] to adjacency_offsets[node_id + 1] of the adjacency arrays. A stable sort keeps
+        the order of the ways_df for ways starting at the same node.
+        """
+        start_ids = ways_df[START_ID_COL_NAME].to_numpy()
+        order = np.argsort(start_ids, kind='stable')
+
+        self.adjacency_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(start_ids, minlength=num_nodes), out=self.adjacency_offsets[1:])
+        self.adjacency_targets = ways_df[END_ID_COL_NAME].to_numpy()[order]
+        self.adjacency_speed_limits = ways_df[SPEED_LIMIT_COL_NAME].to_numpy()[order]
+        self.adjacency_distances = ways_df[AGGREGATED_DISTANCE_COL_NAME].to_numpy()[order]
+        self.adjacency_highways = ways_df[HIGHWAY_COL_NAME].to_numpy()[order]
+
+    def __find_next_way(self, node_id: int, previous_node_id: int) -> int:
+        """ position of the first way in the adjacency from node_id to another node than previous_node_id or -1 """
+        for position in range(self.adjacency_offsets[node_id], self.adjacency_offsets[node_id + 1]):
+            if self.adjacency_targets[position] != previous_node_id:
+                return position
+        return -1
 
     def create_connections_for_intersection(self, intersection_id: int) -> [IntersectionConnectionElement]:
         # receive all connections originating from current Intersection
-        current_connections = self.ways_df[self.ways_df[START_ID_COL_NAME] == intersection_id]
-        # select columns current_connections for numpy vectorization and index them with the position
-        # re-casting to correct datatypes is needed, as selected columns will be casted to float in numpy array
         # flatten list, as two connections could be added in one call due to dead-ends
-        return flatten_list([self.__add_connection_to_intersection(intersection_id, int(connection[0]),
-                                                                   int(connection[1]), float(connection[2]))
-                             for connection in current_connections[
-                                 [END_ID_COL_NAME, SPEED_LIMIT_COL_NAME, AGGREGATED_DISTANCE_COL_NAME]].values])
+        return flatten_list([self.__add_connection_to_intersection(intersection_id,
+                                                                   int(self.adjacency_targets[position]),
+                                                                   int(self.adjacency_speed_limits[position]),
+                                                                   float(self.adjacency_distances[position]),
+                                                                   self.adjacency_highways[position])
+                             for position in range(self.adjacency_offsets[intersection_id],
+                                                   self.adjacency_offsets[intersection_id + 1])])
 
     def __add_connection_to_intersection(self, curr_intersection: int, next_node_id: int, next_speed_limit: int,
-                                         next_distance: float) -> [IntersectionConnectionElement]:
+                                         next_distance: float, next_highway: str) -> [IntersectionConnectionElement]:
         nodes_on_connection = [
             NodeOnIntersectionConnectionElement(node_id=curr_intersection,
                                                 speed_limit=next_speed_limit,
                                                 distance=0.0,
                                                 position=self.node_id_to_latlng[curr_intersection],
-                                                is_traffic_light=curr_intersection in self.traffic_light_nodes),
+                                                is_traffic_light=curr_intersection in self.traffic_light_nodes,
+                                                highway=next_highway),
             NodeOnIntersectionConnectionElement(node_id=next_node_id,
                                                 speed_limit=next_speed_limit,
                                                 distance=next_distance,
                                                 position=self.node_id_to_latlng[next_node_id],
-                                                is_traffic_light=next_node_id in self.traffic_light_nodes)]
+                                                is_traffic_light=next_node_id in self.traffic_light_nodes,
+                                                highway=next_highway)]
         # helper variable to avoid endless loops
         previous_node_id = curr_intersection
 
@@ -61,87 +89,98 @@ class IntersectionConnectionsCreator(object):
         while True:
             # follow the connection by getting the next node in this direction: retrieve way, whose end_id isn't the
             # previous node to prevent endless loop; can only result to one row, if it's no intersection
-            next_way = self.ways_df[
-                (self.ways_df[START_ID_COL_NAME] == next_node_id) & (self.ways_df[END_ID_COL_NAME] != previous_node_id)
-                ]
+            next_way = self.__find_next_way(next_node_id, previous_node_id)
 
             # check if next_node is an intersection or dead-end
             if next_node_id in self.intersections_id_set:
                 return [IntersectionConnectionElement(curr_intersection, next_node_id, nodes_on_connection)]
-            elif next_way.empty:
+            elif next_way == -1:
                 # Dead-End found; remove for possible None's, because of possible one-ways
                 return [x for x in [IntersectionConnectionElement(curr_intersection, next_node_id, nodes_on_connection),
                                     self.__create_dead_end(curr_intersection, next_node_id, previous_node_id,
                                                            next_speed_limit,
-                                                           next_distance)] if x is not None]
+                                                           next_distance,
+                                                           next_highway)] if x is not None]
             else:
                 # proceed with the next node, as sub-nodes of a connection between intersections should be removed
                 previous_node_id = next_node_id
 
                 # add next node between intersections
-                next_node_id = next_way.iloc[0][END_ID_COL_NAME]
-                next_distance = next_way.iloc[0][AGGREGATED_DISTANCE_COL_NAME]
-                next_speed_limit = next_way.iloc[0][SPEED_LIMIT_COL_NAME]
+                next_node_id = self.adjacency_targets[next_way]
+                next_distance = self.adjacency_distances[next_way]
+                next_speed_limit = self.adjacency_speed_limits[next_way]
+                next_highway = self.adjacency_highways[next_way]
                 nodes_on_connection.append(
                     NodeOnIntersectionConnectionElement(node_id=next_node_id,
                                                         speed_limit=next_speed_limit,
                                                         distance=next_distance,
                                                         position=self.node_id_to_latlng[next_node_id],
-                                                        is_traffic_light=next_node_id in self.traffic_light_nodes))
+                                                        is_traffic_light=next_node_id in self.traffic_light_nodes,
+                                                        highway=next_highway))
 
     def __create_dead_end(self, curr_intersection: int, dead_end: int, next_node_id: int, next_speed_limit: int,
-                          next_distance: float) -> Optional[IntersectionConnectionElement]:
+                          next_distance: float, next_highway: str) -> Optional[IntersectionConnectionElement]:
         nodes_starting_from_dead_end = [
             NodeOnIntersectionConnectionElement(node_id=dead_end,
                                                 speed_limit=next_speed_limit,
                                                 distance=0.0,
                                                 position=self.node_id_to_latlng[dead_end],
-                                                is_traffic_light=dead_end in self.traffic_light_nodes),
+                                                is_traffic_light=dead_end in self.traffic_light_nodes,
+                                                highway=next_highway),
             NodeOnIntersectionConnectionElement(node_id=next_node_id,
                                                 speed_limit=next_speed_limit,
                                                 distance=next_distance,
                                                 position=self.node_id_to_latlng[next_node_id],
-                                                is_traffic_light=next_node_id in self.traffic_light_nodes)]
+                                                is_traffic_light=next_node_id in self.traffic_light_nodes,
+                                                highway=next_highway)]
         previous_node_id = dead_end
 
         while True:
             # follow the connection by getting the next node in this direction: retrieve way, whose end_id isn't the
             # previous node to prevent endless loop; can only result to one row, if it's no intersection
-            next_way = self.ways_df[
-                (self.ways_df[START_ID_COL_NAME] == next_node_id) & (self.ways_df[END_ID_COL_NAME] != previous_node_id)
-                ]
+            next_way = self.__find_next_way(next_node_id, previous_node_id)
             if next_node_id == curr_intersection:
                 return IntersectionConnectionElement(dead_end, curr_intersection, nodes_starting_from_dead_end)
             # might be one-way street, so return None
-            elif next_way.empty:
+            elif next_way == -1:
                 return None
             else:
                 # iterate one step ahead
                 previous_node_id = next_node_id
-                next_node_id = next_way.iloc[0][END_ID_COL_NAME]
+                next_node_id = self.adjacency_targets[next_way]
 
                 nodes_starting_from_dead_end.append(
                     NodeOnIntersectionConnectionElement(node_id=next_node_id,
-                                                        speed_limit=next_way.iloc[0][SPEED_LIMIT_COL_NAME],
-                                                        distance=next_way.iloc[0][AGGREGATED_DISTANCE_COL_NAME],
+                                                        speed_limit=self.adjacency_speed_limits[next_way],
+                                                        distance=self.adjacency_distances[next_way],
                                                         position=self.node_id_to_latlng[next_node_id],
-                                                        is_traffic_light=next_node_id in self.traffic_light_nodes))
+                                                        is_traffic_light=next_node_id in self.traffic_light_nodes,
+                                                        highway=self.adjacency_highways[next_way]))
+
+
+def __create_connections_for_intersection(intersection_id: int) -> [IntersectionConnectionElement]:
+    """ create the connections of an intersection in a worker with the shared creator """
+    return get_worker_state().create_connections_for_intersection(intersection_id)
 
 
 def create_connections_between_intersections(ways_df: pd.DataFrame, nodes_df: pd.DataFrame,
                                              traffic_lights_df: pd.DataFrame,
-                                             roundabouts_df: pd.DataFrame) -> [IntersectionConnectionElement]:
+                                             roundabouts_df: pd.DataFrame,
+                                             intersection_ids: Optional[Iterable[int]] = None) \
+        -> [IntersectionConnectionElement]:
     """
     Endpoint to find and create all connections between intersections
+    :param intersection_ids: only create the connections originating from these intersections, e.g. for an update
     """
     database_creator = IntersectionConnectionsCreator(ways_df, nodes_df, traffic_lights_df, roundabouts_df)
+    if intersection_ids is None:
+        intersection_ids = database_creator.intersections_id_set
 
     print('Find all Connections between Intersections:')
     start_time = timeit.default_timer()
 
-    with Pool() as pool:
-        results = pool.map(database_creator.create_connections_for_intersection,
-                           database_creator.intersections_id_set)
+    # workers receive the adjacency and node lookups once, so only intersection ids are sent with the tasks
+    results = map_with_shared_state(__create_connections_for_intersection, intersection_ids, database_creator)
 
     connections = flatten_list(results)
     end_time = timeit.default_timer()
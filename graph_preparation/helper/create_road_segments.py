@@ -1,15 +1,16 @@
 import timeit
-from multiprocessing import Pool
 from typing import Tuple
 
-import geopy.distance
+import numpy as np
 
 from attack_parameters import TURN_THRESHOLD
 from graph_preparation.database_parameters import THRESHOLD_DISTANCE_FOR_POINTS, MINIMUM_DISTANCE_FOR_SPLIT
 from graph_preparation.schema.RoadElements import RoadSegmentElement, IntersectionConnectionElement, \
     NodeOnIntersectionConnectionElement
-from utils.angle_helper import calc_binary_direction_to_north, calc_turn_angle
+from utils.angle_helper import calc_binary_direction_to_north, calc_turn_angles
+from utils.distance_helper import calc_distances
 from utils.functions import flatten_list
+from utils.worker_pool import map_with_shared_state, get_worker_state
 
 
 def find_first_point_after_start(nodes_on_segment: [NodeOnIntersectionConnectionElement]) -> Tuple[float, float]:
@@ -36,14 +37,40 @@ def find_last_point_before_end(nodes_on_segment: [NodeOnIntersectionConnectionEl
     return nodes_on_segment[0].position
 
 
+def calc_cumulative_distances(nodes_on_segment: [NodeOnIntersectionConnectionElement]) -> np.ndarray:
+    """ distance from the start of the node list to each node; the distance of the first node is ignored """
+    cumulative_distances = np.zeros(len(nodes_on_segment), dtype=np.float64)
+    np.cumsum([node.distance for node in nodes_on_segment[1:]], out=cumulative_distances[1:])
+    return cumulative_distances
+
+
+def find_first_point_indices_after(cumulative_distances: np.ndarray, start_indices: np.ndarray) -> np.ndarray:
+    """
+    Vectorized find_first_point_after_start for node lists starting at each of start_indices and running to the end
+    :return: the index of the first node at least x meters after each start index, otherwise the index of the end
+    """
+    indices = np.searchsorted(cumulative_distances, cumulative_distances[start_indices] + THRESHOLD_DISTANCE_FOR_POINTS,
+                              side='left')
+    return np.minimum(indices, len(cumulative_distances) - 1)
+
+
+def find_last_point_indices_before(cumulative_distances: np.ndarray, end_indices: np.ndarray) -> np.ndarray:
+    """
+    Vectorized find_last_point_before_end for node lists starting at the first node and ending at each of end_indices
+    :return: the index of the last node at least x meters before each end index, otherwise the index of the start
+    """
+    indices = np.searchsorted(cumulative_distances, cumulative_distances[end_indices] - THRESHOLD_DISTANCE_FOR_POINTS,
+                              side='right') - 1
+    return np.maximum(indices, 0)
+
+
 def calc_road_curvature(nodes_on_segment: [NodeOnIntersectionConnectionElement]) -> float:
-    road_curvature = 0
+    """ sum of the turn angles at all nodes between start and end """
+    if len(nodes_on_segment) < 3:
+        return 0
 
-    for i in range(2, len(nodes_on_segment)):
-        road_curvature += calc_turn_angle(nodes_on_segment[i - 2].position,
-                                          nodes_on_segment[i - 1].position,
-                                          nodes_on_segment[i].position)
-    return road_curvature
+    positions = np.array([node.position for node in nodes_on_segment], dtype=np.float64)
+    return float(np.sum(calc_turn_angles(positions[:-2], positions[1:-1], positions[2:])))
 
 
 def find_traffic_light(nodes_on_segment: [NodeOnIntersectionConnectionElement]) -> float:
@@ -96,32 +123,32 @@ class RoadSegmentCreator(object):
                 return [self.__create_normal_segment(connection)]
 
     def __check_for_turn_on_segment(self, nodes_on_segment: [NodeOnIntersectionConnectionElement]):
-        max_split_point = -1
-        max_split_point_angle = 0
-
-        """ Check for possible turning maneuvers on a road segment """
-        for i in range(2, len(nodes_on_segment)):
-            split_point = nodes_on_segment[i - 1]
-            point_before_split = find_last_point_before_end(nodes_on_segment[:i])
-            point_after_split = find_first_point_after_start(nodes_on_segment[i - 1:])
-
-            current_curvature = calc_turn_angle(point_before_split,
-                                                split_point.position,
-                                                point_after_split)
-
-            if abs(current_curvature) >= TURN_THRESHOLD \
-                    and self.__is_min_split_distance(split_point.position, nodes_on_segment[0].position) \
-                    and self.__is_min_split_distance(split_point.position, nodes_on_segment[-1].position):
-                # found a node, where a turn could be recognized
-                if abs(current_curvature) > max_split_point_angle:
-                    max_split_point = i - 1
-                    max_split_point_angle = abs(current_curvature)
+        """ Check for possible turning maneuvers on a road segment and return the index of the sharpest one """
+        positions = np.array([node.position for node in nodes_on_segment], dtype=np.float64)
+        cumulative_distances = calc_cumulative_distances(nodes_on_segment)
+
+        # every node between start and end is a possible split point
+        split_indices = np.arange(1, len(nodes_on_segment) - 1)
+        points_before_split = positions[find_last_point_indices_before(cumulative_distances, split_indices)]
+        points_after_split = positions[find_first_point_indices_after(cumulative_distances, split_indices)]
+        split_points = positions[split_indices]
+
+        curvatures = np.abs(calc_turn_angles(points_before_split, split_points, points_after_split))
+        is_split_point = (curvatures >= TURN_THRESHOLD) & \
+                         self.__is_min_split_distance(split_points, positions[0]) & \
+                         self.__is_min_split_distance(split_points, positions[-1])
 
         # no turn on segment found
-        return max_split_point
+        if not is_split_point.any():
+            return -1
 
-    def __is_min_split_distance(self, split_position: Tuple[float, float], position: Tuple[float, float]) -> bool:
-        return geopy.distance.distance(split_position, position).m > MINIMUM_DISTANCE_FOR_SPLIT
+        # the first node with the sharpest turn
+        return int(split_indices[np.argmax(np.where(is_split_point, curvatures, -1.0))])
+
+    def __is_min_split_distance(self, split_positions: np.ndarray, position: np.ndarray) -> np.ndarray:
+        positions = np.broadcast_to(position, split_positions.shape)
+        return calc_distances(split_positions[:, 0], split_positions[:, 1],
+                              positions[:, 0], positions[:, 1]) > MINIMUM_DISTANCE_FOR_SPLIT
 
     def __create_normal_segment(self, connection: IntersectionConnectionElement) -> RoadSegmentElement:
         """Segment with multiple subnodes"""
@@ -148,6 +175,12 @@ class RoadSegmentCreator(object):
                                   driving_direction, 0.0, connection.nodes_on_connection, distance_to_traffic_light)
 
 
+def __create_road_segments_of_connection(connection_index: int) -> [RoadSegmentElement]:
+    """ create the road segments of a connection in a worker with the shared creator and connections """
+    road_segment_creator, intersection_connections = get_worker_state()
+    return road_segment_creator.create_road_segment(intersection_connections[connection_index])
+
+
 def create_all_road_segments(intersection_connections: [IntersectionConnectionElement]) -> [RoadSegmentElement]:
     """
     Endpoint for creating a list of RoadSegments for the given data
@@ -156,13 +189,15 @@ def create_all_road_segments(intersection_connections: [IntersectionConnectionEl
     start_time = timeit.default_timer()
 
     road_segment_creator = RoadSegmentCreator()
-    with Pool() as pool:
-        road_segments = pool.map(road_segment_creator.create_road_segment, intersection_connections)
+    # workers receive the connections once, so only their indices are sent with the tasks
+    road_segments = map_with_shared_state(__create_road_segments_of_connection, range(len(intersection_connections)),
+                                          (road_segment_creator, intersection_connections))
     road_segments = flatten_list(road_segments)
 
-    # Assign each segment a unique id sequentially after creating them due to multiprocessing
-    for segment in road_segments:
-        segment.assign_id()
+    # Assign each segment a unique id sequentially after creating them due to multiprocessing; the ids start at 0 for
+    # every street network, so they don't depend on the street networks built before in the same process
+    for segment_id, segment in enumerate(road_segments):
+        segment.assign_id(segment_id)
 
     end_time = timeit.default_timer()
     print('Created %d Road Segments in %.4f seconds.' % (len(road_segments), (end_time - start_time)))
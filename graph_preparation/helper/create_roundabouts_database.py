@@ -1,12 +1,13 @@
 import timeit
-from typing import Set, List
+from typing import Set, List, Tuple, Dict
 
+import numpy as np
 import pandas as pd
 
 from definitions import NODE_ID_COL_NAME, LAT_COL_NAME, LNG_COL_NAME, OSM_ID_COL_NAME, START_ID_COL_NAME
 from graph_preparation.helper.create_road_segments import RoadSegmentElement
 from graph_preparation.schema.RoadElements import RoundaboutElement
-from utils.angle_helper import calc_turn_angle, get_intersect_from_two_lines
+from utils.angle_helper import calc_turn_angles, get_intersect_from_two_lines
 from utils.functions import flatten_list, merge_intersecting_sets
 
 U_TURN_ANGLE = -180.0
@@ -17,13 +18,15 @@ class RoundaboutUnitsCreator(object):
                  nodes_df: pd.DataFrame,
                  ways_df: pd.DataFrame,
                  roundabouts_df: pd.DataFrame,
-                 road_segments: [RoadSegmentElement]):
+                 segments_by_start_id: Dict[int, List[RoadSegmentElement]],
+                 segments_by_end_id: Dict[int, List[RoadSegmentElement]]):
 
         self.node_id_to_latlng = nodes_df.set_index(NODE_ID_COL_NAME)[[LAT_COL_NAME, LNG_COL_NAME]].apply(
             tuple, axis=1).to_dict()
 
         self.real_roundabouts = self.__get_nodes_for_roundabouts(ways_df, roundabouts_df)
-        self.road_segments = road_segments
+        self.segments_by_start_id = segments_by_start_id
+        self.segments_by_end_id = segments_by_end_id
 
     def __get_nodes_for_roundabouts(self, ways_df: pd.DataFrame, roundabouts_df: pd.DataFrame) -> List[Set[int]]:
         """ Store each roundabout as a set of nodes """
@@ -40,44 +43,63 @@ class RoundaboutUnitsCreator(object):
         roundabout_units = []
 
         # query segments before entering a roundabout
-        start_segments = [segment for segment in self.road_segments if segment.end_id in current_roundabout_nodes]
+        start_segments = self.__get_segments_at_nodes(self.segments_by_end_id, current_roundabout_nodes)
         # query segments after exiting a roundabout
-        target_segments = [segment for segment in self.road_segments if segment.start_id in current_roundabout_nodes]
+        target_segments = self.__get_segments_at_nodes(self.segments_by_start_id, current_roundabout_nodes)
 
+        roundabout_exits = []
         for start_segment in start_segments:
             for target_segment in target_segments:
                 # check for "U-Turn Roundabout"
                 if start_segment.end_id == target_segment.start_id and start_segment.start_id == target_segment.end_id:
                     roundabout_units.append(self.__create_u_turn_roundabout(start_segment, target_segment))
                 else:
-                    roundabout_units.append(self.__create_roundabout_exit(start_segment, target_segment))
-
-        return roundabout_units
-
-    def __create_roundabout_exit(self, start_segment: RoadSegmentElement,
-                                 target_segment: RoadSegmentElement) -> RoundaboutElement:
-        start_segment_start = self.node_id_to_latlng[start_segment.start_id]
-        start_segment_end = self.node_id_to_latlng[start_segment.end_id]
-        end_segment_start = self.node_id_to_latlng[target_segment.start_id]
-        end_segment_end = self.node_id_to_latlng[target_segment.end_id]
-
-        # receive a helper point for turn angle calculation
-        intersect = get_intersect_from_two_lines(start_segment_start, start_segment_end, end_segment_start,
-                                                 end_segment_end)
+                    roundabout_exits.append((start_segment, target_segment))
+
+        return roundabout_units + self.__create_roundabout_exits(roundabout_exits)
+
+    # noinspection PyMethodMayBeStatic
+    def __get_segments_at_nodes(self, segments_by_node_id: Dict[int, List[RoadSegmentElement]],
+                                roundabout_nodes: Set[int]) -> [RoadSegmentElement]:
+        """ look up the segments at the nodes of a roundabout, ordered by their id like in the list of all segments """
+        return sorted([segment for node_id in roundabout_nodes for segment in segments_by_node_id.get(node_id, [])],
+                      key=lambda segment: segment.segment_id)
+
+    def __create_roundabout_exits(self, roundabout_exits: List[Tuple[RoadSegmentElement, RoadSegmentElement]]) \
+            -> [RoundaboutElement]:
+        """ create the roundabout units of all exits and calculate their angles at once """
+        if not roundabout_exits:
+            return []
+
+        starts, intersects, ends = [], [], []
+        for start_segment, target_segment in roundabout_exits:
+            start_segment_start = self.node_id_to_latlng[start_segment.start_id]
+            start_segment_end = self.node_id_to_latlng[start_segment.end_id]
+            end_segment_start = self.node_id_to_latlng[target_segment.start_id]
+            end_segment_end = self.node_id_to_latlng[target_segment.end_id]
+
+            # receive a helper point for turn angle calculation
+            starts.append(start_segment_start)
+            intersects.append(get_intersect_from_two_lines(start_segment_start, start_segment_end, end_segment_start,
+                                                           end_segment_end))
+            ends.append(end_segment_end)
 
         # no intersect point of two lines is found, if lines are parallel, i.e. no angle change occurs
-        if intersect == (float('inf'), float('inf')):
-            angle = 0.0
-        else:
-            angle = calc_turn_angle(start_segment_start, intersect, end_segment_end)
-
-        return RoundaboutElement(start_segment.segment_id, target_segment.segment_id, start_segment.end_id,
-                                 angle, target_segment.driving_direction,
-                                 start_segment_start,
-                                 start_segment_end,
-                                 end_segment_end,
-                                 start_segment.distance,
-                                 target_segment.distance)
+        intersects = np.array(intersects, dtype=np.float64)
+        is_parallel = np.isinf(intersects).any(axis=1)
+        angles = np.zeros(len(roundabout_exits), dtype=np.float64)
+        angles[~is_parallel] = calc_turn_angles(np.array(starts)[~is_parallel], intersects[~is_parallel],
+                                                np.array(ends)[~is_parallel])
+
+        return [RoundaboutElement(start_segment.segment_id, target_segment.segment_id, start_segment.end_id,
+                                  angle, target_segment.driving_direction,
+                                  start_segment_start,
+                                  self.node_id_to_latlng[start_segment.end_id],
+                                  end_segment_end,
+                                  start_segment.distance,
+                                  target_segment.distance)
+                for (start_segment, target_segment), angle, start_segment_start, end_segment_end
+                in zip(roundabout_exits, angles.tolist(), starts, ends)]
 
     def __create_u_turn_roundabout(self, start_segment: RoadSegmentElement,
                                    target_segment: RoadSegmentElement) -> RoundaboutElement:
@@ -92,11 +114,13 @@ class RoundaboutUnitsCreator(object):
 def create_roundabout_units(nodes_df: pd.DataFrame,
                             ways_df: pd.DataFrame,
                             roundabouts_df: pd.DataFrame,
-                            road_segments: [RoadSegmentElement]) -> [RoundaboutElement]:
+                            segments_by_start_id: Dict[int, List[RoadSegmentElement]],
+                            segments_by_end_id: Dict[int, List[RoadSegmentElement]]) -> [RoundaboutElement]:
     """ Remove Road Segments within a Roundabout and return Tuple of Roundabout-Turn units and cleaned Road Segments """
 
     start_time = timeit.default_timer()
-    roundabout_unit_creator = RoundaboutUnitsCreator(nodes_df, ways_df, roundabouts_df, road_segments)
+    roundabout_unit_creator = RoundaboutUnitsCreator(nodes_df, ways_df, roundabouts_df, segments_by_start_id,
+                                                     segments_by_end_id)
 
     all_roundabouts = [roundabout_unit_creator.add_roundabout_units(current_roundabout_nodes)
                        for current_roundabout_nodes in roundabout_unit_creator.real_roundabouts]
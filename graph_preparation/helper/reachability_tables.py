@@ -0,0 +1,205 @@
+import hashlib
+import os
+import timeit
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from graph_preparation.database_parameters import MAX_REACHABILITY_DISTANCE
+from graph_preparation.helper.straight_successors import StraightSuccessors
+from utils.network_bundle import BundleData, write_bundle_file, map_bundle_file
+from utils.worker_pool import map_with_shared_state, get_worker_state
+
+"""
+The reachability tables store every path from each segment, that is driven straight through all intersections on it,
+up to a maximum distance. The TurnPairMatcher then finds the matches between turn candidates by a range query on the
+bridged distance instead of exploring the same paths for every trip again. Like the TurnPairMatcher, no path passes an
+intersection twice.
+
+The paths from a segment are the rows offsets[segment_id] to offsets[segment_id + 1], sorted by their distance, i.e.
+the length of all segments of the path after the first one. Each row refers to the row of the path without its last
+segment, so a path is recreated by following these references back to the first segment. The tables are stored in the
+layout of a network bundle, so they are memory mapped on loading.
+"""
+
+######################################################################
+
+REACHABILITY_TABLES_PATH = '/db/reachability.tables'
+
+REACHABILITY_MAGIC = b'DAREACH\x00'
+# increase the version on every change of the layout, so outdated tables are rejected instead of misread
+REACHABILITY_VERSION = 1
+
+OFFSETS_ARRAY = 'offsets'
+LAST_SEGMENTS_ARRAY = 'last_segment_ids'
+DISTANCES_ARRAY = 'distances'
+HEADING_CHANGES_ARRAY = 'heading_changes'
+PREVIOUS_ROWS_ARRAY = 'previous_rows'
+SEARCH_ORDERS_ARRAY = 'search_orders'
+
+
+######################################################################
+
+
+class ReachabilityTables(object):
+    """ All straight travel paths from each segment up to max_distance """
+
+    def __init__(self, offsets: np.ndarray, last_segment_ids: np.ndarray, distances: np.ndarray,
+                 heading_changes: np.ndarray, previous_rows: np.ndarray, search_orders: np.ndarray,
+                 max_distance: float):
+        """
+        :param heading_changes: the heading change of each path without the heading change into its last segment
+        :param previous_rows: row of the path without the last segment, -1 for the path of the first segment only
+        :param search_orders: position of each path among the paths from its segment in a depth-first search
+        """
+        self.offsets = offsets
+        self.last_segment_ids = last_segment_ids
+        self.distances = distances
+        self.heading_changes = heading_changes
+        self.previous_rows = previous_rows
+        self.search_orders = search_orders
+        self.max_distance = max_distance
+
+    def covers(self, segment_id: int, max_path_distance: float) -> bool:
+        """ whether the tables contain all paths from a segment up to max_path_distance """
+        return 0 <= segment_id < len(self.offsets) - 1 and max_path_distance <= self.max_distance
+
+    def find_paths(self, segment_id: int, min_path_distance: float, max_path_distance: float) -> np.ndarray:
+        """
+        Range query for the paths from a segment with min_path_distance < distance <= max_path_distance
+        :return: the rows of the paths in the order of a depth-first search
+        """
+        start, end = int(self.offsets[segment_id]), int(self.offsets[segment_id + 1])
+        distances = self.distances[start:end]
+        rows = np.arange(start + np.searchsorted(distances, min_path_distance, side='right'),
+                         start + np.searchsorted(distances, max_path_distance, side='right'))
+        return rows[np.argsort(self.search_orders[rows], kind='stable')]
+
+    def get_path(self, row: int) -> List[int]:
+        """ the segments of the path of a row, starting with the segment it is reached from """
+        path = []
+        while row >= 0:
+            path.append(int(self.last_segment_ids[row]))
+            row = int(self.previous_rows[row])
+        path.reverse()
+        return path
+
+
+def hash_straight_successors(straight_successors: StraightSuccessors) -> str:
+    """ content hash of the straight successors, that the reachability tables are created from """
+    successors_hash = hashlib.sha256()
+    for array_name, values in sorted(straight_successors.to_arrays().items()):
+        successors_hash.update(array_name.encode('utf-8'))
+        successors_hash.update(values.dtype.str.encode('utf-8'))
+        successors_hash.update(np.ascontiguousarray(values).tobytes())
+    return successors_hash.hexdigest()
+
+
+def __extend_paths(straight_successors: StraightSuccessors, max_distance: float, paths: Tuple[list, list, list, list],
+                   row: int, segment_id: int, distance: float, heading_change: float, passed_intersections: [int]):
+    """ add all straight travel paths continuing the path of a row in the order of a depth-first search """
+    last_segment_ids, distances, heading_changes, previous_rows = paths
+    start, end = straight_successors.get_successor_range(segment_id)
+    for next_target, next_intersection, next_distance, next_heading_change in zip(
+            straight_successors.target_segment_ids[start:end].tolist(),
+            straight_successors.intersection_ids[start:end].tolist(),
+            straight_successors.distances[start:end].tolist(),
+            straight_successors.heading_changes[start:end].tolist()):
+        next_path_distance = distance + next_distance
+        if next_intersection in passed_intersections or next_path_distance > max_distance:
+            continue
+
+        next_row = len(last_segment_ids)
+        last_segment_ids.append(next_target)
+        distances.append(next_path_distance)
+        # like the TurnPairMatcher, the heading change directly before a possible turn isn't part of a path
+        heading_changes.append(heading_change)
+        previous_rows.append(row)
+
+        passed_intersections.append(next_intersection)
+        __extend_paths(straight_successors, max_distance, paths, next_row, next_target, next_path_distance,
+                       heading_change + next_heading_change, passed_intersections)
+        passed_intersections.pop()
+
+
+def __collect_paths(segment_id: int) -> Tuple[list, list, list, list]:
+    """ the paths from a segment with rows relative to the first path, which consists of the segment only """
+    straight_successors, max_distance = get_worker_state()
+    paths = ([segment_id], [0.0], [0.0], [-1])
+    __extend_paths(straight_successors, max_distance, paths, 0, segment_id, 0.0, 0.0, [])
+    return paths
+
+
+def create_reachability_tables(straight_successors: StraightSuccessors, num_segments: int,
+                               max_distance: float = MAX_REACHABILITY_DISTANCE) -> ReachabilityTables:
+    """
+    Explore the straight travel paths from all segments
+    :param num_segments: the tables cover the segment ids 0 to num_segments - 1
+    """
+    start_time = timeit.default_timer()
+    # workers receive the straight successors once, so only segment ids are sent with the tasks
+    all_paths = map_with_shared_state(__collect_paths, range(num_segments), (straight_successors, max_distance))
+
+    lengths = np.array([len(paths[0]) for paths in all_paths], dtype=np.int64)
+    offsets = np.zeros(num_segments + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    block_starts = np.repeat(offsets[:-1], lengths)
+
+    last_segment_ids = np.fromiter((segment_id for paths in all_paths for segment_id in paths[0]),
+                                   dtype=np.int32, count=int(offsets[-1]))
+    distances = np.fromiter((distance for paths in all_paths for distance in paths[1]),
+                            dtype=np.float64, count=int(offsets[-1]))
+    heading_changes = np.fromiter((heading_change for paths in all_paths for heading_change in paths[2]),
+                                  dtype=np.float64, count=int(offsets[-1]))
+    previous_rows = np.fromiter((row for paths in all_paths for row in paths[3]),
+                                dtype=np.int64, count=int(offsets[-1]))
+    previous_rows[previous_rows >= 0] += block_starts[previous_rows >= 0]
+
+    # sort the paths of each segment by distance, the stable sort keeps the depth-first order of equal distances
+    order = np.lexsort((distances, block_starts))
+    new_rows = np.empty_like(order)
+    new_rows[order] = np.arange(len(order))
+    previous_rows = previous_rows[order]
+    previous_rows[previous_rows >= 0] = new_rows[previous_rows[previous_rows >= 0]]
+
+    end_time = timeit.default_timer()
+    print("Created reachability tables with %d paths in %.4f seconds." % (len(order), (end_time - start_time)))
+    return ReachabilityTables(offsets, last_segment_ids[order], distances[order], heading_changes[order],
+                              previous_rows, (order - block_starts[order]).astype(np.int32), max_distance)
+
+
+def write_reachability_tables(file_path: str, reachability_tables: ReachabilityTables,
+                              straight_successors: StraightSuccessors):
+    """ :param straight_successors: the straight successors the tables are created from """
+    data = BundleData()
+    header = {'version': REACHABILITY_VERSION, 'max_distance': reachability_tables.max_distance,
+              'straight_successors_hash': hash_straight_successors(straight_successors), 'arrays': {}}
+    for array_name, values in [(OFFSETS_ARRAY, reachability_tables.offsets),
+                               (LAST_SEGMENTS_ARRAY, reachability_tables.last_segment_ids),
+                               (DISTANCES_ARRAY, reachability_tables.distances),
+                               (HEADING_CHANGES_ARRAY, reachability_tables.heading_changes),
+                               (PREVIOUS_ROWS_ARRAY, reachability_tables.previous_rows),
+                               (SEARCH_ORDERS_ARRAY, reachability_tables.search_orders)]:
+        header['arrays'][array_name] = data.add_array(values)
+    write_bundle_file(file_path, header, data, REACHABILITY_MAGIC, REACHABILITY_VERSION)
+
+
+def load_reachability_tables(file_path: str,
+                             straight_successors: Optional[StraightSuccessors]) -> Optional[ReachabilityTables]:
+    """
+    Memory map the reachability tables of a street network
+    :param straight_successors: the straight successors of the network bundle, e.g. network.straight_successors
+    :return: None, if there are no tables or they were created from other straight successors like an outdated bundle
+    """
+    if straight_successors is None or not os.path.exists(file_path):
+        return None
+
+    header, get_array = map_bundle_file(file_path, REACHABILITY_MAGIC, REACHABILITY_VERSION)
+    if header['straight_successors_hash'] != hash_straight_successors(straight_successors):
+        print("Ignore the reachability tables %s, as they don't belong to the street network." % file_path)
+        return None
+
+    arrays = {array_name: get_array(entry) for array_name, entry in header['arrays'].items()}
+    return ReachabilityTables(arrays[OFFSETS_ARRAY], arrays[LAST_SEGMENTS_ARRAY], arrays[DISTANCES_ARRAY],
+                              arrays[HEADING_CHANGES_ARRAY], arrays[PREVIOUS_ROWS_ARRAY], arrays[SEARCH_ORDERS_ARRAY],
+                              header['max_distance'])
@@ -0,0 +1,44 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from definitions import ALL_ROADS_TIER
+from graph_preparation.database_parameters import ROAD_CLASS_TIERS
+
+######################################################################
+
+ROAD_TIER_COL_NAME = 'road_tier'
+
+HIGHWAY_CLASS_TO_TIER = {highway: tier for tier, highways in ROAD_CLASS_TIERS.items() for highway in highways}
+
+
+######################################################################
+
+
+def get_road_class_tier(highway: Optional[str]) -> int:
+    """ the lowest tier containing the road class; unknown road classes are only part of ALL_ROADS_TIER """
+    return HIGHWAY_CLASS_TO_TIER.get(highway, ALL_ROADS_TIER)
+
+
+def get_major_road_class(highways: [Optional[str]]) -> Optional[str]:
+    """ the road class with the lowest tier, e.g. of all nodes on a road segment """
+    return min(highways, key=get_road_class_tier, default=None)
+
+
+def add_road_tiers_to_turns(turns_df: pd.DataFrame, segment_id_to_tier: dict) -> pd.DataFrame:
+    """ a turn is part of the tier containing both its start and target segment """
+    start_tiers = turns_df['segment_start_id'].map(segment_id_to_tier).fillna(ALL_ROADS_TIER)
+    target_tiers = turns_df['segment_target_id'].map(segment_id_to_tier).fillna(ALL_ROADS_TIER)
+    turns_df[ROAD_TIER_COL_NAME] = np.maximum(start_tiers, target_tiers).astype(int)
+    return turns_df
+
+
+def get_turns_of_tier(turns_df: pd.DataFrame, tier: int) -> pd.DataFrame:
+    """
+    Reduce the turns to the street graph of a tier. The turn ids in the index are kept, so they still refer to the
+    same turns in the full turns_df. A turns_df created without tiers is returned completely.
+    """
+    if tier >= ALL_ROADS_TIER or ROAD_TIER_COL_NAME not in turns_df.columns:
+        return turns_df
+    return turns_df[turns_df[ROAD_TIER_COL_NAME] <= tier]
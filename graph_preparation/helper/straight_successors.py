@@ -0,0 +1,105 @@
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from attack_parameters import STRAIGHT_DRIVE_THRESHOLD
+from definitions import ALL_ROADS_TIER
+from graph_preparation.helper.road_class_tiers import ROAD_TIER_COL_NAME
+
+######################################################################
+
+# columns of the turns, that the straight travel options are created from
+STRAIGHT_SUCCESSOR_USE_COLS = ['segment_start_id', 'segment_target_id', 'intersection_id', 'distance_after',
+                               'heading_change', 'angle', 'is_segment_skipping']
+
+OFFSETS_ARRAY = 'offsets'
+TARGET_SEGMENTS_ARRAY = 'target_segment_ids'
+INTERSECTIONS_ARRAY = 'intersection_ids'
+DISTANCES_ARRAY = 'distances'
+HEADING_CHANGES_ARRAY = 'heading_changes'
+ROAD_TIERS_ARRAY = 'road_tiers'
+
+
+######################################################################
+
+
+class StraightSuccessors(object):
+    """
+    The segments, that can be reached from each segment by driving straight through the next intersection, in
+    compressed sparse row format: the successors of segment_id are at the positions offsets[segment_id] to
+    offsets[segment_id + 1] of the successor arrays, in the order of the turns they are created from.
+    """
+
+    def __init__(self, offsets: np.ndarray, target_segment_ids: np.ndarray, intersection_ids: np.ndarray,
+                 distances: np.ndarray, heading_changes: np.ndarray, road_tiers: np.ndarray):
+        self.offsets = offsets
+        self.target_segment_ids = target_segment_ids
+        self.intersection_ids = intersection_ids
+        self.distances = distances
+        self.heading_changes = heading_changes
+        self.road_tiers = road_tiers
+
+    def get_successor_range(self, segment_id: int) -> Tuple[int, int]:
+        """ positions of the successors of a segment within the successor arrays """
+        if segment_id < 0 or segment_id + 1 >= len(self.offsets):
+            return 0, 0
+        return int(self.offsets[segment_id]), int(self.offsets[segment_id + 1])
+
+    def for_tier(self, tier: int):
+        """ the successors on the reduced street graph of a tier like get_turns_of_tier """
+        if tier >= ALL_ROADS_TIER:
+            return self
+
+        is_in_tier = self.road_tiers <= tier
+        segment_ids = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+        offsets = np.zeros_like(self.offsets)
+        np.cumsum(np.bincount(segment_ids[is_in_tier], minlength=len(self.offsets) - 1), out=offsets[1:])
+        return StraightSuccessors(offsets, self.target_segment_ids[is_in_tier], self.intersection_ids[is_in_tier],
+                                  self.distances[is_in_tier], self.heading_changes[is_in_tier],
+                                  self.road_tiers[is_in_tier])
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {OFFSETS_ARRAY: self.offsets, TARGET_SEGMENTS_ARRAY: self.target_segment_ids,
+                INTERSECTIONS_ARRAY: self.intersection_ids, DISTANCES_ARRAY: self.distances,
+                HEADING_CHANGES_ARRAY: self.heading_changes, ROAD_TIERS_ARRAY: self.road_tiers}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]):
+        return cls(arrays[OFFSETS_ARRAY], arrays[TARGET_SEGMENTS_ARRAY], arrays[INTERSECTIONS_ARRAY],
+                   arrays[DISTANCES_ARRAY], arrays[HEADING_CHANGES_ARRAY], arrays[ROAD_TIERS_ARRAY])
+
+
+def has_straight_successor_columns(turns_df: pd.DataFrame) -> bool:
+    return all(column in turns_df.columns for column in STRAIGHT_SUCCESSOR_USE_COLS)
+
+
+def create_straight_successors(turns_df: pd.DataFrame,
+                               straight_drive_threshold: float = STRAIGHT_DRIVE_THRESHOLD) -> StraightSuccessors:
+    """
+    Create the straight travel options of all segments: the turns within the "straight driving" threshold, except
+    segment skipping units, as these don't provide additional info about paths
+    """
+    travel_options = turns_df[(turns_df['angle'] > -straight_drive_threshold) &
+                              (turns_df['angle'] < straight_drive_threshold) &
+                              (~turns_df['is_segment_skipping'].astype(bool))]
+
+    # the arrays are indexed by segment ids, so they don't depend on the dtypes of the turns_df
+    start_segment_ids = travel_options['segment_start_id'].to_numpy(dtype=np.int64)
+    # a stable sort keeps the order of the turns_df for travel options from the same segment
+    order = np.argsort(start_segment_ids, kind='stable')
+    num_segments = int(turns_df['segment_start_id'].max()) + 1 if len(turns_df) else 0
+    offsets = np.zeros(num_segments + 1, dtype=np.int64)
+    np.cumsum(np.bincount(start_segment_ids, minlength=num_segments), out=offsets[1:])
+
+    if ROAD_TIER_COL_NAME in travel_options.columns:
+        road_tiers = travel_options[ROAD_TIER_COL_NAME].to_numpy(dtype=np.int8)[order]
+    else:
+        road_tiers = np.full(len(travel_options), ALL_ROADS_TIER, dtype=np.int8)
+
+    return StraightSuccessors(offsets,
+                              travel_options['segment_target_id'].to_numpy(dtype=np.int64)[order],
+                              travel_options['intersection_id'].to_numpy(dtype=np.int64)[order],
+                              travel_options['distance_after'].to_numpy()[order],
+                              travel_options['heading_change'].to_numpy()[order],
+                              road_tiers)
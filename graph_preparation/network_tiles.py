@@ -0,0 +1,166 @@
+import json
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from definitions import NODE_ID_COL_NAME, OSM_ID_COL_NAME, LAT_COL_NAME, LNG_COL_NAME
+from utils.distance_helper import get_degree_margins
+from utils.network_bundle import NetworkBundle
+
+log = logging.getLogger(__name__)
+
+######################################################################
+
+# columns, that identify a turn across tiles after mapping its ids to the stitched network
+STITCHED_TURN_KEY_COLUMNS = ['segment_start_id', 'segment_target_id', 'intersection_id', 'is_roundabout',
+                             'is_segment_skipping']
+
+
+######################################################################
+
+
+class TileGrid(object):
+    """
+    Splits the bounding box of an area into rows x cols tiles. Every tile owns the nodes within its core, so each
+    intersection and its turns belong to exactly one tile. A tile is built from the osm data within its core extended
+    by the overlap margin, so segments and turns starting in its core are complete, if they are shorter than the margin.
+    """
+
+    def __init__(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float, rows: int, cols: int,
+                 overlap_margin: float):
+        """
+        :param overlap_margin: margin around the core of a tile in meters
+        """
+        if rows < 1 or cols < 1 or min_lat >= max_lat or min_lng >= max_lng:
+            raise Exception("Invalid tile grid with %d x %d tiles over (%f, %f, %f, %f)."
+                            % (rows, cols, min_lat, min_lng, max_lat, max_lng))
+        self.min_lat, self.min_lng, self.max_lat, self.max_lng = min_lat, min_lng, max_lat, max_lng
+        self.rows, self.cols = rows, cols
+        self.overlap_margin = overlap_margin
+
+        self.tile_height = (max_lat - min_lat) / rows
+        self.tile_width = (max_lng - min_lng) / cols
+
+    @property
+    def tile_count(self) -> int:
+        return self.rows * self.cols
+
+    def get_tile_bbox(self, tile_index: int, with_margin: bool = True) -> Tuple[float, float, float, float]:
+        """ (min_lat, min_lng, max_lat, max_lng) of the core of a tile or of the area to parse for it """
+        row, col = divmod(tile_index, self.cols)
+        min_lat = self.min_lat + row * self.tile_height
+        min_lng = self.min_lng + col * self.tile_width
+        max_lat, max_lng = min_lat + self.tile_height, min_lng + self.tile_width
+        if not with_margin:
+            return min_lat, min_lng, max_lat, max_lng
+
+        margin_lat, margin_lng = get_degree_margins(min_lat, max_lat, self.overlap_margin)
+        return min_lat - margin_lat, min_lng - margin_lng, max_lat + margin_lat, max_lng + margin_lng
+
+    def get_owner_tiles(self, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+        """ index of the tile, whose core contains a position; positions outside the grid belong to the nearest tile """
+        rows = np.clip(np.floor((np.asarray(lats) - self.min_lat) / self.tile_height), 0, self.rows - 1)
+        cols = np.clip(np.floor((np.asarray(lngs) - self.min_lng) / self.tile_width), 0, self.cols - 1)
+        return (rows * self.cols + cols).astype(np.int64)
+
+    def to_dict(self) -> dict:
+        return {'min_lat': self.min_lat, 'min_lng': self.min_lng, 'max_lat': self.max_lat, 'max_lng': self.max_lng,
+                'rows': self.rows, 'cols': self.cols, 'overlap_margin': self.overlap_margin}
+
+    def store(self, file_path: str):
+        with open(file_path, 'w') as grid_file:
+            json.dump(self.to_dict(), grid_file)
+
+    @classmethod
+    def load(cls, file_path: str):
+        with open(file_path) as grid_file:
+            return cls(**json.load(grid_file))
+
+
+def __get_owned_mask(tile_grid: TileGrid, tile_index: int, lats: pd.Series, lngs: pd.Series) -> np.ndarray:
+    return tile_grid.get_owner_tiles(lats.to_numpy(), lngs.to_numpy()) == tile_index
+
+
+def __stitch_nodes(tile_grid: TileGrid, tile_bundles: List[NetworkBundle]) -> pd.DataFrame:
+    """ unite the nodes of all tiles by their osm id, preferring the node of the tile owning it """
+    tile_nodes = []
+    for tile_index, bundle in enumerate(tile_bundles):
+        nodes_df = bundle.nodes_df.copy()
+        nodes_df['is_owned'] = __get_owned_mask(tile_grid, tile_index, nodes_df[LAT_COL_NAME], nodes_df[LNG_COL_NAME])
+        tile_nodes.append(nodes_df)
+
+    nodes_df = pd.concat(tile_nodes, ignore_index=True)
+    nodes_df = nodes_df.sort_values('is_owned', ascending=False, kind='stable') \
+        .drop_duplicates(OSM_ID_COL_NAME).sort_index().drop(columns='is_owned')
+    nodes_df[NODE_ID_COL_NAME] = np.arange(len(nodes_df))
+    return nodes_df.reset_index(drop=True)
+
+
+def stitch_tiles(tile_grid: TileGrid, tile_bundles: List[NetworkBundle]) \
+        -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, Dict[int, List[int]]]:
+    """
+    Stitch the networks of all tiles to a single network. Segments are taken from the tile owning their start and turns
+    from the tile owning their intersection, so duplicates from the overlap of tiles are dropped. Segments of different
+    tiles are matched by their osm node path, and all node, segment and turn ids are assigned anew.
+    :param tile_bundles: the network bundle of each tile in the order of the tile indices
+    :return: turns_df, segments_df, nodes_df and segment_to_osm_ids of the stitched network
+    """
+    nodes_df = __stitch_nodes(tile_grid, tile_bundles)
+    osm_id_to_node_id = pd.Series(nodes_df[NODE_ID_COL_NAME].to_numpy(), index=nodes_df[OSM_ID_COL_NAME].to_numpy())
+
+    # 1. assign global segment ids to the segments owned by each tile
+    osm_path_to_segment_id, tile_segments = {}, []
+    for tile_index, bundle in enumerate(tile_bundles):
+        segments_df = bundle.segments_df
+        start_positions = bundle.nodes_df.set_index(NODE_ID_COL_NAME).loc[segments_df['start_id'],
+                                                                          [LAT_COL_NAME, LNG_COL_NAME]]
+        is_owned = __get_owned_mask(tile_grid, tile_index, start_positions[LAT_COL_NAME],
+                                    start_positions[LNG_COL_NAME])
+
+        owned_segment_ids = []
+        for segment_id in segments_df.index[is_owned].tolist():
+            osm_path = tuple(bundle.segment_to_osm_ids[segment_id])
+            if osm_path not in osm_path_to_segment_id:
+                osm_path_to_segment_id[osm_path] = len(osm_path_to_segment_id)
+                owned_segment_ids.append(segment_id)
+        tile_segments.append(segments_df.loc[owned_segment_ids])
+
+    # 2. map the local segment ids of each tile to the global ones by the osm node path
+    tile_turns, segments = [], []
+    for tile_index, bundle in enumerate(tile_bundles):
+        local_to_global_segment_id = pd.Series(
+            [osm_path_to_segment_id.get(tuple(bundle.segment_to_osm_ids[segment_id]), -1)
+             for segment_id in bundle.segments_df.index.tolist()], index=bundle.segments_df.index, dtype=np.int64)
+        local_to_osm_id = pd.Series(bundle.nodes_df[OSM_ID_COL_NAME].to_numpy(),
+                                    index=bundle.nodes_df[NODE_ID_COL_NAME].to_numpy())
+
+        segments_df = tile_segments[tile_index].copy()
+        segments_df.index = local_to_global_segment_id.loc[segments_df.index].to_numpy()
+        for column in ['start_id', 'end_id']:
+            segments_df[column] = osm_id_to_node_id.loc[local_to_osm_id.loc[segments_df[column]]].to_numpy()
+        segments.append(segments_df)
+
+        turns_df = bundle.turns_df[__get_owned_mask(tile_grid, tile_index, bundle.turns_df['intersection_lat'],
+                                                    bundle.turns_df['intersection_lng'])].copy()
+        for column in ['segment_start_id', 'segment_target_id']:
+            turns_df[column] = local_to_global_segment_id.loc[turns_df[column]].to_numpy()
+        turns_df['intersection_id'] = osm_id_to_node_id.loc[local_to_osm_id.loc[turns_df['intersection_id']]] \
+            .to_numpy()
+
+        # a turn referring to a segment, that isn't complete in the tile owning its start, can't be stitched
+        is_unmatched = (turns_df['segment_start_id'] == -1) | (turns_df['segment_target_id'] == -1)
+        if is_unmatched.any():
+            log.warning("Dropped %d turns of tile %d, whose segments are incomplete in the neighbouring tile. "
+                        "Consider a larger overlap margin." % (is_unmatched.sum(), tile_index))
+        tile_turns.append(turns_df[~is_unmatched])
+
+    segments_df = pd.concat(segments).sort_index()
+    segments_df.index.name = 'segment_id'
+    turns_df = pd.concat(tile_turns, ignore_index=True).drop_duplicates(STITCHED_TURN_KEY_COLUMNS, ignore_index=True)
+    segment_to_osm_ids = {segment_id: list(osm_path) for osm_path, segment_id in osm_path_to_segment_id.items()}
+
+    print("Stitched %d tiles to %d turns, %d road segments and %d nodes."
+          % (len(tile_bundles), len(turns_df), len(segments_df), len(nodes_df)))
+    return turns_df, segments_df, nodes_df, segment_to_osm_ids
@@ -0,0 +1,201 @@
+import itertools
+from collections import Counter
+from typing import List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from definitions import NODE_ID_COL_NAME, OSM_ID_COL_NAME, LAT_COL_NAME, LNG_COL_NAME, LABEL_COL_NAME, INTERSECTION, \
+    START_ID_COL_NAME, END_ID_COL_NAME, SPEED_LIMIT_COL_NAME, AGGREGATED_DISTANCE_COL_NAME, HIGHWAY_COL_NAME
+from graph_preparation.create_turns_database import create_turns_at_intersections
+from graph_preparation.helper.connections_between_intersections import create_connections_between_intersections
+from graph_preparation.helper.create_road_segments import create_all_road_segments
+from graph_preparation.schema.RoadElements import IntersectionConnectionElement, RoadSegmentElement
+
+"""
+Update a street network with the changes of osm change files (.osc) instead of building it anew. The csv files of the
+updated osm file are compared to the ones of the previous build to find the dirty nodes, i.e. nodes that were added,
+removed, moved, got or lost a traffic light, became an intersection or had one of their ways changed. Only the
+connections, road segments and turns touching dirty nodes are created anew, while all others are kept with their ids.
+"""
+
+######################################################################
+
+# ways, nodes, traffic lights and roundabouts of a street network
+CsvFiles = Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]
+
+# columns of the ways, that connections between intersections are created from
+CONNECTION_WAY_COLUMNS = [START_ID_COL_NAME, END_ID_COL_NAME, SPEED_LIMIT_COL_NAME, AGGREGATED_DISTANCE_COL_NAME,
+                          HIGHWAY_COL_NAME]
+# position of a way among the ways leading from the same node, as connections follow the first matching way
+WAY_RANK_COL_NAME = 'way_rank'
+
+NODE_COLUMNS = [NODE_ID_COL_NAME, LAT_COL_NAME, LNG_COL_NAME, LABEL_COL_NAME]
+
+
+######################################################################
+
+
+def assign_stable_node_ids(previous_nodes_df: pd.DataFrame, csv_files: CsvFiles) -> CsvFiles:
+    """
+    Replace the node ids of newly parsed csv files, which are positions of the sorted osm ids, by the node ids of the
+    previous build, so the ids of all nodes, that still exist, stay stable. New nodes get ids beyond the previous ones.
+    """
+    ways_df, nodes_df, traffic_lights_df, roundabouts_df = csv_files
+
+    previous_node_ids = pd.Series(previous_nodes_df[NODE_ID_COL_NAME].to_numpy(),
+                                  index=previous_nodes_df[OSM_ID_COL_NAME].to_numpy())
+    stable_node_ids = np.array(previous_node_ids.reindex(nodes_df[OSM_ID_COL_NAME].to_numpy()), dtype=np.float64)
+    is_new_node = np.isnan(stable_node_ids)
+    next_node_id = previous_nodes_df[NODE_ID_COL_NAME].max() + 1 if len(previous_nodes_df) else 0
+    stable_node_ids[is_new_node] = next_node_id + np.arange(is_new_node.sum())
+    stable_node_ids = stable_node_ids.astype(np.int64)
+
+    parsed_to_stable_id = np.zeros(nodes_df[NODE_ID_COL_NAME].max() + 1, dtype=np.int64)
+    parsed_to_stable_id[nodes_df[NODE_ID_COL_NAME].to_numpy()] = stable_node_ids
+
+    nodes_df = nodes_df.assign(**{NODE_ID_COL_NAME: stable_node_ids}) \
+        .sort_values(NODE_ID_COL_NAME, ignore_index=True)
+    ways_df = ways_df.assign(**{START_ID_COL_NAME: parsed_to_stable_id[ways_df[START_ID_COL_NAME].to_numpy()],
+                                END_ID_COL_NAME: parsed_to_stable_id[ways_df[END_ID_COL_NAME].to_numpy()]})
+    return ways_df, nodes_df, traffic_lights_df, roundabouts_df
+
+
+def __get_changed_rows(previous_df: pd.DataFrame, current_df: pd.DataFrame) -> pd.DataFrame:
+    """ rows, that are only part of one of both data frames """
+    rows = previous_df.merge(current_df, how='outer', indicator=True)
+    return rows[rows['_merge'] != 'both']
+
+
+def __get_connection_ways(ways_df: pd.DataFrame, roundabouts_df: pd.DataFrame) -> pd.DataFrame:
+    """ the ways, that connections follow, in the order the connections follow them like the adjacency of ways """
+    ways_df = ways_df[~ways_df[OSM_ID_COL_NAME].isin(roundabouts_df[OSM_ID_COL_NAME].unique())]
+    ways_df = ways_df[CONNECTION_WAY_COLUMNS].copy()
+    ways_df[WAY_RANK_COL_NAME] = ways_df.groupby(START_ID_COL_NAME).cumcount()
+    return ways_df
+
+
+def __get_traffic_light_nodes(nodes_df: pd.DataFrame, traffic_lights_df: pd.DataFrame) -> Set[int]:
+    return set(nodes_df.merge(traffic_lights_df, how='inner', on=OSM_ID_COL_NAME)[NODE_ID_COL_NAME].tolist())
+
+
+def find_dirty_nodes(previous_csv_files: CsvFiles, csv_files: CsvFiles) -> Set[int]:
+    """ all nodes, whose connections, road segments and turns have to be created anew after an update """
+    previous_ways_df, previous_nodes_df, previous_traffic_lights_df, previous_roundabouts_df = previous_csv_files
+    ways_df, nodes_df, traffic_lights_df, roundabouts_df = csv_files
+
+    # 1. nodes, that were added, removed, moved or became an intersection or a connection
+    changed_nodes = __get_changed_rows(previous_nodes_df[NODE_COLUMNS], nodes_df[NODE_COLUMNS])
+    dirty_nodes = set(changed_nodes[NODE_ID_COL_NAME].tolist())
+
+    # 2. nodes, that got or lost a traffic light
+    dirty_nodes.update(__get_traffic_light_nodes(previous_nodes_df, previous_traffic_lights_df) ^
+                       __get_traffic_light_nodes(nodes_df, traffic_lights_df))
+
+    # 3. both ends of ways, that were added, removed, changed or reordered
+    changed_ways = __get_changed_rows(__get_connection_ways(previous_ways_df, previous_roundabouts_df),
+                                      __get_connection_ways(ways_df, roundabouts_df))
+    dirty_nodes.update(changed_ways[START_ID_COL_NAME].tolist())
+    dirty_nodes.update(changed_ways[END_ID_COL_NAME].tolist())
+
+    print("Found %d dirty nodes." % len(dirty_nodes))
+    return dirty_nodes
+
+
+def __get_intersections(nodes_df: pd.DataFrame) -> Set[int]:
+    return set(nodes_df.loc[nodes_df[LABEL_COL_NAME] == INTERSECTION, NODE_ID_COL_NAME].tolist())
+
+
+def get_connection_origin(connection: IntersectionConnectionElement, intersections: Set[int]) -> int:
+    """ the intersection, whose connections contain the connection; a connection from a dead-end is found at its end """
+    return connection.start_id if connection.start_id in intersections else connection.end_id
+
+
+def update_connections(previous_connections: [IntersectionConnectionElement], previous_nodes_df: pd.DataFrame,
+                       csv_files: CsvFiles, dirty_nodes: Set[int]) \
+        -> Tuple[List[IntersectionConnectionElement], List[IntersectionConnectionElement],
+                 List[IntersectionConnectionElement]]:
+    """
+    Create the connections of all intersections anew, whose previous connections pass a dirty node, as well as of all
+    dirty intersections. The connections of all other intersections are kept, as following the ways from them still
+    leads along the same nodes.
+    :return: the connections of the updated network, the replaced previous connections and the created connections
+    """
+    previous_intersections = __get_intersections(previous_nodes_df)
+    intersections = __get_intersections(csv_files[1])
+
+    dirty_origins = dirty_nodes & intersections
+    for connection in previous_connections:
+        if any(node.node_id in dirty_nodes for node in connection.nodes_on_connection):
+            dirty_origins.add(get_connection_origin(connection, previous_intersections))
+
+    kept_connections, replaced_connections = [], []
+    for connection in previous_connections:
+        if get_connection_origin(connection, previous_intersections) in dirty_origins:
+            replaced_connections.append(connection)
+        else:
+            kept_connections.append(connection)
+
+    created_connections = create_connections_between_intersections(*csv_files,
+                                                                   intersection_ids=dirty_origins & intersections)
+    return kept_connections + created_connections, replaced_connections, created_connections
+
+
+def __get_segment_signature(road_segment: RoadSegmentElement) -> tuple:
+    """ everything a road segment is created from, so segments with the same signature are identical """
+    return tuple((node.node_id, node.distance, node.position, node.is_traffic_light, node.speed_limit, node.highway)
+                 for node in road_segment.nodes_on_segment)
+
+
+def update_road_segments(previous_road_segments: [RoadSegmentElement],
+                         replaced_connections: [IntersectionConnectionElement],
+                         created_connections: [IntersectionConnectionElement]) \
+        -> Tuple[List[RoadSegmentElement], Set[int]]:
+    """
+    Replace the road segments of the replaced connections by the road segments of the created connections. A created
+    road segment keeps the id of an identical replaced one, all others get ids beyond the previous ones.
+    :return: the road segments of the updated network and the intersections, whose incident road segments changed
+    """
+    # the replaced road segments are created anew from the replaced connections to find them by their signature
+    replaced_signatures = Counter(__get_segment_signature(road_segment)
+                                  for road_segment in create_all_road_segments(replaced_connections))
+
+    kept_road_segments, replaced_road_segments = [], {}
+    for road_segment in previous_road_segments:
+        signature = __get_segment_signature(road_segment)
+        if replaced_signatures[signature] > 0:
+            replaced_signatures[signature] -= 1
+            replaced_road_segments.setdefault(signature, []).append(road_segment)
+        else:
+            kept_road_segments.append(road_segment)
+
+    created_road_segments = create_all_road_segments(created_connections)
+    # created road segments, that aren't identical to a replaced one, get ids beyond the ids of all previous ones
+    next_segment_id = max([road_segment.segment_id for road_segment in previous_road_segments], default=-1) + 1
+
+    new_road_segments = []
+    for road_segment in created_road_segments:
+        identical_segments = replaced_road_segments.get(__get_segment_signature(road_segment))
+        if identical_segments:
+            road_segment.segment_id = identical_segments.pop().segment_id
+        else:
+            new_road_segments.append(road_segment)
+    for segment_id, road_segment in zip(itertools.count(next_segment_id), new_road_segments):
+        road_segment.segment_id = segment_id
+    removed_road_segments = [road_segment for road_segments in replaced_road_segments.values()
+                             for road_segment in road_segments]
+
+    changed_road_segments = new_road_segments + removed_road_segments
+    changed_intersections = set([road_segment.start_id for road_segment in changed_road_segments] +
+                                [road_segment.end_id for road_segment in changed_road_segments])
+    print("Removed %d road segments and added %d road segments." % (len(removed_road_segments),
+                                                                    len(new_road_segments)))
+    return kept_road_segments + created_road_segments, changed_intersections
+
+
+def update_turns(previous_turns_df: pd.DataFrame, road_segments: [RoadSegmentElement], nodes_df: pd.DataFrame,
+                 changed_intersections: Set[int]) -> pd.DataFrame:
+    """ Create the turns at all intersections with changed road segments anew and keep all other turns """
+    kept_turns_df = previous_turns_df[~previous_turns_df['intersection_id'].isin(changed_intersections)]
+    created_turns_df = create_turns_at_intersections(road_segments, nodes_df, intersection_ids=changed_intersections)
+    return pd.concat([kept_turns_df, created_turns_df], ignore_index=True)
@@ -1,12 +1,15 @@
-import itertools
-from typing import Tuple, List
+from typing import Tuple, List, Optional
+
+from graph_preparation.helper.road_class_tiers import get_major_road_class, get_road_class_tier
 
 
 class NodeOnIntersectionConnectionElement(object):
     def __init__(self, node_id: int, speed_limit: int, distance: float, position: Tuple[float, float],
-                 is_traffic_light: bool):
+                 is_traffic_light: bool, highway: Optional[str] = None):
         self.node_id = node_id
         self.speed_limit = speed_limit
+        # road class of the way leading to this node
+        self.highway = highway
         # distance is between last node and this node on a connection between intersections
         self.distance = distance
         self.position = position
@@ -23,9 +26,6 @@ class IntersectionConnectionElement(object):
 
 
 class RoadSegmentElement(object):
-    # store the next id to assign a road segment
-    id_iterator = itertools.count()
-
     def __init__(self, start_id: int, end_id: int, distance: float, driving_direction: int, road_curvature: float,
                  nodes_on_segment: List[NodeOnIntersectionConnectionElement], distance_to_traffic_light: float):
         self.start_id = start_id
@@ -42,11 +42,13 @@ class RoadSegmentElement(object):
             self.speed_limit = min([node.speed_limit for node in self.nodes_on_segment if node.speed_limit != -1])
         except (ValueError, TypeError):
             self.speed_limit = 0
+        self.highway = get_major_road_class([node.highway for node in self.nodes_on_segment])
+        self.road_tier = get_road_class_tier(self.highway)
 
     # noinspection PyAttributeOutsideInit
-    def assign_id(self):
+    def assign_id(self, segment_id: int):
         """ Assignment after initializing all road segments needed due to multiprocessing """
-        self.segment_id = next(RoadSegmentElement.id_iterator)
+        self.segment_id = segment_id
 
     def to_dict(self):
         return {
@@ -58,6 +60,8 @@ class RoadSegmentElement(object):
             'driving_direction': self.driving_direction,
             'distance_to_traffic_light': self.distance_to_traffic_light,
             'speed_limit': self.speed_limit,
+            'highway': self.highway,
+            'road_tier': self.road_tier,
             'first_node_after_start': self.first_node_after_start,
             'last_node_before_end': self.last_node_before_end
         }
@@ -0,0 +1,167 @@
+import json
+import os
+import re
+
+import numpy as np
+
+###########################################################################
+GEOJSON_POLYGON = 'Polygon'
+GEOJSON_MULTIPOLYGON = 'MultiPolygon'
+GEOJSON_FEATURE = 'Feature'
+GEOJSON_FEATURE_COLLECTION = 'FeatureCollection'
+
+WKT_POLYGON = 'POLYGON'
+WKT_MULTIPOLYGON = 'MULTIPOLYGON'
+WKT_COORDINATE_PAIR = re.compile(r'(-?[\d.]+(?:[eE][-+]?\d+)?)\s+(-?[\d.]+(?:[eE][-+]?\d+)?)')
+
+
+###########################################################################
+
+
+class ClipArea(object):
+    """
+    Area of interest, that the osm handlers clip the street network to while parsing. The area consists of one or
+    more polygons with optional holes, given in (lng, lat) order like in GeoJSON and WKT.
+
+    Ways crossing the border are kept as a whole by default, so streets leaving the area don't end abruptly at the
+    first node outside. With cut_crossing_ways, crossing ways are cut after the first node outside the area instead,
+    which keeps the network strictly to the area while every street still leaves it by one road piece.
+    """
+
+    def __init__(self, polygons, cut_crossing_ways=False):
+        """
+        :param polygons: list of polygons, each a list of rings with (lng, lat) pairs; the first ring is the exterior,
+        the remaining rings are holes
+        :param cut_crossing_ways: cut ways at the border instead of keeping them completely
+        """
+        if not polygons:
+            raise Exception("A clip area needs at least one polygon.")
+
+        self._polygons = []
+        for polygon in polygons:
+            rings = [np.asarray(ring, dtype=np.float64).reshape(-1, 2) for ring in polygon]
+            if not rings or any(len(ring) < 3 for ring in rings):
+                raise Exception("Every ring of a clip area polygon needs at least three coordinates.")
+            exterior = rings[0]
+            bounds = (exterior[:, 1].min(), exterior[:, 0].min(), exterior[:, 1].max(), exterior[:, 0].max())
+            self._polygons.append((bounds, rings))
+
+        self.cut_crossing_ways = cut_crossing_ways
+
+    def __repr__(self):
+        polygons = [[ring.tolist() for ring in rings] for _, rings in self._polygons]
+        return "ClipArea(%r, cut_crossing_ways=%r)" % (polygons, self.cut_crossing_ways)
+
+    @classmethod
+    def from_bbox(cls, min_lat, min_lng, max_lat, max_lng, cut_crossing_ways=False):
+        ring = [(min_lng, min_lat), (max_lng, min_lat), (max_lng, max_lat), (min_lng, max_lat), (min_lng, min_lat)]
+        return cls([[ring]], cut_crossing_ways)
+
+    @classmethod
+    def from_geojson(cls, geojson, cut_crossing_ways=False):
+        """
+        :param geojson: a (Multi)Polygon, Feature or FeatureCollection; either as dict, json string or file path
+        """
+        if isinstance(geojson, str):
+            if os.path.isfile(geojson):
+                with open(geojson, encoding='utf-8') as geojson_file:
+                    geojson = json.load(geojson_file)
+            else:
+                geojson = json.loads(geojson)
+
+        return cls(get_geojson_polygons(geojson), cut_crossing_ways)
+
+    @classmethod
+    def from_wkt(cls, wkt, cut_crossing_ways=False):
+        """
+        :param wkt: a POLYGON or MULTIPOLYGON in well-known text
+        """
+        geometry_type, _, body = wkt.strip().partition('(')
+        geometry_type = geometry_type.strip().upper()
+        # rewrite the nested coordinate lists to json, as they share the same structure with GeoJSON coordinates
+        body = WKT_COORDINATE_PAIR.sub(r'[\1,\2]', '(' + body)
+        coordinates = json.loads(body.replace('(', '[').replace(')', ']'))
+
+        if geometry_type == WKT_POLYGON:
+            return cls([coordinates], cut_crossing_ways)
+        elif geometry_type == WKT_MULTIPOLYGON:
+            return cls(coordinates, cut_crossing_ways)
+        else:
+            raise Exception("Invalid WKT geometry %s provided. Only %s and %s are supported."
+                            % (geometry_type, WKT_POLYGON, WKT_MULTIPOLYGON))
+
+    def contains(self, lats, lngs):
+        """ Check for every coordinate, if it lies within the area """
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        is_inside = np.zeros(lats.shape, dtype=bool)
+
+        for (min_lat, min_lng, max_lat, max_lng), rings in self._polygons:
+            candidates = np.flatnonzero(~is_inside & (lats >= min_lat) & (lats <= max_lat) &
+                                        (lngs >= min_lng) & (lngs <= max_lng))
+            if len(candidates):
+                is_inside[candidates] = is_inside_rings(lats[candidates], lngs[candidates], rings)
+
+        return is_inside
+
+    def get_bbox(self):
+        """ (min_lat, min_lng, max_lat, max_lng) of all polygons """
+        bounds = np.array([polygon_bounds for polygon_bounds, _ in self._polygons])
+        return float(bounds[:, 0].min()), float(bounds[:, 1].min()), float(bounds[:, 2].max()), \
+            float(bounds[:, 3].max())
+
+    def clip_way(self, coordinates):
+        """
+        Clip the (lat, lng) coordinates of a way's nodes to the area
+        :return: list of (start, end) index ranges of the way's nodes, that are kept; each range has at least 2 nodes
+        """
+        is_inside = self.contains(coordinates[:, 0], coordinates[:, 1])
+        if not is_inside.any():
+            return []
+        if not self.cut_crossing_ways or is_inside.all():
+            return [(0, len(coordinates))]
+
+        # keep every road piece between two nodes with at least one of them inside, so each border crossing ends
+        # at the first node outside
+        is_piece_kept = is_inside[:-1] | is_inside[1:]
+        borders = np.diff(np.concatenate([[0], is_piece_kept.view(np.int8), [0]]))
+        starts, ends = np.flatnonzero(borders == 1), np.flatnonzero(borders == -1)
+        return [(start, end + 1) for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+def get_geojson_polygons(geojson):
+    geometry_type = geojson.get('type')
+
+    if geometry_type == GEOJSON_FEATURE_COLLECTION:
+        return [polygon for feature in geojson['features'] for polygon in get_geojson_polygons(feature)]
+    elif geometry_type == GEOJSON_FEATURE:
+        return get_geojson_polygons(geojson['geometry'])
+    elif geometry_type == GEOJSON_POLYGON:
+        return [geojson['coordinates']]
+    elif geometry_type == GEOJSON_MULTIPOLYGON:
+        return geojson['coordinates']
+    else:
+        raise Exception("Invalid GeoJSON geometry %s provided. Only %s and %s are supported."
+                        % (geometry_type, GEOJSON_POLYGON, GEOJSON_MULTIPOLYGON))
+
+
+def is_inside_rings(lats, lngs, rings):
+    """
+    Even-odd ray casting of all coordinates against all edges of a polygon at once. Holes are handled implicitly,
+    as a coordinate within a hole crosses the edges of the exterior and of the hole.
+    """
+    is_inside = np.zeros(lats.shape, dtype=bool)
+
+    for ring in rings:
+        lng_start, lat_start = ring[:, 0], ring[:, 1]
+        lng_end, lat_end = np.roll(lng_start, -1), np.roll(lat_start, -1)
+
+        # edges, that are crossed by a ray from the coordinate towards increasing longitudes
+        is_spanning = (lat_start[None, :] > lats[:, None]) != (lat_end[None, :] > lats[:, None])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing_lngs = lng_start + (lats[:, None] - lat_start) * (lng_end - lng_start) / (lat_end - lat_start)
+        is_crossed = is_spanning & (lngs[:, None] < crossing_lngs)
+
+        is_inside ^= (np.count_nonzero(is_crossed, axis=1) % 2).astype(bool)
+
+    return is_inside
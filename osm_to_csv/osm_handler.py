@@ -1,11 +1,14 @@
 import csv
 import os
+import tempfile
 
+import numpy as np
 import osmium
 from tqdm import tqdm
 
 from osm_to_csv import osm_helper
-from osm_to_csv.osm_properties import TrafficLight, Way, Node, Location, Roundabout, RoadWork
+from osm_to_csv.osm_properties import TrafficLight, Way, Location, Roundabout, RoadWork
+from utils.distance_helper import VINCENTY, calc_distances
 
 ###########################################################################
 WAYS_CSV_NAME = 'ways.csv'
@@ -13,6 +16,30 @@ WAYS_TYPE_NAME = 'LEADS_TO'
 NODES_CSV_NAME = 'nodes.csv'
 WAY_PROGRESS = 500
 
+WAYS_CSV_HEADER = [':START_ID', ':END_ID', ':TYPE', 'distance:string', 'aggregated_distance:double', 'name:string',
+                   'type:string', 'speedlimit:int', 'osm_id:string', 'highway:string']
+NODES_CSV_HEADER = ['node_id:ID', 'osm_id:string', ':LABEL', 'lat:float', 'lng:float']
+# traffic lights are numbered independently of the nodes, so their ids are a separate id space in a Neo4j import
+TRAFFIC_LIGHTS_CSV_HEADER = ['traffic_light_id:ID(TrafficLight)', 'osm_id:string', ':LABEL', 'lat:float', 'lng:float']
+
+# number of ways buffered in streaming mode, before their lengths are calculated and they are written to disk
+STREAMING_WAY_BATCH_SIZE = 10000
+# number of node references collected by the NodeMonitor, before they are merged into its sorted arrays
+NODE_REFERENCE_CHUNK_SIZE = 5000000
+# reference counts are stored compactly and saturate at this value, as only counts > 1 are relevant
+MAX_NODE_REFERENCE_COUNT = np.iinfo(np.uint16).max
+
+# osmium index types to store node locations, that are needed to resolve the nodes of ways
+# in-memory indices; SPARSE_MEM_ARRAY fits small and regional extracts
+SPARSE_MEM_ARRAY = 'sparse_mem_array'
+FLEX_MEM = 'flex_mem'
+# file-backed indices keep node locations out of the RAM; SPARSE_FILE_ARRAY fits regional extracts, while
+# DENSE_FILE_ARRAY fits country-sized extracts, where most node ids up to the maximum id are used
+SPARSE_FILE_ARRAY = 'sparse_file_array'
+DENSE_FILE_ARRAY = 'dense_file_array'
+FILE_BACKED_LOCATION_INDICES = [SPARSE_FILE_ARRAY, DENSE_FILE_ARRAY]
+DEFAULT_LOCATION_INDEX = SPARSE_MEM_ARRAY
+
 TRAFFIC_LIGHT_CSV_NAME = 'traffic_lights.csv'
 
 NODE_TRAFFIC_LIGHT_TAG_KEY = 'highway'
@@ -28,53 +55,325 @@ ROAD_WORK_CSV_NAME = 'road_works.csv'
 WAY_ROAD_WORK_TAG_KEY = 'highway'
 WAY_ROAD_WORK_TAG_VALUE = 'construction'
 
+# file format of the extracts of the TileExtractHandler and their temporary files
+EXTRACT_FILE_EXTENSION = '.osm.pbf'
+
 
 ###########################################################################
 
 
+def get_location_index(index_type=DEFAULT_LOCATION_INDEX, index_file=None):
+    """
+    Create the idx parameter of osmium's apply_file for the given index type
+    :param index_type: one of osmium's index types, e.g. SPARSE_MEM_ARRAY or DENSE_FILE_ARRAY
+    :param index_file: file path to store node locations in, only needed for file-backed indices
+    """
+    if index_type not in osmium.index.map_types():
+        raise Exception("Invalid location index %s provided. Choose one of %s."
+                        % (index_type, osmium.index.map_types()))
+
+    if index_type in FILE_BACKED_LOCATION_INDICES:
+        if index_file is None:
+            raise Exception("Location index %s needs an index_file to store node locations." % index_type)
+        return f"{index_type},{index_file}"
+    else:
+        return index_type
+
+
+def set_pbf_decoding_threads(num_threads):
+    """
+    Set the number of threads osmium uses to decode blocks of a .pbf file in parallel. Has to be called before the
+    first file is read, as osmium creates its thread pool only once.
+    """
+    os.environ['OSMIUM_POOL_THREADS'] = str(num_threads)
+
+
+def apply_osm_changes(osm_file, change_files, updated_osm_file):
+    """
+    Write the osm file with the changes of osm change files (.osc) applied to it, e.g. the daily or weekly diffs of an
+    osm export, to updated_osm_file. The updated osm file is written to a temporary file next to it first, so an
+    existing file is only replaced after all changes were applied successfully.
+    """
+    if os.path.realpath(osm_file) == os.path.realpath(updated_osm_file):
+        raise Exception("The updated osm file %s has to differ from the osm file the changes are applied to."
+                        % updated_osm_file)
+
+    change_reader = osmium.MergeInputReader()
+    for change_file in change_files:
+        change_reader.add_file(change_file)
+
+    # osmium derives the file format from the extension like .osm or .osm.pbf, so the temporary file keeps it
+    file_name = os.path.basename(updated_osm_file)
+    extension = file_name[file_name.index('.'):] if '.' in file_name else ''
+    file_descriptor, temporary_file = tempfile.mkstemp(prefix='.' + file_name + '.', suffix=extension,
+                                                       dir=os.path.dirname(os.path.abspath(updated_osm_file)))
+    os.close(file_descriptor)
+    # osmium refuses to overwrite an existing file
+    os.remove(temporary_file)
+    try:
+        writer = osmium.io.Writer(temporary_file, osmium.io.Header())
+        try:
+            change_reader.apply_to_reader(osmium.io.Reader(osm_file), writer)
+        finally:
+            writer.close()
+        os.replace(temporary_file, updated_osm_file)
+    finally:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+
+
+def is_location_in_bbox(location, bbox):
+    """ :param bbox: (min_lat, min_lng, max_lat, max_lng), the borders belong to the bbox """
+    min_lat, min_lng, max_lat, max_lng = bbox
+    return min_lat <= location.lat <= max_lat and min_lng <= location.lon <= max_lng
+
+
 class NodeMonitor(object):
+    """
+    Compact registry of all nodes referenced by ways. Occurrences are collected in chunks and merged into sorted
+    arrays of osm ids, reference counts and optionally locations. The index of a node within these arrays is its
+    dense and deterministic node id, so later stages can index arrays directly instead of looking up dicts.
+    """
+
+    def __init__(self, with_locations=True):
+        self._with_locations = with_locations
+        self._osm_ids = np.empty(0, dtype=np.int64)
+        self._counts = np.empty(0, dtype=np.uint16)
+        self._locations = np.empty((0, 2), dtype=np.float64)
+
+        self._chunk_osm_ids = []
+        self._chunk_locations = []
+        self._chunk_size = 0
+
+    @property
+    def osm_ids(self):
+        self.__merge_chunk()
+        return self._osm_ids
+
+    @property
+    def counts(self):
+        self.__merge_chunk()
+        return self._counts
+
+    @property
+    def lats(self):
+        self.__merge_chunk()
+        return self._locations[:, 0]
+
+    @property
+    def lngs(self):
+        self.__merge_chunk()
+        return self._locations[:, 1]
 
-    def __init__(self):
-        self._nodes = {}
-        self._seen_nodes = {}
-        self._marked_nodes = {}
+    def __len__(self):
+        return len(self.osm_ids)
 
-    def occurrence(self, node):
-        osm_id = node.osm_id
+    def occurrence(self, osm_ids, locations=None):
+        """ Register the nodes of a way with their osm ids and, if locations are monitored, their (lat, lng) """
+        self._chunk_osm_ids.append(osm_ids)
+        if self._with_locations:
+            self._chunk_locations.append(locations)
+        self._chunk_size += len(osm_ids)
 
-        if osm_id not in self._nodes:
-            self._seen_nodes[osm_id] = 0
-            self._nodes[osm_id] = node
+        if self._chunk_size >= NODE_REFERENCE_CHUNK_SIZE:
+            self.__merge_chunk()
 
-        self._seen_nodes[osm_id] += 1
+    def get_node_ids(self, osm_ids):
+        """ Map osm ids of already registered nodes to their node ids """
+        return np.searchsorted(self.osm_ids, osm_ids)
 
-    def mark(self, node):
-        unique_id = node.unique_id
+    def is_intersection(self, node_ids):
+        return self.counts[node_ids] > 1
+
+    def __merge_chunk(self):
+        """ Merge the collected occurrences into the sorted arrays to keep memory bounded """
+        if not self._chunk_osm_ids:
+            return
+
+        osm_ids = np.concatenate([self._osm_ids] + self._chunk_osm_ids)
+        weights = np.concatenate([self._counts.astype(np.int64), np.ones(self._chunk_size, dtype=np.int64)])
+        self._osm_ids, first_index, inverse = np.unique(osm_ids, return_index=True, return_inverse=True)
+        counts = np.bincount(inverse.ravel(), weights=weights, minlength=len(self._osm_ids))
+        self._counts = np.minimum(counts, MAX_NODE_REFERENCE_COUNT).astype(np.uint16)
+
+        if self._with_locations:
+            self._locations = np.concatenate([self._locations] + self._chunk_locations)[first_index]
+
+        self._chunk_osm_ids = []
+        self._chunk_locations = []
+        self._chunk_size = 0
+
+
+def get_node_refs(way):
+    return np.fromiter((node.ref for node in way.nodes), dtype=np.int64, count=len(way.nodes))
+
+
+def get_node_locations(way):
+    return np.array([(node.location.lat, node.location.lon) for node in way.nodes], dtype=np.float64).reshape(-1, 2)
+
+
+def get_clipped_node_ranges(coordinates, clip_area=None):
+    """ Index ranges of the nodes of a way, that are kept after clipping the way to the clip_area """
+    if clip_area is None:
+        return [(0, len(coordinates))]
+    return clip_area.clip_way(coordinates)
+
+
+def is_node_in_clip_area(node, clip_area=None):
+    return clip_area is None or clip_area.contains([node.location.lat], [node.location.lon])[0]
+
+
+def is_way_in_clip_area(way, clip_area=None):
+    """ A way is part of the clip_area, if at least one of its nodes lies within it """
+    if clip_area is None:
+        return True
+    coordinates = get_node_locations(way)
+    return clip_area.contains(coordinates[:, 0], coordinates[:, 1]).any()
+
+
+def create_street_ways(way, node_monitor, clip_area=None):
+    """
+    Convert an osmium way into Ways, if it's a street, and register their nodes in the node_monitor.
+    Without a clip_area a street results in exactly one Way, otherwise in one Way per piece within the area.
+    The nodes of the returned Ways are their osm ids.
+    """
+    if not osm_helper.is_street(way):
+        return []
+
+    way_id = way.id
+    way_name = osm_helper.get_name_from_way(way)
+    way_speedlimit = osm_helper.get_tag(way, "maxspeed")
+    way_oneway = osm_helper.is_oneway(way)
+    way_highway = osm_helper.get_highway_class(way)
+
+    node_refs = get_node_refs(way)
+    coordinates = get_node_locations(way)
+
+    street_ways = []
+    for start, end in get_clipped_node_ranges(coordinates, clip_area):
+        node_monitor.occurrence(node_refs[start:end], coordinates[start:end])
+        street_ways.append(Way(way_id, way_name, node_refs[start:end], way_speedlimit, way_oneway,
+                               highway=way_highway))
+    return street_ways
+
+
+def calc_node_pair_lengths(node_ids, way_lengths, lats, lngs, distance_mode=VINCENTY):
+    """
+    Calculate the length between every two consecutive nodes of all ways in a single vectorized call
+    :param node_ids: the node ids of all ways concatenated
+    :param way_lengths: the number of nodes of each way
+    :param lats: latitudes indexed by node id
+    :param lngs: longitudes indexed by node id
+    :return: an array with one length per node pair in the order of the ways and their nodes
+    """
+    # every node except the last one of a way starts a node pair
+    is_pair_start = np.ones(len(node_ids), dtype=bool)
+    is_pair_start[np.cumsum(way_lengths, dtype=np.int64) - 1] = False
+    pair_starts = np.flatnonzero(is_pair_start)
 
-        if unique_id in self._marked_nodes:
-            return False
-        else:
-            self._marked_nodes[unique_id] = True
-            return True
+    start_ids, end_ids = node_ids[pair_starts], node_ids[pair_starts + 1]
+    return calc_distances(lats[start_ids], lngs[start_ids], lats[end_ids], lngs[end_ids], distance_mode)
 
-    def __getitem__(self, osm_id):
-        if osm_id in self._nodes:
-            return self._nodes[osm_id]
-        else:
-            return None
 
-    def is_intersection(self, node):
-        osm_id = node.osm_id
+def write_ways_and_nodes_csv(output_dir, ways, node_monitor, distance_mode=VINCENTY):
+    if not os.path.exists(output_dir):
+        os.mkdir(output_dir)
 
-        return osm_id in self._seen_nodes and self._seen_nodes[osm_id] > 1
+    way_csv_file = open(os.path.join(output_dir, WAYS_CSV_NAME), 'w', encoding='utf-8', newline="")
+    nodes_csv_file = open(os.path.join(output_dir, NODES_CSV_NAME), 'w', encoding='utf-8', newline="")
+
+    way_csv = csv.writer(way_csv_file, doublequote=False, escapechar='\\')
+    nodes_csv = csv.writer(nodes_csv_file, doublequote=False, escapechar='\\')
+
+    way_csv.writerow(WAYS_CSV_HEADER)
+    nodes_csv.writerow(NODES_CSV_HEADER)
+
+    print("Creating %d nodes" % len(node_monitor))
+    intersection_labels = np.where(node_monitor.counts > 1, "INTERSECTION", "CONNECTION")
+    nodes_csv.writerows(zip(range(len(node_monitor)), node_monitor.osm_ids.tolist(), intersection_labels.tolist(),
+                            node_monitor.lats.tolist(), node_monitor.lngs.tolist()))
+
+    way_lengths = np.array([len(way.nodes) for way in ways], dtype=np.int64)
+    node_ids = node_monitor.get_node_ids(np.concatenate([way.nodes for way in ways] + [np.empty(0, np.int64)]))
+    # calculate each length once and reuse it for both directions of two-way streets
+    node_pair_lengths = calc_node_pair_lengths(node_ids, way_lengths, node_monitor.lats, node_monitor.lngs,
+                                               distance_mode).tolist()
+    node_ids = node_ids.tolist()
+    node_index = 0
+    pair_index = 0
+
+    for way, way_length in tqdm(zip(ways, way_lengths.tolist()), total=len(ways), unit="way", desc="Creating ways"):
+        write_way_rows(way_csv, way, node_ids[node_index:node_index + way_length],
+                       node_pair_lengths[pair_index:pair_index + way_length - 1])
+        node_index += way_length
+        pair_index += way_length - 1
+
+    way_csv_file.close()
+    nodes_csv_file.close()
+
+
+def write_way_rows(way_csv, way, node_ids, node_pair_lengths):
+    """ Write a row for every two consecutive nodes of a way and a row for the reverse direction of two-way streets """
+    prev_node_id = node_ids[0]
+
+    for current_node_id, length in zip(node_ids[1:], node_pair_lengths):
+        way_csv.writerow(
+            [prev_node_id, current_node_id, WAYS_TYPE_NAME, length, length, way.name, way.type, way.speedlimit,
+             way.way_id, way.highway])
+        # filter ways, if direction is unilateral
+        if not way.oneway:
+            way_csv.writerow(
+                [current_node_id, prev_node_id, WAYS_TYPE_NAME, length, length, way.name, way.type,
+                 way.speedlimit, way.way_id, way.highway])
+
+        prev_node_id = current_node_id
+
+
+def write_traffic_lights_csv(output_dir, traffic_lights):
+    tl_csv_file = open(os.path.join(output_dir, TRAFFIC_LIGHT_CSV_NAME), 'w', encoding='utf-8', newline="")
+
+    tl_csv = csv.writer(tl_csv_file, doublequote=False)
+    tl_csv.writerow(TRAFFIC_LIGHTS_CSV_HEADER)
+
+    for node in tqdm(traffic_lights, unit="traffic light", desc="Creating traffic lights"):
+        tl_csv.writerow([node.unique_id, node.osm_id, 'TRAFFIC_LIGHT', node.location.lat, node.location.lng])
+
+    tl_csv_file.close()
+
+
+def write_roundabouts_csv(output_dir, roundabouts):
+    roundabout_csv_file = open(os.path.join(output_dir, ROUNDABOUT_CSV_NAME), 'w', encoding='utf-8', newline="")
+
+    roundabout_csv = csv.writer(roundabout_csv_file, doublequote=False)
+    roundabout_csv.writerow(['osm_id:string', ':LABEL'])
+
+    for roundabout in tqdm(roundabouts, unit="roundabout", desc="Creating roundabouts"):
+        roundabout_csv.writerow([roundabout.osm_id, 'ROUNDABOUT'])
+
+    roundabout_csv_file.close()
+
+
+def write_road_works_csv(output_dir, road_works):
+    road_work_csv_file = open(os.path.join(output_dir, ROAD_WORK_CSV_NAME), 'w', encoding='utf-8', newline="")
+
+    road_work_csv = csv.writer(road_work_csv_file, doublequote=False)
+    road_work_csv.writerow(['osm_id:string', ':LABEL'])
+
+    for road_work in tqdm(road_works, unit="road_work", desc="Creating road works"):
+        road_work_csv.writerow([road_work.osm_id, 'ROAD_WORK'])
+
+    road_work_csv_file.close()
 
 
 class WayHandler(osmium.SimpleHandler):
 
-    def __init__(self, filename, output_dir, log):
+    def __init__(self, filename, output_dir, log, distance_mode=VINCENTY, idx=DEFAULT_LOCATION_INDEX,
+                 clip_area=None):
         super(WayHandler, self).__init__()
         self.log = log
         self.ways_processed = 0
+        self._clip_area = clip_area
+        self._distance_mode = distance_mode
         self.node_monitor = NodeMonitor()
         self._ways = []
         self._output_dir = output_dir
@@ -83,7 +382,7 @@ class WayHandler(osmium.SimpleHandler):
         self.log.info(f"Input file: {filename}")
 
         print(f"Reading ways from {filename}")
-        self.apply_file(filename, locations=True, idx='sparse_mem_array')
+        self.apply_file(filename, locations=True, idx=idx)
 
         self.log.info(f"Found {len(self.ways)} ways")
 
@@ -95,27 +394,10 @@ class WayHandler(osmium.SimpleHandler):
 
     def way(self, way):
         self.ways_processed += 1
-        if not osm_helper.is_street(way): return
+        street_ways = create_street_ways(way, self.node_monitor, self._clip_area)
+        if not street_ways: return
 
-        way_id = way.id
-        way_name = osm_helper.get_name_from_way(way)
-        way_speedlimit = osm_helper.get_tag(way, "maxspeed")
-        way_oneway = osm_helper.is_oneway(way)
-
-        node_objs = []
-
-        for i, node in enumerate(way.nodes):
-            existing_node = self.node_monitor[node.ref]
-            if existing_node is None:
-                osm_id = node.ref
-                node_location = Location(lat=node.location.lat, lng=node.location.lon)
-                existing_node = Node(osm_id, node_location)
-
-            node_objs.append(existing_node)
-            self.node_monitor.occurrence(existing_node)
-
-        way_obj = Way(way_id, way_name, node_objs, way_speedlimit, way_oneway)
-        self._ways.append(way_obj)
+        self._ways.extend(street_ways)
 
         if not len(self._ways) % WAY_PROGRESS:
             print('-', end='')
@@ -123,60 +405,15 @@ class WayHandler(osmium.SimpleHandler):
                 print("")
 
     def write_csv(self):
-        if not os.path.exists(self._output_dir):
-            os.mkdir(self._output_dir)
-
-        ways = self._ways
-        nodes = set()
-        for way in ways:
-            for node in way.nodes:
-                nodes.add(node)
-
-        way_csv_file = open(os.path.join(self._output_dir, WAYS_CSV_NAME), 'w', encoding='utf-8', newline="")
-        nodes_csv_file = open(os.path.join(self._output_dir, NODES_CSV_NAME), 'w', encoding='utf-8', newline="")
-
-        self.__way_csv = csv.writer(way_csv_file, doublequote=False, escapechar='\\')
-        self.__nodes_csv = csv.writer(nodes_csv_file, doublequote=False, escapechar='\\')
-
-        self.__way_csv.writerow(
-            [':START_ID', ':END_ID', ':TYPE', 'distance:string', 'aggregated_distance:double', 'name:string',
-             'type:string', 'speedlimit:int', 'osm_id:string'])
-        self.__nodes_csv.writerow(['node_id:ID', 'osm_id:string', ':LABEL', 'lat:float', 'lng:float'])
-
-        for node in tqdm(nodes, unit="node", desc="Creating nodes"):
-            if self.node_monitor.mark(node):
-                intersection_label = "INTERSECTION" if self.node_monitor.is_intersection(node) else "CONNECTION"
-                self.__nodes_csv.writerow(
-                    [node.unique_id, node.osm_id, intersection_label, node.location.lat, node.location.lng])
-
-        for way in tqdm(ways, unit="way", desc="Creating ways"):
-            nodes_in_way = way.nodes
-            prev_node = nodes_in_way[0]
-
-            for current_node in nodes_in_way[1:]:
-                # temporary way
-                tmp_way = Way(way.way_id, way.name, [prev_node, current_node], way.speedlimit, way.oneway)
-
-                self.__way_csv.writerow(
-                    [tmp_way.start_node.unique_id, tmp_way.end_node.unique_id, WAYS_TYPE_NAME, tmp_way.length,
-                     tmp_way.length, tmp_way.name, tmp_way.type, tmp_way.speedlimit, way.way_id])
-                # filter ways, if direction is unilateral
-                if not tmp_way.oneway:
-                    self.__way_csv.writerow(
-                        [tmp_way.end_node.unique_id, tmp_way.start_node.unique_id, WAYS_TYPE_NAME, tmp_way.length,
-                         tmp_way.length, tmp_way.name, tmp_way.type, tmp_way.speedlimit, way.way_id])
-
-                prev_node = current_node
-
-        way_csv_file.close()
-        nodes_csv_file.close()
+        write_ways_and_nodes_csv(self._output_dir, self._ways, self.node_monitor, self._distance_mode)
 
 
 class TrafficLightHandler(osmium.SimpleHandler):
 
-    def __init__(self, filename, output_dir, log):
+    def __init__(self, filename, output_dir, log, clip_area=None):
         super(TrafficLightHandler, self).__init__()
         self.log = log
+        self._clip_area = clip_area
         self._traffic_lights = []
         self._output_dir = output_dir
 
@@ -184,7 +421,8 @@ class TrafficLightHandler(osmium.SimpleHandler):
         self.log.info(f"Input file: {filename}")
 
         print(f"Parsing nodes for traffic lights from {filename}")
-        self.apply_file(filename, locations=True, idx='sparse_mem_array')
+        # no location index needed, as the location of a node is part of the node itself
+        self.apply_file(filename)
 
         self.log.info(f"Found {len(self.traffic_lights)} traffic lights")
 
@@ -202,36 +440,31 @@ class TrafficLightHandler(osmium.SimpleHandler):
     """
 
     def node(self, node):
-        if node.tags.get(NODE_TRAFFIC_LIGHT_TAG_KEY) == NODE_TRAFFIC_LIGHT_TAG_VALUE:
+        if node.tags.get(NODE_TRAFFIC_LIGHT_TAG_KEY) == NODE_TRAFFIC_LIGHT_TAG_VALUE and \
+                is_node_in_clip_area(node, self._clip_area):
             node_location = Location(lat=node.location.lat, lng=node.location.lon)
             traffic_light = TrafficLight(node.id, node_location)
             self._traffic_lights.append(traffic_light)
 
     def write_csv(self):
-        tl_csv_file = open(os.path.join(self._output_dir, TRAFFIC_LIGHT_CSV_NAME), 'w', encoding='utf-8', newline="")
-
-        self.__tl_csv = csv.writer(tl_csv_file, doublequote=False)
-        self.__tl_csv.writerow(['traffic_light_id:ID', 'osm_id:string', ':LABEL', 'lat:float', 'lng:float'])
-
-        for node in tqdm(self.traffic_lights, unit="traffic light", desc="Creating traffic lights"):
-            self.__tl_csv.writerow([node.unique_id, node.osm_id, 'TRAFFIC_LIGHT', node.location.lat, node.location.lng])
-
-        tl_csv_file.close()
+        write_traffic_lights_csv(self._output_dir, self._traffic_lights)
 
 
 class RoundaboutHandler(osmium.SimpleHandler):
 
-    def __init__(self, filename, output_dir, log):
+    def __init__(self, filename, output_dir, log, idx=DEFAULT_LOCATION_INDEX, clip_area=None):
         super(RoundaboutHandler, self).__init__()
         self.log = log
         self._roundabouts = []
         self._output_dir = output_dir
+        self._clip_area = clip_area
 
         self.log.info(f"Output directory: {self._output_dir}")
         self.log.info(f"Input file: {filename}")
 
         print(f"Parsing ways for roundabouts from {filename}")
-        self.apply_file(filename, locations=True, idx='sparse_mem_array')
+        # node locations are only needed to clip roundabouts to the clip area
+        self.apply_file(filename, locations=clip_area is not None, idx=idx)
 
         self.log.info(f"Found {len(self._roundabouts)} roundabouts")
 
@@ -241,54 +474,330 @@ class RoundaboutHandler(osmium.SimpleHandler):
         if not osm_helper.is_street(way):
             return
 
-        if way.tags.get(WAY_ROUNDABOUT_TAG_KEY) == WAY_ROUNDABOUT_TAG_VALUE:
+        if way.tags.get(WAY_ROUNDABOUT_TAG_KEY) == WAY_ROUNDABOUT_TAG_VALUE and \
+                is_way_in_clip_area(way, self._clip_area):
             roundabout = Roundabout(way.id)
             self._roundabouts.append(roundabout)
 
     def write_csv(self):
-        roundabout_csv_file = open(os.path.join(self._output_dir, ROUNDABOUT_CSV_NAME), 'w', encoding='utf-8',
-                                   newline="")
-
-        roundabout_csv = csv.writer(roundabout_csv_file, doublequote=False)
-        roundabout_csv.writerow(['osm_id:string', ':LABEL'])
-
-        for roundabout in tqdm(self._roundabouts, unit="roundabout", desc="Creating roundabouts"):
-            roundabout_csv.writerow([roundabout.osm_id, 'ROUNDABOUT'])
-
-        roundabout_csv_file.close()
+        write_roundabouts_csv(self._output_dir, self._roundabouts)
 
 
 class RoadWorkHandler(osmium.SimpleHandler):
 
-    def __init__(self, filename, output_dir, log):
+    def __init__(self, filename, output_dir, log, idx=DEFAULT_LOCATION_INDEX, clip_area=None):
         super(RoadWorkHandler, self).__init__()
         self.log = log
         self._road_works = []
         self._output_dir = output_dir
+        self._clip_area = clip_area
 
         self.log.info(f"Output directory: {self._output_dir}")
         self.log.info(f"Input file: {filename}")
 
         print(f"Parsing ways for road works from {filename}")
-        self.apply_file(filename, locations=True, idx='sparse_mem_array')
+        # node locations are only needed to clip road works to the clip area
+        self.apply_file(filename, locations=clip_area is not None, idx=idx)
 
         self.log.info(f"Found {len(self._road_works)} road works")
 
         self.write_csv()
 
     def way(self, way):
-        if way.tags.get(WAY_ROAD_WORK_TAG_KEY) == WAY_ROAD_WORK_TAG_VALUE:
+        if way.tags.get(WAY_ROAD_WORK_TAG_KEY) == WAY_ROAD_WORK_TAG_VALUE and is_way_in_clip_area(way, self._clip_area):
             road_work = RoadWork(way.id)
             self._road_works.append(road_work)
 
     def write_csv(self):
-        road_work_csv_file = open(os.path.join(self._output_dir, ROAD_WORK_CSV_NAME), 'w', encoding='utf-8',
-                                  newline="")
+        write_road_works_csv(self._output_dir, self._road_works)
+
+
+class StreetNetworkHandler(osmium.SimpleHandler):
+    """
+    Parse the osm file only once and collect ways, nodes, traffic lights, roundabouts and optionally road works
+    in the same pass. Replaces running WayHandler, TrafficLightHandler, RoundaboutHandler and RoadWorkHandler one
+    after another, as each of them parses the whole file and rebuilds the location index.
+    """
+
+    def __init__(self, filename, output_dir, log, with_road_works=False, distance_mode=VINCENTY,
+                 idx=DEFAULT_LOCATION_INDEX, clip_area=None):
+        super(StreetNetworkHandler, self).__init__()
+        self.log = log
+        self.ways_processed = 0
+        self._clip_area = clip_area
+        self._distance_mode = distance_mode
+        self.node_monitor = NodeMonitor()
+        self._ways = []
+        self._traffic_lights = []
+        self._roundabouts = []
+        self._road_works = []
+        self._with_road_works = with_road_works
+        self._output_dir = output_dir
+
+        self.log.info(f"Output directory: {self._output_dir}")
+        self.log.info(f"Input file: {filename}")
+
+        print(f"Parsing ways, traffic lights and roundabouts from {filename}")
+        self.apply_file(filename, locations=True, idx=idx)
+
+        self.log.info(f"Found {len(self._ways)} ways")
+        self.log.info(f"Found {len(self._traffic_lights)} traffic lights")
+        self.log.info(f"Found {len(self._roundabouts)} roundabouts")
+        if self._with_road_works:
+            self.log.info(f"Found {len(self._road_works)} road works")
+
+        self.write_csv()
+
+    @property
+    def ways(self):
+        return self._ways
+
+    @property
+    def traffic_lights(self):
+        return self._traffic_lights
+
+    def node(self, node):
+        if node.tags.get(NODE_TRAFFIC_LIGHT_TAG_KEY) == NODE_TRAFFIC_LIGHT_TAG_VALUE and \
+                is_node_in_clip_area(node, self._clip_area):
+            node_location = Location(lat=node.location.lat, lng=node.location.lon)
+            self._traffic_lights.append(TrafficLight(node.id, node_location))
+
+    def way(self, way):
+        self.ways_processed += 1
+        if self._with_road_works and way.tags.get(WAY_ROAD_WORK_TAG_KEY) == WAY_ROAD_WORK_TAG_VALUE and \
+                is_way_in_clip_area(way, self._clip_area):
+            self._road_works.append(RoadWork(way.id))
+
+        street_ways = create_street_ways(way, self.node_monitor, self._clip_area)
+        if not street_ways: return
+
+        if way.tags.get(WAY_ROUNDABOUT_TAG_KEY) == WAY_ROUNDABOUT_TAG_VALUE:
+            self._roundabouts.append(Roundabout(way.id))
+
+        self._ways.extend(street_ways)
+
+        if not len(self._ways) % WAY_PROGRESS:
+            print('-', end='')
+            if not len(self._ways) % (WAY_PROGRESS * 100):
+                print("")
+
+    def write_csv(self):
+        write_traffic_lights_csv(self._output_dir, self._traffic_lights)
+        write_roundabouts_csv(self._output_dir, self._roundabouts)
+        write_ways_and_nodes_csv(self._output_dir, self._ways, self.node_monitor, self._distance_mode)
+        if self._with_road_works:
+            write_road_works_csv(self._output_dir, self._road_works)
+
+
+class NodeReferenceCounter(osmium.SimpleHandler):
+    """
+    First pass of the streaming mode: count how often each node is referenced by a street. A location index is
+    only built, if the ways are clipped to a clip_area.
+    """
 
-        road_work_csv = csv.writer(road_work_csv_file, doublequote=False)
-        road_work_csv.writerow(['osm_id:string', ':LABEL'])
+    def __init__(self, filename, idx=DEFAULT_LOCATION_INDEX, clip_area=None):
+        super(NodeReferenceCounter, self).__init__()
+        self.node_monitor = NodeMonitor(with_locations=False)
+        self._clip_area = clip_area
+
+        print(f"Counting node references of ways from {filename}")
+        self.apply_file(filename, locations=clip_area is not None, idx=idx)
+
+    def way(self, way):
+        if not osm_helper.is_street(way): return
+
+        node_refs = get_node_refs(way)
+        if self._clip_area is None:
+            self.node_monitor.occurrence(node_refs)
+            return
 
-        for road_work in tqdm(self._road_works, unit="road_work", desc="Creating road works"):
-            road_work_csv.writerow([road_work.osm_id, 'ROAD_WORK'])
+        for start, end in self._clip_area.clip_way(get_node_locations(way)):
+            self.node_monitor.occurrence(node_refs[start:end])
 
-        road_work_csv_file.close()
+
+class StreamingWayHandler(osmium.SimpleHandler):
+    """
+    Bounded-memory alternative to the WayHandler for large extracts. In a first pass the node references are
+    counted to find intersections, in a second pass way rows and node rows are written to disk directly, so the
+    full object graph of ways and nodes is never held in memory.
+    """
+
+    def __init__(self, filename, output_dir, log, distance_mode=VINCENTY, idx=DEFAULT_LOCATION_INDEX,
+                 clip_area=None):
+        super(StreamingWayHandler, self).__init__()
+        self.log = log
+        self.ways_processed = 0
+        self._clip_area = clip_area
+        self.num_ways = 0
+        self._distance_mode = distance_mode
+        self._output_dir = output_dir
+        self._way_batch = []
+
+        self.log.info(f"Output directory: {self._output_dir}")
+        self.log.info(f"Input file: {filename}")
+
+        self.node_monitor = NodeReferenceCounter(filename, idx, clip_area).node_monitor
+        self._is_node_written = np.zeros(len(self.node_monitor), dtype=bool)
+        self.log.info(f"Found {len(self.node_monitor)} nodes on ways")
+
+        if not os.path.exists(self._output_dir):
+            os.mkdir(self._output_dir)
+
+        with open(os.path.join(self._output_dir, WAYS_CSV_NAME), 'w', encoding='utf-8', newline="") as way_file, \
+                open(os.path.join(self._output_dir, NODES_CSV_NAME), 'w', encoding='utf-8', newline="") as node_file:
+            self._way_csv = csv.writer(way_file, doublequote=False, escapechar='\\')
+            self._nodes_csv = csv.writer(node_file, doublequote=False, escapechar='\\')
+            self._way_csv.writerow(WAYS_CSV_HEADER)
+            self._nodes_csv.writerow(NODES_CSV_HEADER)
+
+            print(f"Streaming ways from {filename}")
+            self.apply_file(filename, locations=True, idx=idx)
+            self.write_way_batch()
+
+        self.log.info(f"Found {self.num_ways} ways")
+
+    def way(self, way):
+        self.ways_processed += 1
+        if not osm_helper.is_street(way): return
+
+        all_node_refs = get_node_refs(way)
+        all_coordinates = get_node_locations(way)
+
+        for start, end in get_clipped_node_ranges(all_coordinates, self._clip_area):
+            node_refs, coordinates = all_node_refs[start:end], all_coordinates[start:end]
+            node_ids = self.node_monitor.get_node_ids(node_refs)
+
+            # write every node once at its first occurrence, as its label is already known from the counting pass
+            for node_id, osm_id, (lat, lng) in zip(node_ids.tolist(), node_refs.tolist(), coordinates.tolist()):
+                if not self._is_node_written[node_id]:
+                    self._is_node_written[node_id] = True
+                    intersection_label = "INTERSECTION" if self.node_monitor.counts[node_id] > 1 else "CONNECTION"
+                    self._nodes_csv.writerow([node_id, osm_id, intersection_label, lat, lng])
+
+            way_obj = Way(way.id, osm_helper.get_name_from_way(way), node_refs, osm_helper.get_tag(way, "maxspeed"),
+                          osm_helper.is_oneway(way), highway=osm_helper.get_highway_class(way))
+            self._way_batch.append((way_obj, node_ids, coordinates))
+            self.num_ways += 1
+
+        if len(self._way_batch) >= STREAMING_WAY_BATCH_SIZE:
+            self.write_way_batch()
+
+    def write_way_batch(self):
+        """ Calculate the lengths of all buffered ways at once and write them to the ways.csv """
+        if not self._way_batch:
+            return
+
+        starts = np.concatenate([coordinates[:-1] for _, _, coordinates in self._way_batch])
+        ends = np.concatenate([coordinates[1:] for _, _, coordinates in self._way_batch])
+        node_pair_lengths = calc_distances(starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1],
+                                           self._distance_mode).tolist()
+
+        pair_index = 0
+        for way, node_ids, coordinates in self._way_batch:
+            num_pairs = len(coordinates) - 1
+            write_way_rows(self._way_csv, way, node_ids.tolist(), node_pair_lengths[pair_index:pair_index + num_pairs])
+            pair_index += num_pairs
+
+        print('-', end='')
+        self._way_batch = []
+
+
+class NodeCopyHandler(osmium.SimpleHandler):
+    """ Copy the nodes of an osm file to a writer and merge additional nodes into them in the order of their ids """
+
+    def __init__(self, filename, writer, additional_nodes):
+        super(NodeCopyHandler, self).__init__()
+        self._writer = writer
+        self._additional_nodes = sorted(additional_nodes.items())
+        self._next_additional_node = 0
+
+        self.apply_file(filename)
+        self.write_additional_nodes()
+
+    def node(self, node):
+        self.write_additional_nodes(node.id)
+        self._writer.add_node(node)
+
+    def write_additional_nodes(self, before_id=None):
+        """ Write all additional nodes with an id below before_id, or all remaining ones, if no id is given """
+        while self._next_additional_node < len(self._additional_nodes):
+            node_id, (lng, lat) = self._additional_nodes[self._next_additional_node]
+            if before_id is not None and node_id >= before_id:
+                return
+            self._writer.add_node(osmium.osm.mutable.Node(id=node_id, location=osmium.osm.Location(lng, lat)))
+            self._next_additional_node += 1
+
+
+class WayCopyHandler(osmium.SimpleHandler):
+    """ Copy the ways of an osm file to a writer """
+
+    def __init__(self, filename, writer):
+        super(WayCopyHandler, self).__init__()
+        self._writer = writer
+        self.apply_file(filename)
+
+    def way(self, way):
+        self._writer.add_way(way)
+
+
+class TileExtractHandler(osmium.SimpleHandler):
+    """
+    Split an osm file in a single pass into extracts of multiple bounding boxes, e.g. the tiles of a region. An
+    extract contains all nodes within its bbox and all ways with at least one node within it. Ways are kept whole
+    like the clipping of the handlers above does, so the nodes of a way beyond the bbox are added with their location.
+    Nodes and ways are routed to temporary files first, that are merged to the extract afterwards.
+    """
+
+    def __init__(self, filename, bboxes, extract_files, idx=DEFAULT_LOCATION_INDEX):
+        super(TileExtractHandler, self).__init__()
+        self._bboxes = bboxes
+        self._extract_files = extract_files
+        self._node_files = [extract_file + '.nodes' + EXTRACT_FILE_EXTENSION for extract_file in extract_files]
+        self._way_files = [extract_file + '.ways' + EXTRACT_FILE_EXTENSION for extract_file in extract_files]
+        # {osm id: (lng, lat)} of the nodes beyond the bbox, that ways of an extract refer to
+        self._boundary_nodes = [dict() for _ in extract_files]
+
+        for temporary_file in self._node_files + self._way_files + extract_files:
+            if os.path.exists(temporary_file):
+                os.remove(temporary_file)
+        self._node_writers = [osmium.SimpleWriter(node_file) for node_file in self._node_files]
+        self._way_writers = [osmium.SimpleWriter(way_file) for way_file in self._way_files]
+        try:
+            print(f"Splitting {filename} into {len(extract_files)} extracts")
+            self.apply_file(filename, locations=True, idx=idx)
+        finally:
+            for writer in self._node_writers + self._way_writers:
+                writer.close()
+
+        for extract_index in range(len(extract_files)):
+            self.write_extract(extract_index)
+
+    def node(self, node):
+        for bbox, node_writer in zip(self._bboxes, self._node_writers):
+            if is_location_in_bbox(node.location, bbox):
+                node_writer.add_node(node)
+
+    def way(self, way):
+        node_locations = [(node.ref, node.location) for node in way.nodes if node.location.valid()]
+        for bbox, way_writer, boundary_nodes in zip(self._bboxes, self._way_writers, self._boundary_nodes):
+            is_in_bbox = [is_location_in_bbox(location, bbox) for _, location in node_locations]
+            if not any(is_in_bbox):
+                continue
+
+            way_writer.add_way(way)
+            for (node_ref, location), is_node_in_bbox in zip(node_locations, is_in_bbox):
+                if not is_node_in_bbox:
+                    boundary_nodes[node_ref] = (location.lon, location.lat)
+
+    def write_extract(self, extract_index):
+        """ Write the nodes before the ways, so the node locations of the ways can be resolved in the extract """
+        writer = osmium.SimpleWriter(self._extract_files[extract_index])
+        try:
+            NodeCopyHandler(self._node_files[extract_index], writer, self._boundary_nodes[extract_index])
+            WayCopyHandler(self._way_files[extract_index], writer)
+        finally:
+            writer.close()
+
+        os.remove(self._node_files[extract_index])
+        os.remove(self._way_files[extract_index])
+        self._boundary_nodes[extract_index] = None
@@ -27,6 +27,11 @@ def is_street(w):
     return 'highway' in w.tags and w.tags['highway'].upper() in valid_types
 
 
+def get_highway_class(w):
+    """ the road class of a street like 'primary' or 'residential' """
+    return get_tag(w, "highway", "").lower()
+
+
 def is_oneway(w):
     way_oneway = get_tag(w, "oneway", "no")
     if way_oneway == "yes":
@@ -1,7 +1,5 @@
 from random import randint
 
-import geopy.distance
-
 
 class Location(object):
 
@@ -75,7 +73,7 @@ class RoadWork(object):
 
 class Way(object):
 
-    def __init__(self, way_id, way_name, nodes, speedlimit, oneway, type="default"):
+    def __init__(self, way_id, way_name, nodes, speedlimit, oneway, type="default", highway=None):
         if way_id is None:
             way_id = randint(100000, 999999)
         # TODO might extract and move to osm_helper later, to edit speed_limit information
@@ -93,14 +91,7 @@ class Way(object):
         self._way_id = way_id
         self._oneway = oneway
         self._type = type
-
-        self._length = 0
-        prev_node = self.nodes[0]
-        for current_node in self.nodes[1:]:
-            prev_node_loc = (prev_node.location.lat, prev_node.location.lng)
-            current_node_loc = (current_node.location.lat, current_node.location.lng)
-            self._length += geopy.distance.distance(prev_node_loc, current_node_loc).m
-            prev_node = current_node
+        self._highway = highway
 
     @property
     def way_id(self):
@@ -135,8 +126,8 @@ class Way(object):
         return self._type
 
     @property
-    def length(self):
-        return self._length
+    def highway(self):
+        return self._highway
 
     def __eq__(self, other):
         return isinstance(other, Way) and self.way_id == other.way_id
@@ -145,6 +136,6 @@ class Way(object):
         return self.way_id
 
     def __str__(self):
-        return "Way(id={}, name={}, nodes={}, start_node={}, end_node={}, speedlimit={}, length={})".format(
-            self.way_id, self.name, len(self.nodes), self.start_node, self.end_node, self.speedlimit, self.length
+        return "Way(id={}, name={}, nodes={}, start_node={}, end_node={}, speedlimit={})".format(
+            self.way_id, self.name, len(self.nodes), self.start_node, self.end_node, self.speedlimit
         )
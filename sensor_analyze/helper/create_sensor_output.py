@@ -21,40 +21,40 @@ def create_all_path_sections(turn_sequence: [TemporaryVersionTurn], trip_df: pd.
         distance_between_a_b = __get_distance_in_interval(trip_df, turn_a.estimated_intersection_time,
                                                           turn_b.estimated_intersection_time)
 
-        sensor_turns.append(__create_path_section(is_roundabout=isinstance(turn_a, TemporaryRoundabout),
-                                                  order=i,
-                                                  angle=turn_a.angle,
-                                                  direction_before=turn_a.direction_before,
-                                                  direction_after=turn_a.direction_after,
-                                                  distance_before=distance_before,
-                                                  distance_after=distance_between_a_b,
-                                                  estimated_intersection_time=int(turn_a.estimated_intersection_time),
-                                                  turn_start=turn_a.start_time,
-                                                  turn_end=turn_a.end_time))
+        sensor_turns.append(create_path_section(is_roundabout=isinstance(turn_a, TemporaryRoundabout),
+                                                order=i,
+                                                angle=turn_a.angle,
+                                                direction_before=turn_a.direction_before,
+                                                direction_after=turn_a.direction_after,
+                                                distance_before=distance_before,
+                                                distance_after=distance_between_a_b,
+                                                estimated_intersection_time=int(turn_a.estimated_intersection_time),
+                                                turn_start=turn_a.start_time,
+                                                turn_end=turn_a.end_time))
         # update distance before for next following turn
         distance_before = distance_between_a_b
 
     # add the last turn
     turn_b = turn_sequence[-1]
-    sensor_turns.append(__create_path_section(is_roundabout=isinstance(turn_b, TemporaryRoundabout),
-                                              order=len(turn_sequence) - 1,
-                                              angle=turn_b.angle,
-                                              direction_before=turn_b.direction_before,
-                                              direction_after=turn_b.direction_after,
-                                              distance_before=distance_before,
-                                              distance_after=float('inf'),
-                                              estimated_intersection_time=turn_b.estimated_intersection_time,
-                                              turn_start=turn_b.start_time,
-                                              turn_end=turn_b.end_time))
+    sensor_turns.append(create_path_section(is_roundabout=isinstance(turn_b, TemporaryRoundabout),
+                                            order=len(turn_sequence) - 1,
+                                            angle=turn_b.angle,
+                                            direction_before=turn_b.direction_before,
+                                            direction_after=turn_b.direction_after,
+                                            distance_before=distance_before,
+                                            distance_after=float('inf'),
+                                            estimated_intersection_time=turn_b.estimated_intersection_time,
+                                            turn_start=turn_b.start_time,
+                                            turn_end=turn_b.end_time))
 
     return sensor_turns
 
 
-def __create_path_section(is_roundabout: bool, order: int, angle: float,
-                          direction_before: float, direction_after: float,
-                          distance_before: float, distance_after: float,
-                          estimated_intersection_time: int,
-                          turn_start: int, turn_end: int) -> Union[SensorTurnModel, RoundaboutTurnModel]:
+def create_path_section(is_roundabout: bool, order: int, angle: float,
+                        direction_before: float, direction_after: float,
+                        distance_before: float, distance_after: float,
+                        estimated_intersection_time: int,
+                        turn_start: int, turn_end: int) -> Union[SensorTurnModel, RoundaboutTurnModel]:
     if is_roundabout:
         return RoundaboutTurnModel(order=order,
                                    angle=angle,
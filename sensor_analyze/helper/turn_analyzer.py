@@ -1,5 +1,5 @@
 from _collections import deque
-from typing import Tuple
+from typing import Callable, Tuple
 
 import numpy as np
 
@@ -23,9 +23,57 @@ TURN_END_THRESHOLD = 10
 # min distance bridged during valdiation window
 MIN_DISTANCE_FOR_CORNER_END = 3
 
+# window sums from prefix sums, that are closer than this tolerance relative to the sum of absolute values to a
+# threshold, are summed up like np.sum over the buffer, so they are compared to the threshold like the buffer sums
+PREFIX_SUM_TOLERANCE = 1e-9
+# the same for running sums relative to the largest sum of absolute values since they were summed up exactly
+RUNNING_SUM_TOLERANCE = 1e-9
+# running sums are summed up exactly again after this many updates, so rounding errors don't pile up
+RUNNING_SUM_RESYNC_INTERVAL = 1000
+
 
 ######################################################################
 
+class RunningSum(object):
+    """ Sum of the values in a buffer window, that is updated in O(1) on adding and removing values """
+
+    def __init__(self):
+        self.sum = 0.0
+        # magnitude of the sums since the last resync to bound the rounding errors of the running sum
+        self.abs_sum = 0.0
+        self.max_abs_sum = 0.0
+        self.updates_since_resync = 0
+
+    def add(self, value: float):
+        self.sum += value
+        self.abs_sum += abs(value)
+        self.max_abs_sum = max(self.max_abs_sum, self.abs_sum)
+        self.updates_since_resync += 1
+
+    def remove(self, value: float):
+        self.sum -= value
+        self.abs_sum -= abs(value)
+        self.updates_since_resync += 1
+
+    def get_sum(self, window: Callable[[], list], *thresholds: float) -> float:
+        """
+        The running sum; if it is close to one of the thresholds or due to be resynced, the window is summed up like
+        np.sum over the buffer, so comparisons with the thresholds are decided exactly like with np.sum
+        :param window: returns the values of the window
+        """
+        tolerance = RUNNING_SUM_TOLERANCE * (1.0 + self.max_abs_sum)
+        if self.updates_since_resync < RUNNING_SUM_RESYNC_INTERVAL and \
+                all(abs(self.sum - threshold) > tolerance for threshold in thresholds):
+            return self.sum
+
+        values = window()
+        exact_sum = np.sum(values)
+        self.sum = float(exact_sum)
+        self.abs_sum = self.max_abs_sum = float(np.sum(np.abs(values)))
+        self.updates_since_resync = 0
+        return exact_sum
+
+
 class TurnCalculatorDistanceHeading(object):
 
     def __init__(self, time_window_angle_validation: float, frequency_measurements: float):
@@ -36,6 +84,11 @@ class TurnCalculatorDistanceHeading(object):
 
         self._buffer_angle_change = deque([])
         self._buffer_distance = deque([])
+        # running sums over the whole buffers and over the last leave corner buffer size elements
+        self._angle_change_sum = RunningSum()
+        self._distance_sum = RunningSum()
+        self._leave_angle_change_sum = RunningSum()
+        self._leave_distance_sum = RunningSum()
 
         self._is_currently_left_turn = False
         self._is_currently_right_turn = False
@@ -48,12 +101,26 @@ class TurnCalculatorDistanceHeading(object):
             self.__popleft()
 
     def __popleft(self):
-        self._buffer_angle_change.popleft()
-        self._buffer_distance.popleft()
+        angle_change = self._buffer_angle_change.popleft()
+        distance = self._buffer_distance.popleft()
+        self._angle_change_sum.remove(angle_change)
+        self._distance_sum.remove(distance)
+        # the first element only belongs to the leave corner window, if the buffer isn't longer than the window
+        if len(self._buffer_angle_change) < self._leave_corner_buffer_size:
+            self._leave_angle_change_sum.remove(angle_change)
+            self._leave_distance_sum.remove(distance)
 
     def __append(self, angle_change: float, distance: float):
         self._buffer_angle_change.append(angle_change)
         self._buffer_distance.append(distance)
+        self._angle_change_sum.add(angle_change)
+        self._distance_sum.add(distance)
+        self._leave_angle_change_sum.add(angle_change)
+        self._leave_distance_sum.add(distance)
+        # the element leaving the leave corner window is close to the end of the deque, so it's accessed quickly
+        if len(self._buffer_angle_change) > self._leave_corner_buffer_size:
+            self._leave_angle_change_sum.remove(self._buffer_angle_change[-self._leave_corner_buffer_size - 1])
+            self._leave_distance_sum.remove(self._buffer_distance[-self._leave_corner_buffer_size - 1])
 
     def add_measurement(self, angle_change: float, distance: float):
         self.__append(angle_change, distance)
@@ -68,13 +135,16 @@ class TurnCalculatorDistanceHeading(object):
         else:
             return self.__is_entering_corner()
 
-    def __is_still_in_corner(self) -> bool:
-        angle_change = np.sum(list(self._buffer_angle_change)[-self._leave_corner_buffer_size:])
+    def __get_leave_window(self, buffer: deque):
+        return lambda: list(buffer)[-self._leave_corner_buffer_size:]
 
+    def __is_still_in_corner(self) -> bool:
         if self._is_slowly_turning:
             turn_end_thresh = TURN_END_SLOW_MOVEMENT_THRESHOLD
         else:
             turn_end_thresh = TURN_END_THRESHOLD
+        angle_change = self._leave_angle_change_sum.get_sum(self.__get_leave_window(self._buffer_angle_change),
+                                                            turn_end_thresh, -turn_end_thresh)
 
         # check if vehicle isn't driving straight
         if self._is_currently_right_turn and angle_change > turn_end_thresh:
@@ -83,15 +153,16 @@ class TurnCalculatorDistanceHeading(object):
             return True
         else:
             # check movement of vehicle in turn; might stand still in turn e.g. waiting for pedestrians
-            distance_bridged = np.sum(list(self._buffer_distance)[-self._leave_corner_buffer_size:])
+            distance_bridged = self._leave_distance_sum.get_sum(self.__get_leave_window(self._buffer_distance),
+                                                                MIN_DISTANCE_FOR_CORNER_END)
             if distance_bridged > MIN_DISTANCE_FOR_CORNER_END:
                 return False
             else:
                 return True
 
     def __is_entering_corner(self) -> bool:
-        angle_change = np.sum(list(self._buffer_angle_change))
-        distance_bridged = np.sum(list(self._buffer_distance))
+        distance_bridged = self._distance_sum.get_sum(lambda: list(self._buffer_distance),
+                                                      DISTANCE_SLOW_MOVEMENT_THRESHOLD)
 
         # depending on speed the turn threshold is chosen
         if distance_bridged > DISTANCE_SLOW_MOVEMENT_THRESHOLD:
@@ -100,6 +171,8 @@ class TurnCalculatorDistanceHeading(object):
         else:
             start_turn_thresh = TURN_START_SLOW_MOVEMENT_THRESHOLD
             self._is_slowly_turning = True
+        angle_change = self._angle_change_sum.get_sum(lambda: list(self._buffer_angle_change), start_turn_thresh,
+                                                      -start_turn_thresh)
 
         if angle_change > start_turn_thresh:
             self._is_currently_right_turn = True
@@ -133,18 +206,27 @@ class TurnCalculatorHeading(object):
         self.frequency_measurements = frequency_measurements
 
         self.buffer_angle_change = deque([])
+        # running sum over the last buffer size elements, as the buffer keeps growing during a turn
+        self.angle_change_sum = RunningSum()
         # variable used to track, whether the buffers are currently in a turn to calculate exact angle of turn
         self.is_currently_left_turn = False
         self.is_currently_right_turn = False
 
     def __pop_left(self):
-        self.buffer_angle_change.popleft()
+        angle_change = self.buffer_angle_change.popleft()
+        # the first element only belongs to the window, if the buffer isn't longer than the window
+        if len(self.buffer_angle_change) < self.buffer_size:
+            self.angle_change_sum.remove(angle_change)
 
     def __clear(self):
         self.buffer_angle_change.clear()
+        self.angle_change_sum = RunningSum()
 
     def __append(self, angle_change: float):
         self.buffer_angle_change.append(angle_change)
+        self.angle_change_sum.add(angle_change)
+        if len(self.buffer_angle_change) > self.buffer_size:
+            self.angle_change_sum.remove(self.buffer_angle_change[-self.buffer_size - 1])
 
     def add_measurement(self, angle_change: float, distance: float):
         self.__append(angle_change)
@@ -154,7 +236,8 @@ class TurnCalculatorHeading(object):
 
     def is_in_corner(self):
         # check the last x seconds for angle change
-        angle_change = np.sum(list(self.buffer_angle_change)[-self.buffer_size:])
+        angle_change = self.angle_change_sum.get_sum(lambda: list(self.buffer_angle_change)[-self.buffer_size:],
+                                                     TURN_THRESHOLD, -TURN_THRESHOLD)
         # TODO might add special exit condition when in turn already and turn needs longer to finish
 
         if angle_change > TURN_THRESHOLD:
@@ -176,3 +259,157 @@ class TurnCalculatorHeading(object):
         self.is_currently_left_turn = False
         self.is_currently_right_turn = False
         return angle, time_doing_turn
+
+
+class WindowSums(object):
+    """ Sums over windows of a whole trip's measurements by prefix sums in O(1) per window """
+
+    def __init__(self, values: np.ndarray):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.prefix_sums = np.concatenate([[0.0], np.cumsum(self.values)])
+        # the rounding error of a difference of prefix sums grows with the number of summed values and their
+        # absolute values, like the running sums, as mostly cancelling values keep the prefix sums small
+        relative_tolerance = max(PREFIX_SUM_TOLERANCE, 2 * (len(self.values) + 1) * np.finfo(np.float64).eps)
+        self.tolerance = relative_tolerance * (1.0 + float(np.sum(np.abs(self.values))))
+
+    def sum(self, start: int, end: int, *thresholds: float) -> float:
+        """
+        Sum of the values[start:end]; a sum close to one of the thresholds is summed up like np.sum over the buffer
+        instead, so comparisons with the thresholds are decided exactly like with the buffered turn calculators
+        """
+        window_sum = float(self.prefix_sums[end] - self.prefix_sums[start])
+        if any(abs(window_sum - threshold) <= self.tolerance for threshold in thresholds):
+            return float(np.sum(self.values[start:end]))
+        return window_sum
+
+
+class TripTurnCalculatorDistanceHeading(object):
+    """
+    TurnCalculatorDistanceHeading over the angle changes and distances of all measurements of a trip, where the vehicle
+    moved. The buffer is the window [buffer_start, buffer_end) of these measurements, so each corner check takes O(1)
+    instead of summing up the buffer.
+    """
+
+    def __init__(self, time_window_angle_validation: float, frequency_measurements: float,
+                 angle_changes: np.ndarray, distances: np.ndarray):
+        self._frequency_measurements = frequency_measurements
+
+        self._enter_corner_buffer_size = int(time_window_angle_validation * frequency_measurements)
+        self._leave_corner_buffer_size = int(TIME_LEAVE_CORNER_CHECK * frequency_measurements)
+
+        self._angle_changes = WindowSums(angle_changes)
+        self._distances = WindowSums(distances)
+        self._buffer_start = 0
+        self._buffer_end = 0
+
+        self._is_currently_left_turn = False
+        self._is_currently_right_turn = False
+
+        self._is_slowly_turning = False
+
+    def add_measurements_until(self, buffer_end: int):
+        """ add all measurements before buffer_end, like add_measurement does one by one since the last corner check """
+        self._buffer_end = buffer_end
+        # outside of a turn, add_measurement keeps the buffer one below the enter corner buffer size
+        if not (self._is_currently_left_turn or self._is_currently_right_turn):
+            self._buffer_start = max(self._buffer_start, buffer_end - max(self._enter_corner_buffer_size - 1, 0))
+
+    def is_in_corner(self) -> bool:
+        if self._is_currently_left_turn or self._is_currently_right_turn:
+            return self.__is_still_in_corner()
+        else:
+            return self.__is_entering_corner()
+
+    def __is_still_in_corner(self) -> bool:
+        leave_start = max(self._buffer_start, self._buffer_end - self._leave_corner_buffer_size)
+        if self._is_slowly_turning:
+            turn_end_thresh = TURN_END_SLOW_MOVEMENT_THRESHOLD
+        else:
+            turn_end_thresh = TURN_END_THRESHOLD
+        angle_change = self._angle_changes.sum(leave_start, self._buffer_end, turn_end_thresh, -turn_end_thresh)
+
+        # check if vehicle isn't driving straight
+        if self._is_currently_right_turn and angle_change > turn_end_thresh:
+            return True
+        elif self._is_currently_left_turn and angle_change < -turn_end_thresh:
+            return True
+        else:
+            # check movement of vehicle in turn; might stand still in turn e.g. waiting for pedestrians
+            distance_bridged = self._distances.sum(leave_start, self._buffer_end, MIN_DISTANCE_FOR_CORNER_END)
+            return distance_bridged <= MIN_DISTANCE_FOR_CORNER_END
+
+    def __is_entering_corner(self) -> bool:
+        distance_bridged = self._distances.sum(self._buffer_start, self._buffer_end, DISTANCE_SLOW_MOVEMENT_THRESHOLD)
+
+        # depending on speed the turn threshold is chosen
+        if distance_bridged > DISTANCE_SLOW_MOVEMENT_THRESHOLD:
+            start_turn_thresh = TURN_START_THRESHOLD
+            self._is_slowly_turning = False
+        else:
+            start_turn_thresh = TURN_START_SLOW_MOVEMENT_THRESHOLD
+            self._is_slowly_turning = True
+        angle_change = self._angle_changes.sum(self._buffer_start, self._buffer_end, start_turn_thresh,
+                                               -start_turn_thresh)
+
+        if angle_change > start_turn_thresh:
+            self._is_currently_right_turn = True
+            return True
+        elif angle_change < -start_turn_thresh:
+            self._is_currently_left_turn = True
+            return True
+        else:
+            return False
+
+    def calc_angle_and_clear_buffer(self) -> Tuple[float, float]:
+        turn_angle = float(np.sum(self._angle_changes.values[self._buffer_start:self._buffer_end]))
+        time_doing_turn = (self._buffer_end - self._buffer_start) / float(self._frequency_measurements)
+
+        self._buffer_start = max(self._buffer_start, self._buffer_end - self._leave_corner_buffer_size)
+        self._is_currently_right_turn = False
+        self._is_currently_left_turn = False
+
+        return turn_angle, time_doing_turn
+
+
+class TripTurnCalculatorHeading(object):
+    """ TurnCalculatorHeading over the angle changes of all measurements of a trip, where the vehicle moved """
+
+    def __init__(self, time_window_angle_validation: float, frequency_measurements: int, angle_changes: np.ndarray):
+        self.buffer_size = int(time_window_angle_validation * frequency_measurements)
+        self.frequency_measurements = frequency_measurements
+
+        self.angle_changes = WindowSums(angle_changes)
+        self.buffer_start = 0
+        self.buffer_end = 0
+
+        self.is_currently_left_turn = False
+        self.is_currently_right_turn = False
+
+    def add_measurements_until(self, buffer_end: int):
+        """ add all measurements before buffer_end, like add_measurement does one by one since the last corner check """
+        self.buffer_end = buffer_end
+        if not (self.is_currently_left_turn or self.is_currently_right_turn):
+            self.buffer_start = max(self.buffer_start, buffer_end - max(self.buffer_size - 1, 0))
+
+    def is_in_corner(self):
+        # check the last x seconds for angle change
+        angle_change = self.angle_changes.sum(max(self.buffer_start, self.buffer_end - self.buffer_size),
+                                              self.buffer_end, TURN_THRESHOLD, -TURN_THRESHOLD)
+
+        if angle_change > TURN_THRESHOLD:
+            self.is_currently_right_turn = True
+            return True
+        elif angle_change < -TURN_THRESHOLD:
+            self.is_currently_left_turn = True
+            return True
+        else:
+            return False
+
+    def calc_angle_and_clear_buffer(self):
+        angle = np.sum(self.angle_changes.values[self.buffer_start:self.buffer_end])
+        # calculate back the duration of doing the turn maneuver in ms with the number of elements in buffer
+        time_doing_turn = ((self.buffer_end - self.buffer_start) / float(self.frequency_measurements)) * 1000
+        self.buffer_start = self.buffer_end
+        self.is_currently_left_turn = False
+        self.is_currently_right_turn = False
+        return angle, time_doing_turn
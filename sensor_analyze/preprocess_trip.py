@@ -1,5 +1,7 @@
+import math
 from typing import List, Tuple
 
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
@@ -9,7 +11,8 @@ from schema.MeasurementModel import MeasurementModel
 from schema.sensor_models import TemporaryVersionTurn, SensorTurnModel, TemporaryRoundabout, \
     TrafficLightModel
 from sensor_analyze.helper.create_sensor_output import create_all_path_sections, create_traffic_lights
-from sensor_analyze.helper.turn_analyzer import TurnCalculatorHeading, TurnCalculatorDistanceHeading
+from sensor_analyze.helper.turn_analyzer import TurnCalculatorHeading, TurnCalculatorDistanceHeading, \
+    TripTurnCalculatorHeading, TripTurnCalculatorDistanceHeading
 from sensor_analyze.roundabout.RoundaboutExtractor import RoundaboutClassifier
 from sensor_analyze.traffic_light.TrafficLightExtractor import TrafficLightExtractor
 from utils.angle_helper import calc_angle_change
@@ -28,12 +31,25 @@ CORNER_CHECK_THRESHOLD = 1.0
 
 USE_TURN_DISTANCE_HEADING = True
 
+# compute distances and directions of the whole trip at once and check corners with window sums instead of processing
+# measurement by measurement; both produce the same turns and trip data frame
+USE_VECTORIZED_PREPROCESSING = True
+
 OVERLAP_EXTRA_RANGE = 1000
 
 
 ######################################################################
 
 
+def check_time_frame_overlap(start_time_roundabout: int, end_time_roundabout: int,
+                             start_time_turn: int, end_time_turn: int) -> bool:
+    """ Check whether the time frames of a recognized roundabout and turn overlaps """
+    return ((start_time_turn > start_time_roundabout - OVERLAP_EXTRA_RANGE) &
+            (start_time_turn < start_time_roundabout + OVERLAP_EXTRA_RANGE)) | \
+           ((end_time_turn > start_time_roundabout - OVERLAP_EXTRA_RANGE) &
+            (end_time_turn < end_time_roundabout + OVERLAP_EXTRA_RANGE))
+
+
 class SensorPreprocessor(object):
     """
     Preprocess raw data by doing following tasks:
@@ -58,8 +74,16 @@ class SensorPreprocessor(object):
 
         self.__all_turns: [TemporaryVersionTurn] = []
         self.__all_measurements: [MeasurementModel] = []
+        # trip data frame of the vectorized preprocessing
+        self.__measurements_df = None
 
     def preprocess(self):
+        if USE_VECTORIZED_PREPROCESSING:
+            self.__preprocess_vectorized()
+        else:
+            self.__preprocess_measurement_by_measurement()
+
+    def __preprocess_measurement_by_measurement(self):
         # distance bridged since last corner check
         current_distance_for_next_corner_check = 0
         # helper variable to find out, when a turn was finished
@@ -87,6 +111,78 @@ class SensorPreprocessor(object):
                                                             self.__last_timestamp,
                                                             iteration[SPEED_COL]))
 
+    def __preprocess_vectorized(self):
+        """
+        Calculate the bridged distances, distances since start and directions of all measurements with cumulative sums
+        in the same order of operations as the measurement by measurement preprocessing. The corners are only checked
+        at the measurements, where the corner check distance is reached, with window sums over all angle changes.
+        """
+        measurements = list(self.__json_iterator)
+        if not measurements:
+            self.__measurements_df = pd.DataFrame.from_records([])
+            return
+
+        timestamps = np.array([measurement[TIME_COL] for measurement in measurements])
+        speeds = np.array([measurement[SPEED_COL] for measurement in measurements], dtype=np.float64)
+        gyro_z_values = np.array([measurement[GYRO_Z_COL] for measurement in measurements], dtype=np.float64)
+
+        last_timestamps = np.concatenate([np.zeros(1, dtype=timestamps.dtype), timestamps[:-1]])
+        passed_times = timestamps - last_timestamps
+        bridged_distances = passed_times / 1000 * speeds
+        distances_since_start = np.cumsum(bridged_distances)
+
+        # like calc_angle_change; only measurements, where the vehicle moved, change the direction
+        is_moving = bridged_distances != 0.0
+        angle_changes = (-gyro_z_values * (180 / math.pi)) * (passed_times / 1000)
+        if is_moving.any():
+            directions = np.cumsum(np.concatenate([[self.__direction], np.where(is_moving, angle_changes, 0.0)]))[1:]
+        else:
+            directions = np.full(len(measurements), self.__direction)
+
+        if USE_TURN_DISTANCE_HEADING:
+            self.__turn_calculator = TripTurnCalculatorDistanceHeading(TIME_ENTER_CORNER_CHECK, SENSOR_DATA_FREQUENCY,
+                                                                       angle_changes[is_moving],
+                                                                       bridged_distances[is_moving])
+        else:
+            self.__turn_calculator = TripTurnCalculatorHeading(TIME_ENTER_CORNER_CHECK, SENSOR_DATA_FREQUENCY,
+                                                               angle_changes[is_moving])
+
+        # the distance for the next corner check starts anew after every check, so the checks are found one by one
+        check_positions = []
+        current_distance_for_next_corner_check = 0
+        for position, bridged_distance in enumerate(bridged_distances.tolist()):
+            current_distance_for_next_corner_check += bridged_distance
+            if current_distance_for_next_corner_check >= CORNER_CHECK_THRESHOLD:
+                check_positions.append(position)
+                current_distance_for_next_corner_check = 0
+        # number of measurements, where the vehicle moved, up to each check
+        buffer_ends = np.cumsum(is_moving)[check_positions]
+
+        is_last_measurement_in_corner = False
+        for position, buffer_end in tqdm(zip(check_positions, buffer_ends.tolist()), total=len(check_positions),
+                                         desc='Preprocess raw data'):
+            self.__turn_calculator.add_measurements_until(buffer_end)
+            # the corner status is checked before the timestamp of the measurement is taken over
+            self.__direction = directions[position].item()
+            self.__last_timestamp = last_timestamps[position].item()
+            is_last_measurement_in_corner = self.__check_corner_status(is_last_measurement_in_corner)
+
+        self.__direction = directions[-1].item()
+        self.__distance_since_start = distances_since_start[-1].item()
+        self.__last_timestamp = timestamps[-1].item()
+
+        # the same columns as MeasurementModel.to_dict of the measurement by measurement preprocessing
+        self.__measurements_df = pd.DataFrame({
+            'gyro_z': [measurement[GYRO_Z_COL] for measurement in measurements],
+            'acc_x': [measurement[ACC_X_COL] for measurement in measurements],
+            'acc_y': [measurement[ACC_Y_COL] for measurement in measurements],
+            'direction': directions,
+            'distance': bridged_distances,
+            'distance_since_start': distances_since_start,
+            'timestamp': [measurement[TIME_COL] for measurement in measurements],
+            'speed': [measurement[SPEED_COL] for measurement in measurements]
+        })
+
     def __check_corner_status(self, is_last_measurement_in_corner: bool):
         # check if a turning maneuver is finished to create a new turn with angle and time frame
         is_currently_in_corner = self.__turn_calculator.is_in_corner()
@@ -122,6 +218,8 @@ class SensorPreprocessor(object):
         return (iteration[TIME_COL] - self.__last_timestamp) / 1000 * iteration[SPEED_COL]
 
     def get_measurements_as_trip_df(self) -> pd.DataFrame:
+        if self.__measurements_df is not None:
+            return self.__measurements_df.copy()
         return pd.DataFrame.from_records([measurement.to_dict() for measurement in self.__all_measurements])
 
     def get_sensor_turns_and_traffic_lights(self) -> Tuple[List[SensorTurnModel], List[TrafficLightModel]]:
@@ -146,19 +244,11 @@ class SensorPreprocessor(object):
         for roundabout in roundabouts:
             # query all temporary turns, that overlap with a roundabout
             turns_to_filter.update([turn for turn in self.__all_turns
-                                    if self.__check_time_frame_overlap(roundabout.start_time, roundabout.end_time,
-                                                                       turn.start_time, turn.end_time)])
+                                    if check_time_frame_overlap(roundabout.start_time, roundabout.end_time,
+                                                                turn.start_time, turn.end_time)])
 
         # remove all turns, that overlap in time with a roundabout
         turns = list(set(self.__all_turns) - turns_to_filter)
         turns.extend(roundabouts)
         turns.sort(key=lambda x: x.start_time)
         return turns
-
-    def __check_time_frame_overlap(self, start_time_roundabout: int, end_time_roundabout: int,
-                                   start_time_turn: int, end_time_turn: int) -> bool:
-        """ Check whether the time frames of a recognized roundabout and turn overlaps """
-        return ((start_time_turn > start_time_roundabout - OVERLAP_EXTRA_RANGE) &
-                (start_time_turn < start_time_roundabout + OVERLAP_EXTRA_RANGE)) | \
-               ((end_time_turn > start_time_roundabout - OVERLAP_EXTRA_RANGE) &
-                (end_time_turn < end_time_roundabout + OVERLAP_EXTRA_RANGE))
@@ -0,0 +1,334 @@
+from collections import deque
+from typing import Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from attack_parameters import TURN_THRESHOLD
+from definitions import TIME_COL, SPEED_COL, GYRO_Z_COL, ACC_X_COL, ACC_Y_COL
+from schema.MeasurementModel import MeasurementModel
+from schema.sensor_models import TemporaryVersionTurn, TemporaryRoundabout, TemporaryTrafficLight, SensorTurnModel, \
+    TrafficLightModel
+from sensor_analyze.helper.create_sensor_output import create_path_section
+from sensor_analyze.helper.turn_analyzer import TurnCalculatorHeading, TurnCalculatorDistanceHeading
+from sensor_analyze.preprocess_trip import SENSOR_DATA_FREQUENCY, TIME_ENTER_CORNER_CHECK, CORNER_CHECK_THRESHOLD, \
+    USE_TURN_DISTANCE_HEADING, OVERLAP_EXTRA_RANGE, check_time_frame_overlap
+from sensor_analyze.roundabout.RoundaboutExtractor import RoundaboutClassifier
+from sensor_analyze.traffic_light.TrafficLightExtractor import TrafficLightExtractor
+from utils.angle_helper import calc_angle_change
+
+"""
+Preprocess a live sensor feed like the SensorPreprocessor does with a complete trip. Measurements are pushed in batches
+with feed() and the finalized path sections and traffic lights are taken with drain_events(). Turns are detected
+measurement by measurement with the same turn calculators and thresholds as the offline path. Roundabouts and traffic
+lights are classified in chunks of the feed, each with some context before and after it, so only measurements within
+STREAM_HORIZON_IN_MS are kept.
+
+A path section is final, once the following path section is known, as its distance after ends at the next turn. A
+traffic light is final, once the path sections around it are known. The distances are differences of the distance since
+start, so they might differ from the offline path by rounding; the classifiers might decide differently close to the
+borders of the chunks.
+"""
+
+######################################################################
+
+# new measurements, after which roundabouts and traffic lights are classified again
+STREAM_CLASSIFICATION_INTERVAL_IN_MS = 30000
+# measurements before and after a chunk, that are classified with it, so sliding windows around its borders are complete;
+# distance based traffic light windows span the whole standing phase, so it has to exceed long red phases
+STREAM_CLASSIFICATION_CONTEXT_IN_MS = 120000
+# measurements kept for the classification and the distances of turns; has to exceed the duration of the longest turn
+STREAM_HORIZON_IN_MS = 300000
+
+
+######################################################################
+
+
+class StreamedTurn(object):
+    """ A turn or roundabout of the feed with the distances since start around its estimated intersection time """
+
+    def __init__(self, turn: TemporaryVersionTurn, distance_before_intersection: float,
+                 distance_until_intersection: float, distance_before_section_time: float):
+        """
+        :param distance_before_intersection: distance since start of the last measurement before the intersection time
+        :param distance_until_intersection: distance since start of the last measurement until the intersection time
+        :param distance_before_section_time: the same before the estimated intersection time of its path section, which
+                                             is truncated to milliseconds; distances to traffic lights start there
+        """
+        self.turn = turn
+        self.distance_before_intersection = distance_before_intersection
+        self.distance_until_intersection = distance_until_intersection
+        self.distance_before_section_time = distance_before_section_time
+
+
+class StreamedTrafficLight(object):
+    def __init__(self, traffic_light: TemporaryTrafficLight, distance_until_start: float):
+        self.traffic_light = traffic_light
+        self.distance_until_start = distance_until_start
+
+
+class StreamingSensorPreprocessor(object):
+    """
+    Push based preprocessing of a live sensor feed:
+    - feed(samples) consumes measurements in the format of the sensor json files as they arrive
+    - drain_events() returns the SensorTurnModels and TrafficLightModels finalized since the last call
+    - finish() finalizes all remaining events at the end of the feed
+    """
+
+    def __init__(self, start_direction: int):
+        self.__direction = start_direction
+        self.__last_timestamp = 0
+        self.__distance_since_start = 0
+        self.__distance_for_next_corner_check = 0
+        self.__is_last_measurement_in_corner = False
+        # timestamp of the corner check, that recognized the current corner
+        self.__corner_start_check_time = None
+
+        if USE_TURN_DISTANCE_HEADING:
+            self.__turn_calculator = TurnCalculatorDistanceHeading(TIME_ENTER_CORNER_CHECK, SENSOR_DATA_FREQUENCY)
+        else:
+            self.__turn_calculator = TurnCalculatorHeading(TIME_ENTER_CORNER_CHECK, SENSOR_DATA_FREQUENCY)
+
+        # classifiers are loaded with the first chunk, as loading the models takes a while
+        self.__roundabout_classifier = None
+        self.__traffic_light_extractor = None
+
+        self.__measurements: deque = deque([])
+        self.__first_timestamp = None
+        # roundabouts and traffic lights starting before this time are classified
+        self.__classified_until = -float('inf')
+
+        self.__pending_turns: [StreamedTurn] = []
+        self.__roundabouts: deque = deque([])
+        self.__pending_traffic_lights: [StreamedTrafficLight] = []
+        # the last path section, whose distance after is unknown yet
+        self.__last_section: Optional[StreamedTurn] = None
+        self.__next_order = 0
+        self.__distance_before = float('inf')
+        # consecutive path sections with their order to match traffic lights to
+        self.__section_pairs: deque = deque([])
+
+        self.__events: [Union[SensorTurnModel, TrafficLightModel]] = []
+        self.__is_finished = False
+
+    def feed(self, samples: Iterable[dict]):
+        """ :param samples: measurements with increasing timestamps like the entries of a sensor json file """
+        if self.__is_finished:
+            raise Exception("Can't feed measurements after finishing the feed.")
+
+        for sample in samples:
+            self.__add_measurement(sample)
+
+            # classify roundabouts and traffic lights, as soon as a chunk has its context after it
+            classify_until = self.__last_timestamp - STREAM_CLASSIFICATION_CONTEXT_IN_MS
+            if classify_until - max(self.__classified_until, self.__first_timestamp) >= \
+                    STREAM_CLASSIFICATION_INTERVAL_IN_MS:
+                self.__classify(classify_until)
+                self.__finalize_events()
+                self.__remove_old_measurements()
+
+    def finish(self):
+        """ finalize all events at the end of the feed; the last path section has no distance after """
+        if self.__is_finished:
+            return
+        self.__is_finished = True
+
+        if self.__measurements and self.__measurements[-1].timestamp >= self.__classified_until:
+            self.__classify(float('inf'))
+        self.__classified_until = float('inf')
+        # like the offline path, a corner, that didn't end before the end of the feed, isn't a turn
+        self.__corner_start_check_time = None
+        self.__finalize_events()
+
+        if self.__last_section is not None:
+            last_turn = self.__last_section.turn
+            self.__events.append(self.__create_path_section(last_turn, float('inf'),
+                                                            last_turn.estimated_intersection_time))
+            self.__last_section = None
+        self.__match_traffic_lights()
+        self.__pending_traffic_lights = []
+        self.__measurements.clear()
+
+    def drain_events(self) -> List[Union[SensorTurnModel, TrafficLightModel]]:
+        """ path sections and traffic lights finalized since the last call in the order they were finalized """
+        events = self.__events
+        self.__events = []
+        return events
+
+    def __add_measurement(self, sample: dict):
+        """ the preprocessing of the SensorPreprocessor for a single measurement """
+        bridged_distance = (sample[TIME_COL] - self.__last_timestamp) / 1000 * sample[SPEED_COL]
+        self.__distance_since_start += bridged_distance
+        self.__distance_for_next_corner_check += bridged_distance
+
+        if bridged_distance != 0.0:
+            angle = calc_angle_change(gyro_z=sample[GYRO_Z_COL], time=sample[TIME_COL] - self.__last_timestamp)
+            self.__direction += angle
+            self.__turn_calculator.add_measurement(angle, bridged_distance)
+
+        if self.__distance_for_next_corner_check >= CORNER_CHECK_THRESHOLD:
+            self.__check_corner_status()
+            self.__distance_for_next_corner_check = 0
+
+        self.__last_timestamp = sample[TIME_COL]
+        if self.__first_timestamp is None:
+            self.__first_timestamp = self.__last_timestamp
+        self.__measurements.append(MeasurementModel(sample[GYRO_Z_COL], sample[ACC_X_COL], sample[ACC_Y_COL],
+                                                    self.__direction, bridged_distance, self.__distance_since_start,
+                                                    self.__last_timestamp, sample[SPEED_COL]))
+
+    def __check_corner_status(self):
+        is_currently_in_corner = self.__turn_calculator.is_in_corner()
+
+        if self.__is_last_measurement_in_corner and not is_currently_in_corner:
+            angle, time_in_turn = self.__turn_calculator.calc_angle_and_clear_buffer()
+            self.__corner_start_check_time = None
+
+            if angle > TURN_THRESHOLD or angle < -TURN_THRESHOLD:
+                turn = TemporaryVersionTurn(direction_before=self.__direction - angle,
+                                            direction_after=self.__direction,
+                                            angle=angle,
+                                            start_time=self.__last_timestamp - time_in_turn,
+                                            end_time=self.__last_timestamp)
+                self.__pending_turns.append(self.__create_streamed_turn(turn))
+        elif is_currently_in_corner and not self.__is_last_measurement_in_corner:
+            self.__corner_start_check_time = self.__last_timestamp
+        self.__is_last_measurement_in_corner = is_currently_in_corner
+
+    def __get_distance_since_start(self, timestamp: float, is_inclusive: bool) -> float:
+        """ distance since start of the last kept measurement before or until the timestamp """
+        timestamps = np.array([measurement.timestamp for measurement in self.__measurements])
+        position = np.searchsorted(timestamps, timestamp, side='right' if is_inclusive else 'left')
+        if position == 0:
+            first_measurement = self.__measurements[0]
+            return first_measurement.distance_since_start - first_measurement.bridged_distance
+        return self.__measurements[position - 1].distance_since_start
+
+    def __create_streamed_turn(self, turn: TemporaryVersionTurn) -> StreamedTurn:
+        return StreamedTurn(turn, self.__get_distance_since_start(turn.estimated_intersection_time, False),
+                            self.__get_distance_since_start(turn.estimated_intersection_time, True),
+                            self.__get_distance_since_start(int(turn.estimated_intersection_time), False))
+
+    def __classify(self, classify_until: float):
+        """ classify the roundabouts and traffic lights starting from the last classified time until classify_until """
+        chunk_start = self.__classified_until - STREAM_CLASSIFICATION_CONTEXT_IN_MS
+        trip_df = pd.DataFrame.from_records([measurement.to_dict() for measurement in self.__measurements
+                                             if measurement.timestamp >= chunk_start])
+
+        if self.__roundabout_classifier is None:
+            self.__roundabout_classifier = RoundaboutClassifier(trip_df)
+            self.__traffic_light_extractor = TrafficLightExtractor(trip_df)
+        self.__roundabout_classifier.trip_df = trip_df
+        self.__traffic_light_extractor.trips_df = trip_df
+
+        for roundabout in self.__roundabout_classifier.find_roundabouts():
+            if self.__classified_until <= roundabout.start_time < classify_until:
+                self.__roundabouts.append(roundabout)
+                self.__pending_turns.append(self.__create_streamed_turn(roundabout))
+        for traffic_light in self.__traffic_light_extractor.find_traffic_lights():
+            if self.__classified_until <= traffic_light.start_time < classify_until:
+                self.__pending_traffic_lights.append(
+                    StreamedTrafficLight(traffic_light, self.__get_distance_since_start(traffic_light.start_time,
+                                                                                        True)))
+        self.__classified_until = classify_until
+
+    def __finalize_events(self):
+        """ append all turns and roundabouts to the path sections, before which no other one can be found anymore """
+        # all roundabouts overlapping with a turn are known, once the turn ended before the classified time
+        release_until = self.__classified_until - OVERLAP_EXTRA_RANGE
+        if self.__corner_start_check_time is not None:
+            # the turn of the current corner starts at most the enter corner time window before it was recognized
+            release_until = min(release_until, self.__corner_start_check_time - TIME_ENTER_CORNER_CHECK * 1000)
+
+        self.__pending_turns.sort(key=lambda x: x.turn.start_time)
+        while self.__pending_turns and self.__pending_turns[0].turn.start_time < release_until:
+            streamed_turn = self.__pending_turns[0]
+            turn = streamed_turn.turn
+            if not isinstance(turn, TemporaryRoundabout) and \
+                    turn.end_time + OVERLAP_EXTRA_RANGE > self.__classified_until:
+                break
+            self.__pending_turns.pop(0)
+
+            # like the offline path, turns overlapping in time with a roundabout are removed
+            if isinstance(turn, TemporaryRoundabout) or \
+                    not any(check_time_frame_overlap(roundabout.start_time, roundabout.end_time,
+                                                     turn.start_time, turn.end_time)
+                            for roundabout in self.__roundabouts):
+                self.__append_path_section(streamed_turn)
+
+        self.__match_traffic_lights()
+        self.__remove_unmatchable_traffic_lights(release_until)
+
+    def __append_path_section(self, streamed_turn: StreamedTurn):
+        """ finalize the last path section, as its distance after ends at the intersection of the appended one """
+        if self.__last_section is not None:
+            distance_after = streamed_turn.distance_until_intersection - \
+                             self.__last_section.distance_before_intersection
+            last_turn = self.__last_section.turn
+            self.__events.append(self.__create_path_section(last_turn, distance_after,
+                                                            int(last_turn.estimated_intersection_time)))
+            self.__section_pairs.append((self.__last_section, self.__next_order - 1, streamed_turn,
+                                         self.__next_order))
+            self.__distance_before = distance_after
+        self.__last_section = streamed_turn
+        self.__next_order += 1
+
+    def __create_path_section(self, turn: TemporaryVersionTurn, distance_after: float,
+                              estimated_intersection_time) -> SensorTurnModel:
+        return create_path_section(is_roundabout=isinstance(turn, TemporaryRoundabout),
+                                   order=self.__next_order - 1,
+                                   angle=turn.angle,
+                                   direction_before=turn.direction_before,
+                                   direction_after=turn.direction_after,
+                                   distance_before=self.__distance_before,
+                                   distance_after=distance_after,
+                                   estimated_intersection_time=estimated_intersection_time,
+                                   turn_start=turn.start_time,
+                                   turn_end=turn.end_time)
+
+    def __match_traffic_lights(self):
+        """
+        Like create_traffic_lights, a traffic light belongs to the first pair of path sections around it. A pair is
+        matched, once all traffic lights until its end are classified.
+        """
+        while self.__section_pairs and self.__section_pairs[0][2].turn.end_time <= self.__classified_until:
+            section_a, order_a, section_b, order_b = self.__section_pairs.popleft()
+            turn_a, turn_b = section_a.turn, section_b.turn
+
+            remaining_traffic_lights = []
+            for streamed_traffic_light in self.__pending_traffic_lights:
+                traffic_light = streamed_traffic_light.traffic_light
+                if turn_a.start_time < traffic_light.start_time < turn_b.end_time:
+                    distance_to_traffic_light = streamed_traffic_light.distance_until_start - \
+                                                section_a.distance_before_section_time
+                    self.__events.append(TrafficLightModel(start_turn=order_a,
+                                                           end_turn=order_b,
+                                                           distance_after_start_turn=distance_to_traffic_light,
+                                                           start_time=traffic_light.start_time,
+                                                           end_time=traffic_light.end_time))
+                elif traffic_light.start_time > turn_a.start_time:
+                    # traffic lights before the pair can't belong to any following pair
+                    remaining_traffic_lights.append(streamed_traffic_light)
+            self.__pending_traffic_lights = remaining_traffic_lights
+
+    def __remove_unmatchable_traffic_lights(self, release_until: float):
+        """ traffic lights starting before the first path section of all following pairs can't be matched anymore """
+        if self.__section_pairs:
+            return
+        if self.__last_section is not None:
+            first_section_start = self.__last_section.turn.start_time
+        else:
+            first_section_start = min([release_until] + [streamed_turn.turn.start_time
+                                                          for streamed_turn in self.__pending_turns])
+        self.__pending_traffic_lights = [streamed_traffic_light for streamed_traffic_light
+                                         in self.__pending_traffic_lights
+                                         if streamed_traffic_light.traffic_light.start_time > first_section_start]
+
+    def __remove_old_measurements(self):
+        """ keep the measurements of the horizon and the context before the next chunk to classify """
+        keep_from = min(self.__last_timestamp - STREAM_HORIZON_IN_MS,
+                        self.__classified_until - STREAM_CLASSIFICATION_CONTEXT_IN_MS)
+        while self.__measurements and self.__measurements[0].timestamp < keep_from:
+            self.__measurements.popleft()
+        while self.__roundabouts and self.__roundabouts[0].end_time < keep_from:
+            self.__roundabouts.popleft()
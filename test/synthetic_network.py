@@ -0,0 +1,186 @@
+import math
+import random
+
+import pandas as pd
+
+from utils.network_bundle import NetworkBundle
+
+"""
+Generate a small synthetic osm file for the equivalence checks of the street network build, so these run without an
+osm export. The streets form a grid of curved, partly oneway streets with traffic lights and dead ends of different
+road classes, optionally with a roundabout next to the grid.
+Street networks built in different ways number their segments and nodes differently, so they are compared by the osm
+ids of their segments and intersections.
+"""
+
+######################################################################
+
+GRID_ORIGIN = (49.0, 12.1)
+# distance of adjacent grid intersections in degrees
+GRID_SPACING = (0.0012, 0.0018)
+GRID_JITTER = 1e-4
+
+FIRST_NODE_ID = 1001
+FIRST_WAY_ID = 5001
+
+STREET_CLASSES = ['residential', 'primary', 'secondary', 'service', 'tertiary', 'unclassified', 'driveway']
+MAX_SPEEDS = ['30', '50', 'none', '70']
+
+
+######################################################################
+
+
+class SyntheticOsmFile(object):
+    """ Collects nodes and ways with ascending ids and writes them as an .osm file """
+
+    def __init__(self):
+        self.nodes = []
+        self.ways = []
+
+    def add_node(self, lat: float, lng: float, tags: dict = None) -> int:
+        node_id = FIRST_NODE_ID + len(self.nodes)
+        self.nodes.append((node_id, lat, lng, tags or {}))
+        return node_id
+
+    def add_way(self, node_ids: [int], tags: dict):
+        self.ways.append((FIRST_WAY_ID + len(self.ways), node_ids, tags))
+
+    def get_location(self, node_id: int) -> (float, float):
+        _, lat, lng, _ = self.nodes[node_id - FIRST_NODE_ID]
+        return lat, lng
+
+    def add_nodes_between(self, start_id: int, end_id: int, count: int, curve: float) -> [int]:
+        """ nodes between two nodes, that are shifted by up to curve degrees to bend the street """
+        (start_lat, start_lng), (end_lat, end_lng) = self.get_location(start_id), self.get_location(end_id)
+        node_ids = []
+        for position in range(1, count + 1):
+            fraction = position / (count + 1)
+            offset = curve * (1 - (2 * fraction - 1) ** 2)
+            node_ids.append(self.add_node(start_lat + (end_lat - start_lat) * fraction + offset,
+                                          start_lng + (end_lng - start_lng) * fraction + offset))
+        return node_ids
+
+    def write(self, file_path: str):
+        with open(file_path, 'w', encoding='utf-8') as osm_file:
+            osm_file.write("<?xml version='1.0' encoding='UTF-8'?>\n<osm version='0.6' generator='daroute'>\n")
+            for node_id, lat, lng, tags in self.nodes:
+                osm_file.write(" <node id='%d' version='1' lat='%.7f' lon='%.7f'>\n" % (node_id, lat, lng))
+                write_tags(osm_file, tags)
+                osm_file.write(" </node>\n")
+            for way_id, node_ids, tags in self.ways:
+                osm_file.write(" <way id='%d' version='1'>\n" % way_id)
+                for node_id in node_ids:
+                    osm_file.write("  <nd ref='%d'/>\n" % node_id)
+                write_tags(osm_file, tags)
+                osm_file.write(" </way>\n")
+            osm_file.write("</osm>\n")
+
+
+def write_tags(osm_file, tags: dict):
+    for key, value in tags.items():
+        osm_file.write("  <tag k='%s' v='%s'/>\n" % (key, value))
+
+
+def add_roundabout(osm: SyntheticOsmFile, grid: dict):
+    """ a roundabout south west of the grid with four connecting streets, one of them leading to the grid """
+    center_lat, center_lng = GRID_ORIGIN[0] - 0.002, GRID_ORIGIN[1] - 0.002
+    ring = [osm.add_node(center_lat + 1.5e-4 * math.cos(step * math.pi / 4),
+                         center_lng + 2.2e-4 * math.sin(step * math.pi / 4)) for step in range(8)]
+    osm.add_way(ring[:5], {'highway': 'primary', 'junction': 'roundabout', 'oneway': 'yes'})
+    osm.add_way(ring[4:] + [ring[0]], {'highway': 'primary', 'junction': 'roundabout', 'oneway': 'yes'})
+    osm.add_way([ring[2], grid[0, 0]], {'highway': 'primary'})
+    osm.add_way([ring[6], osm.add_node(center_lat - 1e-3, center_lng - 2e-4)], {'highway': 'secondary'})
+    osm.add_way([ring[0], osm.add_node(center_lat + 2e-4, center_lng + 1.5e-3), grid[0, 2]], {'highway': 'tertiary'})
+    osm.add_way([osm.add_node(center_lat - 5e-4, center_lng + 1e-3), ring[4]], {'highway': 'residential'})
+
+
+def write_synthetic_osm_file(file_path: str, grid_size: int = 8, with_roundabout: bool = True,
+                             seed: int = 7) -> SyntheticOsmFile:
+    """
+    Write the synthetic street network to an .osm file
+    :param grid_size: number of streets in each direction
+    :param with_roundabout: add a roundabout, otherwise the network contains no roundabout
+    :param seed: the same seed creates the same osm file
+    :return: the nodes and ways of the osm file, e.g. to create changes of it
+    """
+    rand = random.Random(seed)
+    osm = SyntheticOsmFile()
+
+    grid = dict()
+    for row in range(grid_size):
+        for col in range(grid_size):
+            tags = {'highway': 'traffic_signals'} if (row * grid_size + col) % 7 == 3 else None
+            lat = GRID_ORIGIN[0] + row * GRID_SPACING[0] + rand.uniform(-GRID_JITTER, GRID_JITTER)
+            lng = GRID_ORIGIN[1] + col * GRID_SPACING[1] + rand.uniform(-GRID_JITTER, GRID_JITTER)
+            grid[row, col] = osm.add_node(lat, lng, tags)
+
+    # streets from west to east
+    for row in range(grid_size):
+        node_ids = [grid[row, 0]]
+        for col in range(1, grid_size):
+            node_ids += osm.add_nodes_between(grid[row, col - 1], grid[row, col], rand.choice([0, 0, 1, 2, 4]),
+                                              rand.choice([0, 0, 3e-4, -4e-4]))
+            node_ids.append(grid[row, col])
+        tags = {'highway': STREET_CLASSES[row % len(STREET_CLASSES)], 'name': 'H%d' % row,
+                'maxspeed': rand.choice(MAX_SPEEDS)}
+        if row % 4 == 1:
+            tags['oneway'] = 'yes'
+        osm.add_way(node_ids, tags)
+
+    # streets from south to north, each split into two ways
+    for col in range(grid_size):
+        for rows in (range(0, grid_size // 2 + 1), range(grid_size // 2, grid_size)):
+            node_ids = [grid[rows[0], col]]
+            for row in rows[1:]:
+                node_ids += osm.add_nodes_between(grid[row - 1, col], grid[row, col], rand.choice([0, 1, 3]),
+                                                  rand.choice([0, 2e-4]))
+                node_ids.append(grid[row, col])
+            tags = {'highway': STREET_CLASSES[(col + 2) % len(STREET_CLASSES)], 'ref': 'V%d' % col}
+            if col % 5 == 2:
+                tags['oneway'] = 'yes'
+            osm.add_way(node_ids, tags)
+
+    # dead ends at the eastern border
+    for row in range(0, grid_size, 2):
+        lat, lng = osm.get_location(grid[row, grid_size - 1])
+        osm.add_way([grid[row, grid_size - 1], osm.add_node(lat + 1e-4, lng + 6e-4),
+                     osm.add_node(lat + 3e-4, lng + 1.2e-3)], {'highway': 'residential'})
+
+    if with_roundabout:
+        add_roundabout(osm, grid)
+
+    # ways, that aren't streets
+    osm.add_way([grid[1, 1], osm.add_node(GRID_ORIGIN[0], GRID_ORIGIN[1] + 1e-3), grid[2, 2]], {'highway': 'footway'})
+    osm.add_way([grid[2, 3], osm.add_node(GRID_ORIGIN[0] + 0.003, GRID_ORIGIN[1] + 0.004)],
+                {'highway': 'construction'})
+
+    osm.write(file_path)
+    return osm
+
+
+def get_grid_bbox(grid_size: int = 8) -> (float, float, float, float):
+    """ (min_lat, min_lng, max_lat, max_lng) around the grid of the synthetic street network """
+    return (GRID_ORIGIN[0] - 0.003, GRID_ORIGIN[1] - 0.003,
+            GRID_ORIGIN[0] + grid_size * GRID_SPACING[0], GRID_ORIGIN[1] + grid_size * GRID_SPACING[1])
+
+
+def get_comparable_turns(network: NetworkBundle) -> pd.DataFrame:
+    """ the turns of a network with segments and intersections replaced by their osm ids in a fixed order """
+    turns_df = network.turns_df.copy()
+    segment_to_osm_ids = network.segment_to_osm_ids
+    turns_df['start_osm_ids'] = [tuple(segment_to_osm_ids[segment_id]) for segment_id in turns_df['segment_start_id']]
+    turns_df['target_osm_ids'] = [tuple(segment_to_osm_ids[segment_id])
+                                  for segment_id in turns_df['segment_target_id']]
+    turns_df['intersection_osm_id'] = [network.node_id_to_osm_id[node_id] for node_id in turns_df['intersection_id']]
+    turns_df = turns_df.drop(columns=['segment_start_id', 'segment_target_id', 'intersection_id'])
+    return turns_df.sort_values(['start_osm_ids', 'target_osm_ids', 'intersection_osm_id', 'is_roundabout',
+                                 'is_segment_skipping', 'angle']).reset_index(drop=True)
+
+
+def get_comparable_segments(network: NetworkBundle) -> pd.DataFrame:
+    """ the road segments of a network indexed by the osm ids of their nodes in a fixed order """
+    segments_df = network.segments_df.copy()
+    segments_df['start_id'] = [network.node_id_to_osm_id[node_id] for node_id in segments_df['start_id']]
+    segments_df['end_id'] = [network.node_id_to_osm_id[node_id] for node_id in segments_df['end_id']]
+    segments_df.index = [tuple(network.segment_to_osm_ids[segment_id]) for segment_id in segments_df.index]
+    return segments_df.sort_index()
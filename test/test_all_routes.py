@@ -1,6 +1,5 @@
 import logging
 import os
-import pickle
 import timeit
 import unittest
 from datetime import datetime
@@ -12,7 +11,6 @@ from attack_parameters import TURN_THRESHOLD, STRAIGHT_DRIVE_THRESHOLD, TURN_ANG
     DISTANCE_ERROR_TOLERANCE, MAGNETOMETER_DIRECTION_ERROR, ROAD_WIDTH_THRESHOLD, DISTANCE_WEIGHT, ANGLE_WEIGHT, \
     HEADING_CHANGE_WEIGHT, CURVATURE_WEIGHT, TRAFFIC_LIGHT_WEIGHT, TOLERANCE_STANDING_BEFORE_TRAFFIC_LIGHT, \
     TRAFFIC_LIGHT_MAX_SPEED_LIMIT, MAX_HEADING_CHANGE_DEVIATION
-from definitions import NODE_ID_COL_NAME, OSM_ID_COL_NAME
 from schema.RouteCandidateModel import RouteCandidateModel
 from schema.RouteTestResultModel import RouteTestResultModel
 from schema.TestRouteModel import TestRouteModel
@@ -23,6 +21,7 @@ from test.settings import TEST_RESULT_TARGET_DIR, \
 from trajectory_attack.create_route_candidates import RouteCandidateCreator
 from trajectory_attack.rank_route_candidates import get_ranked_route_candidates_with_filtered
 from utils import log
+from utils.network_bundle import NETWORK_BUNDLE_PATH, load_network_bundle
 from utils.test_utils import run_evaluation, get_total_distance
 
 
@@ -41,12 +40,12 @@ class TestRouteCandidates(unittest.TestCase):
             os.makedirs(TEST_RESULT_TARGET_DIR)
 
         # Load database information
-        cls.turns_df = pd.read_csv(AREA_TARGET_PATH + "/db/turns_df.csv")
-        cls.nodes_df = pd.read_csv(AREA_TARGET_PATH + "/csv/nodes.csv")
-        cls.node_id_to_osm_id = cls.nodes_df.set_index(NODE_ID_COL_NAME)[OSM_ID_COL_NAME].to_dict()
-        cls.segments_df = pd.read_csv(AREA_TARGET_PATH + "/db/road_segments_df.csv")
-        with open(AREA_TARGET_PATH + '/db/segment_to_osm_ids.pickle', 'rb') as dump_file:
-            cls.segment_to_osm_path = pickle.load(dump_file)
+        network = load_network_bundle(AREA_TARGET_PATH + NETWORK_BUNDLE_PATH)
+        cls.turns_df = network.turns_df
+        cls.nodes_df = network.nodes_df
+        cls.node_id_to_osm_id = network.node_id_to_osm_id
+        cls.segments_df = network.segments_df
+        cls.segment_to_osm_path = network.segment_to_osm_ids
 
         # Init logger
         log.setup(log_filename=LOG_TARGET_DIR + "test_routes_" + cls.test_run_start + ".log")
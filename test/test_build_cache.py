@@ -0,0 +1,91 @@
+import glob
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import attack_framework.create_street_network as create_street_network_module
+from attack_framework.create_street_network import create_street_network, BUILD_CACHE_DIR, PARSE_STAGE, \
+    SHORT_SEGMENT_TURNS_STAGE
+from graph_preparation import database_parameters
+from graph_preparation.helper import create_turns_over_multiple_segments
+from test.synthetic_network import write_synthetic_osm_file
+from utils.network_bundle import NETWORK_BUNDLE_PATH, load_network_bundle
+
+"""
+Check, that the street network built with the cache of the build stages equals the network built without it, and that
+a rerun only repeats the stages, whose parameters changed.
+"""
+
+######################################################################
+
+OSM_FILE_NAME = '/synthetic.osm'
+# changes the turns over short segments of the synthetic street network
+CHANGED_SHORT_SEGMENT_TURN_THRESHOLD = 30.0
+
+
+######################################################################
+
+
+class TestBuildCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.osm_file = self.temp_dir.name + OSM_FILE_NAME
+        write_synthetic_osm_file(self.osm_file)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def build(self, target_dir: str, use_build_cache: bool):
+        with mock.patch.object(create_street_network_module, 'USE_BUILD_CACHE', use_build_cache):
+            create_street_network(self.osm_file, target_dir)
+        return load_network_bundle(target_dir + NETWORK_BUNDLE_PATH)
+
+    def get_cache_files(self, target_dir: str, stage_name: str = '*') -> [str]:
+        return sorted(glob.glob(os.path.join(target_dir + BUILD_CACHE_DIR, stage_name, '*')))
+
+    def assert_networks_equal(self, network, other_network):
+        pd.testing.assert_frame_equal(network.turns_df, other_network.turns_df)
+        pd.testing.assert_frame_equal(network.segments_df, other_network.segments_df)
+        pd.testing.assert_frame_equal(network.nodes_df, other_network.nodes_df)
+        self.assertEqual(dict(network.segment_to_osm_ids), dict(other_network.segment_to_osm_ids))
+
+    def test_cached_build_equals_uncached_build(self):
+        cached_dir = self.temp_dir.name + '/cached'
+        cached_network = self.build(cached_dir, True)
+        self.assert_networks_equal(self.build(self.temp_dir.name + '/uncached', False), cached_network)
+
+        # a rerun loads every stage from the cache without parsing the osm file again
+        cache_files = self.get_cache_files(cached_dir)
+        with mock.patch.object(create_street_network_module, 'parse_osm_file', side_effect=AssertionError):
+            rerun_network = self.build(cached_dir, True)
+        self.assertEqual(cache_files, self.get_cache_files(cached_dir))
+        self.assert_networks_equal(cached_network, rerun_network)
+
+    def test_changed_parameter_only_reruns_its_stage(self):
+        cached_dir = self.temp_dir.name + '/cached'
+        network = self.build(cached_dir, True)
+        cache_files = self.get_cache_files(cached_dir)
+
+        with mock.patch.object(database_parameters, 'SHORT_SEGMENT_TURN_THRESHOLD',
+                               CHANGED_SHORT_SEGMENT_TURN_THRESHOLD), \
+                mock.patch.object(create_turns_over_multiple_segments, 'SHORT_SEGMENT_TURN_THRESHOLD',
+                                  CHANGED_SHORT_SEGMENT_TURN_THRESHOLD):
+            with mock.patch.object(create_street_network_module, 'parse_osm_file', side_effect=AssertionError):
+                cached_network = self.build(cached_dir, True)
+            uncached_network = self.build(self.temp_dir.name + '/uncached', False)
+
+        # the turns over short segments are created anew, all other stages are loaded from the cache
+        new_cache_files = sorted(set(self.get_cache_files(cached_dir)) - set(cache_files))
+        self.assertEqual([SHORT_SEGMENT_TURNS_STAGE],
+                         [os.path.basename(os.path.dirname(cache_file)) for cache_file in new_cache_files])
+        self.assertEqual(len(self.get_cache_files(cached_dir, PARSE_STAGE)), 1)
+        self.assert_networks_equal(uncached_network, cached_network)
+        self.assertNotEqual(len(network.turns_df), len(cached_network.turns_df))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import tempfile
+import unittest
+
+import pandas as pd
+
+from attack_framework.create_street_network import create_street_network
+from attack_framework.update_street_network import update_street_network
+from osm_to_csv.osm_handler import apply_osm_changes
+from test.synthetic_network import write_synthetic_osm_file, get_comparable_turns, get_comparable_segments, \
+    FIRST_NODE_ID, FIRST_WAY_ID
+from utils.network_bundle import NETWORK_BUNDLE_PATH, load_network_bundle
+
+"""
+Check, that updating a street network with an osm change file equals building the network of the updated osm file anew,
+and that the road segments away from the changes keep their ids.
+"""
+
+######################################################################
+
+OSM_FILE_NAME = '/synthetic.osm'
+CHANGE_FILE_NAME = '/changes.osc'
+UPDATED_OSM_FILE_NAME = '/synthetic_updated.osm'
+
+# the changes of the synthetic street network: a moved intersection, a new traffic light, a new and a deleted street
+MOVED_NODE_ID = FIRST_NODE_ID + 9
+MOVED_NODE_LOCATION = (49.0013, 12.1020)
+TRAFFIC_LIGHT_NODE_ID = FIRST_NODE_ID + 19
+CREATED_WAY_ID = 9001
+CREATED_WAY_NODE_IDS = [FIRST_NODE_ID, MOVED_NODE_ID]
+DELETED_WAY_ID = FIRST_WAY_ID + 2
+
+
+######################################################################
+
+
+class TestNetworkUpdate(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.osm_file = self.temp_dir.name + OSM_FILE_NAME
+        self.osm = write_synthetic_osm_file(self.osm_file)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def write_change_file(self) -> str:
+        change_file = self.temp_dir.name + CHANGE_FILE_NAME
+        traffic_light_lat, traffic_light_lng = self.osm.get_location(TRAFFIC_LIGHT_NODE_ID)
+        with open(change_file, 'w', encoding='utf-8') as osc_file:
+            osc_file.write("<?xml version='1.0' encoding='UTF-8'?>\n<osmChange version='0.6'>\n <modify>\n")
+            osc_file.write("  <node id='%d' version='2' lat='%.7f' lon='%.7f'/>\n"
+                           % ((MOVED_NODE_ID,) + MOVED_NODE_LOCATION))
+            osc_file.write("  <node id='%d' version='2' lat='%.7f' lon='%.7f'>"
+                           "<tag k='highway' v='traffic_signals'/></node>\n"
+                           % (TRAFFIC_LIGHT_NODE_ID, traffic_light_lat, traffic_light_lng))
+            osc_file.write(" </modify>\n <create>\n  <way id='%d' version='1'>" % CREATED_WAY_ID)
+            osc_file.write("".join("<nd ref='%d'/>" % node_id for node_id in CREATED_WAY_NODE_IDS))
+            osc_file.write("<tag k='highway' v='residential'/></way>\n </create>\n")
+            osc_file.write(" <delete>\n  <way id='%d' version='2'/>\n </delete>\n</osmChange>\n" % DELETED_WAY_ID)
+        return change_file
+
+    def get_changed_osm_ids(self) -> set:
+        """ the osm ids of all nodes, that were changed or are part of a changed way """
+        deleted_way_node_ids = [node_ids for way_id, node_ids, _ in self.osm.ways if way_id == DELETED_WAY_ID][0]
+        return {MOVED_NODE_ID, TRAFFIC_LIGHT_NODE_ID} | set(CREATED_WAY_NODE_IDS) | set(deleted_way_node_ids)
+
+    def test_updated_network_equals_new_build(self):
+        target_dir = self.temp_dir.name + '/network'
+        create_street_network(self.osm_file, target_dir)
+        previous_network = load_network_bundle(target_dir + NETWORK_BUNDLE_PATH)
+        previous_segments = {segment_id: tuple(osm_ids)
+                             for segment_id, osm_ids in previous_network.segment_to_osm_ids.items()}
+
+        updated_osm_file = self.temp_dir.name + UPDATED_OSM_FILE_NAME
+        update_street_network(self.osm_file, [self.write_change_file()], updated_osm_file, target_dir)
+        updated_network = load_network_bundle(target_dir + NETWORK_BUNDLE_PATH)
+
+        new_build_dir = self.temp_dir.name + '/new_build'
+        create_street_network(updated_osm_file, new_build_dir)
+        new_network = load_network_bundle(new_build_dir + NETWORK_BUNDLE_PATH)
+
+        self.assertNotEqual(len(previous_network.turns_df), len(updated_network.turns_df))
+        pd.testing.assert_frame_equal(get_comparable_turns(new_network), get_comparable_turns(updated_network))
+        pd.testing.assert_frame_equal(get_comparable_segments(new_network), get_comparable_segments(updated_network))
+
+        # the road segments without changed nodes keep their ids
+        changed_osm_ids = self.get_changed_osm_ids()
+        unchanged_segments = {segment_id: osm_ids for segment_id, osm_ids in previous_segments.items()
+                              if not changed_osm_ids.intersection(osm_ids)}
+        self.assertGreater(len(unchanged_segments), len(previous_segments) / 2)
+        for segment_id, osm_ids in unchanged_segments.items():
+            self.assertEqual(osm_ids, tuple(updated_network.segment_to_osm_ids[segment_id]))
+
+    def test_changes_are_not_applied_to_the_read_osm_file(self):
+        with self.assertRaises(Exception):
+            apply_osm_changes(self.osm_file, [self.write_change_file()], self.osm_file)
+        with open(self.osm_file, encoding='utf-8') as osm_file:
+            self.assertIn("<way id='%d'" % DELETED_WAY_ID, osm_file.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import glob
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import sensor_analyze.preprocess_trip as preprocess_trip_module
+from definitions import TIME_COL, SPEED_COL, GYRO_Z_COL, ACC_X_COL, ACC_Y_COL
+from sensor_analyze.preprocess_trip import SensorPreprocessor
+from test.settings import SAMPLES_DIRECTORY
+
+"""
+Check, that the vectorized preprocessing of a trip finds the same turns and creates the same trip data frame as the
+preprocessing measurement by measurement, for the recorded trips and for random trips with standstills, integer
+measurements and turns.
+"""
+
+######################################################################
+
+START_DIRECTION = 90
+SEED = 1
+# (number of measurements, kind of trip) of the random trips
+RANDOM_TRIPS = [(0, 'float'), (1, 'float'), (5000, 'float'), (3000, 'standing'), (20000, 'integer'),
+                (50000, 'turns')]
+
+
+######################################################################
+
+
+def create_random_trip(rand: np.random.Generator, num_measurements: int, kind: str) -> [dict]:
+    timestamps = np.cumsum(rand.integers(30, 50, num_measurements)) + 1000
+    speeds = np.where(rand.random(num_measurements) < 0.2, 0.0, rand.uniform(0.0, 15.0, num_measurements))
+    gyro_z_values = rand.normal(0.0, 0.3, num_measurements)
+    if kind == 'standing':
+        speeds = np.zeros(num_measurements, dtype=int)
+    elif kind == 'integer':
+        speeds = rand.integers(0, 3, num_measurements)
+        gyro_z_values = rand.integers(-1, 2, num_measurements)
+    elif kind == 'turns':
+        # turns of a few seconds with a constant yaw rate between driving straight
+        num_phases = num_measurements // 100 + 1
+        yaw_rates = rand.uniform(-0.5, 0.5, num_phases) * (rand.random(num_phases) < 0.4)
+        gyro_z_values = np.repeat(yaw_rates, 100)[:num_measurements] + rand.normal(0.0, 0.02, num_measurements)
+    return [{TIME_COL: timestamp, SPEED_COL: speed, GYRO_Z_COL: gyro_z, ACC_X_COL: 0.1, ACC_Y_COL: 0.2}
+            for timestamp, speed, gyro_z in zip(timestamps.tolist(), speeds.tolist(), gyro_z_values.tolist())]
+
+
+def preprocess(file_path: str, use_vectorized_preprocessing: bool) -> ([tuple], pd.DataFrame):
+    with mock.patch.object(preprocess_trip_module, 'USE_VECTORIZED_PREPROCESSING', use_vectorized_preprocessing):
+        sensor_preprocessor = SensorPreprocessor(file_path, START_DIRECTION)
+        sensor_preprocessor.preprocess()
+    # the turns before they are aggregated with roundabouts and traffic lights by the classifiers
+    turns = [(turn.direction_before, turn.direction_after, turn.angle, turn.start_time, turn.end_time, type(turn.angle))
+             for turn in sensor_preprocessor._SensorPreprocessor__all_turns]
+    return turns, sensor_preprocessor.get_measurements_as_trip_df()
+
+
+class TestPreprocessTrip(unittest.TestCase):
+
+    def assert_preprocessing_equal(self, file_path: str):
+        for use_turn_distance_heading in [True, False]:
+            with self.subTest(file_path=os.path.basename(os.path.dirname(file_path)),
+                              use_turn_distance_heading=use_turn_distance_heading), \
+                    mock.patch.object(preprocess_trip_module, 'USE_TURN_DISTANCE_HEADING', use_turn_distance_heading):
+                turns, trip_df = preprocess(file_path, False)
+                vectorized_turns, vectorized_trip_df = preprocess(file_path, True)
+                self.assertEqual(turns, vectorized_turns)
+                pd.testing.assert_frame_equal(trip_df, vectorized_trip_df, check_exact=True)
+
+    def test_recorded_trips(self):
+        file_paths = sorted(glob.glob(SAMPLES_DIRECTORY + '/*/Route_Sensor.json'))
+        if not file_paths:
+            self.skipTest("No recorded trips in %s." % SAMPLES_DIRECTORY)
+        for file_path in file_paths:
+            self.assert_preprocessing_equal(file_path)
+
+    def test_random_trips(self):
+        rand = np.random.default_rng(SEED)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for trip_index, (num_measurements, kind) in enumerate(RANDOM_TRIPS):
+                file_path = '%s/trip_%d/Route_Sensor.json' % (temp_dir, trip_index)
+                os.makedirs(os.path.dirname(file_path))
+                with open(file_path, 'w') as trip_file:
+                    json.dump(create_random_trip(rand, num_measurements, kind), trip_file)
+                self.assert_preprocessing_equal(file_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import random
+import tempfile
+import unittest
+
+from attack_framework.create_street_network import create_street_network
+from graph_preparation.helper.reachability_tables import create_reachability_tables, write_reachability_tables, \
+    load_reachability_tables
+from graph_preparation.helper.straight_successors import StraightSuccessors, DISTANCES_ARRAY
+from test.synthetic_network import write_synthetic_osm_file
+from trajectory_attack.helper.match_turns import TurnPairMatcher, match_all_turn_pairs_a_b
+from utils.network_bundle import NETWORK_BUNDLE_PATH, load_network_bundle
+
+"""
+Check, that the TurnPairMatcher finds the same matches by the range queries on the reachability tables as by the
+recursive search over the straight successors, for turn candidates within and beyond the distance of the tables.
+"""
+
+######################################################################
+
+OSM_FILE_NAME = '/synthetic.osm'
+TABLES_FILE_NAME = '/reachability.tables'
+# below the longest distances between turn pairs, so part of the matches fall back to the recursive search
+MAX_TABLE_DISTANCE = 800.0
+
+SEED = 2
+# number of matchers with random turn candidates b, and of turn candidates a matched by each of them
+MATCHER_COUNT = 80
+TURN_CANDIDATES_A_COUNT = 30
+TURN_CANDIDATES_B_COUNT = 40
+
+
+######################################################################
+
+
+class TestReachabilityTables(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        write_synthetic_osm_file(self.temp_dir.name + OSM_FILE_NAME)
+        create_street_network(self.temp_dir.name + OSM_FILE_NAME, self.temp_dir.name + '/network')
+        self.network = load_network_bundle(self.temp_dir.name + '/network' + NETWORK_BUNDLE_PATH)
+
+        self.tables_file = self.temp_dir.name + TABLES_FILE_NAME
+        reachability_tables = create_reachability_tables(self.network.straight_successors,
+                                                         int(self.network.segments_df.index.max()) + 1,
+                                                         MAX_TABLE_DISTANCE)
+        write_reachability_tables(self.tables_file, reachability_tables, self.network.straight_successors)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_matches_equal_recursive_search(self):
+        reachability_tables = load_reachability_tables(self.tables_file, self.network.straight_successors)
+        self.assertIsNotNone(reachability_tables)
+        turns_df = self.network.turns_df
+
+        rand = random.Random(SEED)
+        match_count, covered_count, uncovered_count = 0, 0, 0
+        for _ in range(MATCHER_COUNT):
+            turn_candidates_b = turns_df.sample(TURN_CANDIDATES_B_COUNT, random_state=rand.randrange(2 ** 31))
+            distance_a_b, heading_change_a_b = rand.uniform(10.0, 700.0), rand.uniform(-120.0, 120.0)
+            searching_matcher = TurnPairMatcher(turn_candidates_b, distance_a_b, heading_change_a_b,
+                                                self.network.straight_successors)
+            table_matcher = TurnPairMatcher(turn_candidates_b, distance_a_b, heading_change_a_b,
+                                            self.network.straight_successors, reachability_tables)
+
+            turn_candidates_a = turns_df.sample(TURN_CANDIDATES_A_COUNT, random_state=rand.randrange(2 ** 31))
+            for turn_id, target_seg, distance_after in zip(turn_candidates_a.index,
+                                                           turn_candidates_a['segment_target_id'],
+                                                           turn_candidates_a['distance_after']):
+                matches = searching_matcher.match_turn_to_candidates(turn_id, target_seg, distance_after)
+                self.assertEqual(matches, table_matcher.match_turn_to_candidates(turn_id, target_seg, distance_after))
+                match_count += len(matches)
+                if reachability_tables.covers(target_seg, table_matcher.upper_bound_distance - distance_after):
+                    covered_count += 1
+                else:
+                    uncovered_count += 1
+
+        self.assertGreater(match_count, 0)
+        self.assertGreater(covered_count, 0)
+        self.assertGreater(uncovered_count, 0)
+
+        # the same matches, when the matchers run in the worker pool
+        turn_candidates_a = turns_df.sample(TURN_CANDIDATES_A_COUNT, random_state=rand.randrange(2 ** 31))
+        self.assertEqual(match_all_turn_pairs_a_b(searching_matcher, turn_candidates_a),
+                         match_all_turn_pairs_a_b(table_matcher, turn_candidates_a))
+
+    def test_tables_of_other_straight_successors_are_ignored(self):
+        arrays = {array_name: values.copy() for array_name, values in
+                  self.network.straight_successors.to_arrays().items()}
+        arrays[DISTANCES_ARRAY][0] += 1.0
+        self.assertIsNone(load_reachability_tables(self.tables_file, StraightSuccessors.from_arrays(arrays)))
+        self.assertIsNone(load_reachability_tables(self.tables_file, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
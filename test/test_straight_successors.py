@@ -0,0 +1,138 @@
+import random
+import tempfile
+import unittest
+
+import pandas as pd
+
+from attack_framework.create_street_network import create_street_network
+from attack_parameters import STRAIGHT_DRIVE_THRESHOLD, DISTANCE_ERROR_TOLERANCE, ROAD_WIDTH_THRESHOLD, \
+    MAX_HEADING_CHANGE_DEVIATION
+from definitions import MAJOR_ROADS_TIER, NO_SERVICE_ROADS_TIER, ALL_ROADS_TIER
+from graph_preparation.helper.road_class_tiers import get_turns_of_tier
+from graph_preparation.helper.straight_successors import StraightSuccessors
+from test.synthetic_network import write_synthetic_osm_file
+from trajectory_attack.helper.match_turns import TurnPairMatcher
+from utils.network_bundle import NETWORK_BUNDLE_PATH, load_network_bundle
+
+"""
+Check, that the straight successors in compressed sparse row format contain the same travel options as the turns_df,
+and that the TurnPairMatcher finds the same matches on them as the recursive search over the turns_df.
+"""
+
+######################################################################
+
+OSM_FILE_NAME = '/synthetic.osm'
+TIERS = [MAJOR_ROADS_TIER, NO_SERVICE_ROADS_TIER, ALL_ROADS_TIER]
+
+SEED = 1
+# number of matchers with random turn candidates b per tier, and of turn candidates a matched by each of them
+MATCHER_COUNT = 40
+TURN_CANDIDATES_A_COUNT = 20
+TURN_CANDIDATES_B_COUNT = 30
+
+
+######################################################################
+
+
+def get_travel_options(turns_df: pd.DataFrame) -> pd.DataFrame:
+    """ the turns within the "straight driving" threshold without segment skipping units """
+    return turns_df[(turns_df['angle'] > -STRAIGHT_DRIVE_THRESHOLD) &
+                    (turns_df['angle'] < STRAIGHT_DRIVE_THRESHOLD) &
+                    (~turns_df['is_segment_skipping'])]
+
+
+def match_by_recursive_search(turns_df: pd.DataFrame, turn_candidates_b: pd.DataFrame, distance_a_b: float,
+                              heading_change_a_b: float, turn_id: int, target_seg: int,
+                              distance_start_center: float) -> dict:
+    """ the matches of a turn candidate a by the recursive search over the travel options of the turns_df """
+    travel_options = get_travel_options(turns_df)
+    upper_bound_distance = distance_a_b * (1 + DISTANCE_ERROR_TOLERANCE) + ROAD_WIDTH_THRESHOLD
+    lower_bound_distance = distance_a_b * (1 - DISTANCE_ERROR_TOLERANCE) - ROAD_WIDTH_THRESHOLD
+    routes = []
+
+    def find_routes(start_segment, distance_bridged, heading_change, heading_change_to_target, route, intersections):
+        if distance_bridged > upper_bound_distance:
+            return
+        elif distance_bridged > lower_bound_distance and \
+                abs(heading_change_a_b - heading_change) < MAX_HEADING_CHANGE_DEVIATION:
+            routes.append(list(route))
+
+        next_targets = travel_options[travel_options['segment_start_id'] == start_segment]
+        heading_change += heading_change_to_target
+        for next_target, next_intersection, next_distance, next_heading_change in zip(
+                next_targets['segment_target_id'], next_targets['intersection_id'],
+                next_targets['distance_after'], next_targets['heading_change']):
+            if next_intersection not in intersections:
+                find_routes(next_target, distance_bridged + next_distance, heading_change, next_heading_change,
+                            route + [next_target], intersections + [next_intersection])
+
+    find_routes(target_seg, distance_start_center, 0.0, 0.0, [target_seg], [])
+
+    start_segments_of_turn_b = turn_candidates_b['segment_start_id']
+    turn_pair_to_route_dict = dict()
+    for route in routes:
+        for target_turn in start_segments_of_turn_b.index[start_segments_of_turn_b == route[-1]]:
+            turn_pair_to_route_dict[(turn_id, target_turn)] = [int(segment_id) for segment_id in route]
+    return turn_pair_to_route_dict
+
+
+class TestStraightSuccessors(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestStraightSuccessors, cls).setUpClass()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            write_synthetic_osm_file(temp_dir + OSM_FILE_NAME)
+            create_street_network(temp_dir + OSM_FILE_NAME, temp_dir + '/network')
+            network = load_network_bundle(temp_dir + '/network' + NETWORK_BUNDLE_PATH)
+            cls.turns_df = network.turns_df.copy()
+            cls.straight_successors = StraightSuccessors.from_arrays(
+                {array_name: values.copy() for array_name, values in network.straight_successors.to_arrays().items()})
+
+    def test_successors_equal_travel_options_of_turns(self):
+        for tier in TIERS:
+            with self.subTest(tier=tier):
+                travel_options = get_travel_options(get_turns_of_tier(self.turns_df, tier))
+                straight_successors = self.straight_successors.for_tier(tier)
+                self.assertEqual(straight_successors.offsets[-1], len(travel_options))
+
+                for segment_id in self.turns_df['segment_start_id'].unique():
+                    start, end = straight_successors.get_successor_range(segment_id)
+                    expected = travel_options[travel_options['segment_start_id'] == segment_id]
+                    self.assertEqual(expected['segment_target_id'].tolist(),
+                                     straight_successors.target_segment_ids[start:end].tolist())
+                    self.assertEqual(expected['intersection_id'].tolist(),
+                                     straight_successors.intersection_ids[start:end].tolist())
+                    self.assertEqual(expected['distance_after'].tolist(),
+                                     straight_successors.distances[start:end].tolist())
+                    self.assertEqual(expected['heading_change'].tolist(),
+                                     straight_successors.heading_changes[start:end].tolist())
+
+    def test_matches_equal_recursive_search_over_turns(self):
+        rand = random.Random(SEED)
+        match_count = 0
+        for tier in TIERS:
+            turns_df = get_turns_of_tier(self.turns_df, tier)
+            straight_successors = self.straight_successors.for_tier(tier)
+            for _ in range(MATCHER_COUNT):
+                turn_candidates_b = turns_df.sample(min(TURN_CANDIDATES_B_COUNT, len(turns_df)),
+                                                    random_state=rand.randrange(2 ** 31))
+                distance_a_b, heading_change_a_b = rand.uniform(30.0, 600.0), rand.uniform(-90.0, 90.0)
+                turn_pair_matcher = TurnPairMatcher(turn_candidates_b, distance_a_b, heading_change_a_b,
+                                                    straight_successors)
+
+                turn_candidates_a = turns_df.sample(TURN_CANDIDATES_A_COUNT, random_state=rand.randrange(2 ** 31))
+                for turn_id, target_seg, distance_after in zip(turn_candidates_a.index,
+                                                               turn_candidates_a['segment_target_id'],
+                                                               turn_candidates_a['distance_after']):
+                    matches = turn_pair_matcher.match_turn_to_candidates(turn_id, target_seg, distance_after)
+                    self.assertEqual(match_by_recursive_search(turns_df, turn_candidates_b, distance_a_b,
+                                                               heading_change_a_b, turn_id, target_seg,
+                                                               distance_after), matches)
+                    match_count += len(matches)
+        # the random turn candidates are matched at all
+        self.assertGreater(match_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import glob
+import json
+import math
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import sensor_analyze.preprocess_trip as preprocess_trip_module
+import sensor_analyze.stream_trip as stream_trip_module
+from definitions import TIME_COL
+from schema.sensor_models import TemporaryRoundabout, TemporaryTrafficLight, TrafficLightModel
+from sensor_analyze.preprocess_trip import SensorPreprocessor
+from sensor_analyze.stream_trip import StreamingSensorPreprocessor
+from test.settings import SAMPLES_DIRECTORY
+
+"""
+Check, that streaming a trip in random batches creates the same path sections and traffic lights as the offline
+preprocessing of the whole trip. The classifiers are replaced by rules, that decide the same on every chunk of the
+trip containing a roundabout or standing phase, as the learned classifiers might decide differently close to the
+borders of the chunks.
+"""
+
+######################################################################
+
+START_DIRECTION = 90
+SEED = 3
+# roundabouts at random times of each trip
+NUM_ROUNDABOUTS = 3
+ROUNDABOUT_DURATION_IN_MS = 8000
+# standing phases, that are recognized as traffic lights
+MIN_STANDING_DURATION_IN_MS = 5000
+MAX_BATCH_SIZE = 400
+# the distances of the streaming path are differences of the distance since start, so they differ by rounding
+RELATIVE_DISTANCE_TOLERANCE = 1e-6
+
+
+######################################################################
+
+
+class RuleRoundaboutClassifier(object):
+    """ roundabouts at the fixed time frames, that lie within the classified measurements """
+    time_frames = []
+
+    def __init__(self, trip_df):
+        self.trip_df = trip_df
+
+    def find_roundabouts(self) -> [TemporaryRoundabout]:
+        timestamps = self.trip_df['timestamp']
+        roundabouts = []
+        for start_time, end_time in self.time_frames:
+            if timestamps.min() <= start_time and end_time < timestamps.max():
+                roundabouts.append(TemporaryRoundabout(self.trip_df[timestamps > start_time].iloc[0]['direction'],
+                                                       self.trip_df[timestamps > end_time].iloc[0]['direction'],
+                                                       start_time, end_time))
+        return roundabouts
+
+
+class RuleTrafficLightExtractor(object):
+    """ traffic lights at the standing phases, that lie within the classified measurements """
+
+    def __init__(self, trips_df):
+        self.trips_df = trips_df
+
+    def find_traffic_lights(self) -> [TemporaryTrafficLight]:
+        is_standing = (self.trips_df['speed'] == 0).tolist()
+        timestamps = self.trips_df['timestamp'].tolist()
+        traffic_lights = []
+        start = 0
+        while start < len(is_standing):
+            end = start
+            if is_standing[start]:
+                while end + 1 < len(is_standing) and is_standing[end + 1]:
+                    end += 1
+                if timestamps[end] - timestamps[start] >= MIN_STANDING_DURATION_IN_MS and \
+                        0 < start and end < len(is_standing) - 1:
+                    traffic_lights.append(TemporaryTrafficLight(int(timestamps[start]), int(timestamps[end])))
+            start = end + 1
+        return traffic_lights
+
+
+def get_event_values(event) -> dict:
+    event_values = dict(vars(event))
+    event_values['type'] = type(event).__name__
+    return event_values
+
+
+class TestStreamTrip(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patches = [mock.patch.object(module, class_name, rule_class)
+                        for module in [preprocess_trip_module, stream_trip_module]
+                        for class_name, rule_class in [('RoundaboutClassifier', RuleRoundaboutClassifier),
+                                                       ('TrafficLightExtractor', RuleTrafficLightExtractor)]]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self) -> None:
+        for patch in self.patches:
+            patch.stop()
+        RuleRoundaboutClassifier.time_frames = []
+
+    def assert_events_equal(self, events: [object], streamed_events: [object]):
+        self.assertEqual(len(events), len(streamed_events))
+        for event, streamed_event in zip(events, streamed_events):
+            event_values, streamed_event_values = get_event_values(event), get_event_values(streamed_event)
+            self.assertEqual(event_values.keys(), streamed_event_values.keys())
+            for key, value in event_values.items():
+                if isinstance(value, float) and not math.isinf(value):
+                    self.assertLessEqual(abs(value - streamed_event_values[key]),
+                                         RELATIVE_DISTANCE_TOLERANCE * (1 + abs(value)), (key, event_values))
+                else:
+                    self.assertEqual(value, streamed_event_values[key], (key, event_values))
+
+    def test_streamed_events_equal_offline_events(self):
+        file_paths = sorted(glob.glob(SAMPLES_DIRECTORY + '/*/Route_Sensor.json'))
+        if not file_paths:
+            self.skipTest("No recorded trips in %s." % SAMPLES_DIRECTORY)
+
+        rand = np.random.default_rng(SEED)
+        num_path_sections = 0
+        for file_path in file_paths:
+            with open(file_path) as trip_file:
+                samples = json.load(trip_file)
+            timestamps = [sample[TIME_COL] for sample in samples]
+            RuleRoundaboutClassifier.time_frames = sorted(
+                (start_time, start_time + ROUNDABOUT_DURATION_IN_MS)
+                for start_time in rand.choice(timestamps[100:-500], NUM_ROUNDABOUTS).tolist())
+
+            sensor_preprocessor = SensorPreprocessor(file_path, START_DIRECTION)
+            sensor_preprocessor.preprocess()
+            path_sections, traffic_lights = sensor_preprocessor.get_sensor_turns_and_traffic_lights()
+
+            streaming_preprocessor = StreamingSensorPreprocessor(START_DIRECTION)
+            events = []
+            position = 0
+            while position < len(samples):
+                batch_size = int(rand.integers(1, MAX_BATCH_SIZE))
+                streaming_preprocessor.feed(samples[position:position + batch_size])
+                position += batch_size
+                events += streaming_preprocessor.drain_events()
+            streaming_preprocessor.finish()
+            events += streaming_preprocessor.drain_events()
+
+            with self.subTest(file_path=os.path.basename(os.path.dirname(file_path))):
+                self.assert_events_equal(path_sections,
+                                         [event for event in events if not isinstance(event, TrafficLightModel)])
+                # traffic lights are finalized, once the path sections around them are known
+                self.assert_events_equal(sorted(traffic_lights, key=lambda x: x.start_time),
+                                         sorted([event for event in events if isinstance(event, TrafficLightModel)],
+                                                key=lambda x: x.start_time))
+            num_path_sections += len(path_sections)
+        self.assertGreater(num_path_sections, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
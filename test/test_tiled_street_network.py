@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from attack_framework.create_street_network import create_street_network
+from attack_framework.create_tiled_street_network import split_osm_file, build_tile, stitch_tile_bundles
+from graph_preparation.network_tiles import TileGrid
+from test.synthetic_network import write_synthetic_osm_file, get_grid_bbox, get_comparable_turns, \
+    get_comparable_segments
+from utils.network_bundle import NETWORK_BUNDLE_PATH, load_network_bundle
+
+"""
+Build a synthetic street network tile by tile and check, that the stitched network equals the network built at once.
+The network has no roundabout, as most tiles of a region don't contain one.
+"""
+
+######################################################################
+
+OSM_FILE_NAME = '/synthetic.osm'
+# (rows, cols, margin in meters) of the tile grids to check
+TILE_GRIDS = [(1, 1, 100.0), (2, 2, 800.0), (3, 3, 400.0)]
+
+
+######################################################################
+
+
+class TestTiledStreetNetwork(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestTiledStreetNetwork, cls).setUpClass()
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.osm_file = cls.temp_dir.name + OSM_FILE_NAME
+        write_synthetic_osm_file(cls.osm_file, with_roundabout=False)
+
+        full_dir = cls.temp_dir.name + '/full'
+        create_street_network(cls.osm_file, full_dir)
+        cls.full_network = load_network_bundle(full_dir + NETWORK_BUNDLE_PATH)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.temp_dir.cleanup()
+        super(TestTiledStreetNetwork, cls).tearDownClass()
+
+    def build_tiled_network(self, rows: int, cols: int, margin: float):
+        target_dir = self.temp_dir.name + '/tiled_%d_%d_%d' % (rows, cols, margin)
+        tiles_dir = target_dir + '/tiles'
+        tile_grid = TileGrid(*get_grid_bbox(), rows, cols, margin)
+
+        split_osm_file(self.osm_file, tiles_dir, tile_grid, range(tile_grid.tile_count))
+        for tile_index in range(tile_grid.tile_count):
+            build_tile(tiles_dir, tile_grid, tile_index)
+        stitch_tile_bundles(tiles_dir, tile_grid, target_dir)
+        self.assertTrue(os.path.exists(target_dir + NETWORK_BUNDLE_PATH))
+        return load_network_bundle(target_dir + NETWORK_BUNDLE_PATH)
+
+    def test_stitched_network_equals_full_network(self):
+        for rows, cols, margin in TILE_GRIDS:
+            with self.subTest(rows=rows, cols=cols, margin=margin):
+                tiled_network = self.build_tiled_network(rows, cols, margin)
+                pd.testing.assert_frame_equal(get_comparable_turns(self.full_network),
+                                              get_comparable_turns(tiled_network))
+                pd.testing.assert_frame_equal(get_comparable_segments(self.full_network),
+                                              get_comparable_segments(tiled_network))
+
+    def test_network_without_roundabouts_keeps_integer_ids(self):
+        turns_df = self.full_network.turns_df
+        for column_name in ['segment_start_id', 'segment_target_id', 'intersection_id', 'end_direction']:
+            self.assertTrue(pd.api.types.is_integer_dtype(turns_df[column_name]), column_name)
+        self.assertTrue(pd.api.types.is_bool_dtype(turns_df['is_segment_skipping']))
+        self.assertFalse(turns_df['is_roundabout'].any())
+
+
+if __name__ == '__main__':
+    unittest.main()
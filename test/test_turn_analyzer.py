@@ -0,0 +1,121 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import sensor_analyze.helper.turn_analyzer as turn_analyzer_module
+from sensor_analyze.helper.turn_analyzer import TurnCalculatorDistanceHeading, TurnCalculatorHeading, \
+    TripTurnCalculatorDistanceHeading, TripTurnCalculatorHeading, RunningSum
+
+"""
+Check, that the turn calculators with running sums recognize the same corners and turn angles as summing up their
+buffers with np.sum at every check, and that the turn calculators over the window sums of a whole trip recognize the
+same as the turn calculators, that buffer the measurements one by one.
+"""
+
+######################################################################
+
+TIME_WINDOW_ANGLE_VALIDATION = 3.0
+FREQUENCY_MEASUREMENTS = 25
+
+SEED = 5
+NUM_TRIPS = 150
+
+
+######################################################################
+
+
+def create_random_measurements(rand: np.random.Generator, kind: int) -> (list, list):
+    """ angle changes and distances; the decimal steps let window sums land on the thresholds up to rounding """
+    num_measurements = int(rand.integers(100, 6000))
+    if kind == 0:
+        num_phases = num_measurements // 50 + 1
+        turn_rates = rand.uniform(-1.5, 1.5, num_phases) * (rand.random(num_phases) < 0.5)
+        angle_changes = np.repeat(turn_rates, 50)[:num_measurements] + rand.normal(0.0, 0.05, num_measurements)
+    elif kind == 1:
+        signs = rand.choice([1, -1], num_measurements // 200 + 1).repeat(200)[:num_measurements]
+        angle_changes = rand.choice([0.1, 0.2, 0.3, -0.1, 0.7, 0.0], num_measurements,
+                                    p=[0.3, 0.2, 0.2, 0.1, 0.1, 0.1]) * signs
+    else:
+        angle_changes = rand.integers(-3, 4, num_measurements) * 0.1
+    distances = rand.choice([0.1, 0.2, 0.3, 0.05, 0.0], num_measurements)
+    return angle_changes.tolist(), distances.tolist()
+
+
+class BufferSum(RunningSum):
+    """ sums up the whole window with np.sum at every check like the turn calculators before the running sums """
+
+    def get_sum(self, window, *thresholds: float) -> float:
+        return np.sum(window())
+
+
+def check_corners(turn_calculator, check_ends: [int], add_measurements_until) -> list:
+    """ the corner status at each check and the angle and duration of each finished corner """
+    results = []
+    for check_end in check_ends:
+        add_measurements_until(check_end)
+        is_in_corner = turn_calculator.is_in_corner()
+        results.append(is_in_corner)
+        if not is_in_corner and len(results) > 1 and results[-2]:
+            results.append(turn_calculator.calc_angle_and_clear_buffer())
+    return results
+
+
+def check_corners_one_by_one(turn_calculator, angle_changes: list, distances: list, check_ends: [int]) -> list:
+    added_measurements = []
+
+    def add_measurements_until(check_end: int):
+        for position in range(len(added_measurements), check_end):
+            turn_calculator.add_measurement(angle_changes[position], distances[position])
+            added_measurements.append(position)
+
+    return check_corners(turn_calculator, check_ends, add_measurements_until)
+
+
+class TestTurnCalculators(unittest.TestCase):
+
+    def test_running_sums_equal_buffer_sums(self):
+        rand = np.random.default_rng(SEED)
+        num_turns = 0
+        for trip_index in range(NUM_TRIPS):
+            angle_changes, distances = create_random_measurements(rand, trip_index % 3)
+            check_ends = list(range(1, len(angle_changes) + 1, int(rand.integers(1, 6))))
+
+            for turn_calculator_class in [TurnCalculatorDistanceHeading, TurnCalculatorHeading]:
+                results = check_corners_one_by_one(
+                    turn_calculator_class(TIME_WINDOW_ANGLE_VALIDATION, FREQUENCY_MEASUREMENTS),
+                    angle_changes, distances, check_ends)
+                with mock.patch.object(turn_analyzer_module, 'RunningSum', BufferSum):
+                    buffer_sum_results = check_corners_one_by_one(
+                        turn_calculator_class(TIME_WINDOW_ANGLE_VALIDATION, FREQUENCY_MEASUREMENTS),
+                        angle_changes, distances, check_ends)
+                self.assertEqual(buffer_sum_results, results, (trip_index, turn_calculator_class.__name__))
+                self.assertEqual([type(result) for result in buffer_sum_results], [type(result) for result in results])
+                num_turns += sum(1 for result in results if isinstance(result, tuple))
+        # the random measurements contain corners at all
+        self.assertGreater(num_turns, 0)
+
+    def test_trip_turn_calculators_equal_buffered_turn_calculators(self):
+        rand = np.random.default_rng(SEED)
+        num_turns = 0
+        for trip_index in range(NUM_TRIPS):
+            angle_changes, distances = create_random_measurements(rand, trip_index % 3)
+            check_ends = list(range(1, len(angle_changes) + 1, int(rand.integers(1, 6))))
+
+            for turn_calculator, trip_turn_calculator in [
+                (TurnCalculatorDistanceHeading(TIME_WINDOW_ANGLE_VALIDATION, FREQUENCY_MEASUREMENTS),
+                 TripTurnCalculatorDistanceHeading(TIME_WINDOW_ANGLE_VALIDATION, FREQUENCY_MEASUREMENTS,
+                                                   np.array(angle_changes), np.array(distances))),
+                (TurnCalculatorHeading(TIME_WINDOW_ANGLE_VALIDATION, FREQUENCY_MEASUREMENTS),
+                 TripTurnCalculatorHeading(TIME_WINDOW_ANGLE_VALIDATION, FREQUENCY_MEASUREMENTS,
+                                           np.array(angle_changes)))]:
+                results = check_corners_one_by_one(turn_calculator, angle_changes, distances, check_ends)
+                trip_results = check_corners(trip_turn_calculator, check_ends,
+                                             trip_turn_calculator.add_measurements_until)
+                self.assertEqual(results, trip_results, (trip_index, type(turn_calculator).__name__))
+                num_turns += sum(1 for result in results if isinstance(result, tuple))
+        self.assertGreater(num_turns, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
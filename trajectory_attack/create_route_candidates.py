@@ -1,19 +1,27 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 from tqdm import tqdm
 
+from attack_parameters import ATTACK_ROAD_TIERS
+from definitions import ALL_ROADS_TIER
+from graph_preparation.helper.reachability_tables import ReachabilityTables
+from graph_preparation.helper.road_class_tiers import get_turns_of_tier
+from graph_preparation.helper.straight_successors import StraightSuccessors, create_straight_successors
 from schema.sensor_models import SensorTurnModel, TrafficLightModel
 from trajectory_attack.helper.connect_part_routes import connect_part_routes
 from trajectory_attack.helper.match_turns import TurnPairMatcher, match_all_turn_pairs_a_b, \
     get_turn_candidates, filter_turns_df_to_only_turns
+from trajectory_attack.helper.region_prior import RegionPrior
 from trajectory_attack.rank_route_candidates import get_ranked_route_candidates
 from utils.functions import map_list_to_list_of_lists
+from utils.spatial_index import SpatialIndex
 
 ######################################################################
 
 USE_COLS = ['segment_start_id', 'segment_target_id', 'angle', 'end_direction', 'distance_before',
-            'distance_after', 'is_roundabout', 'is_segment_skipping', 'intersection_id', 'heading_change']
+            'distance_after', 'is_roundabout', 'is_segment_skipping', 'intersection_id', 'heading_change',
+            'intersection_lat', 'intersection_lng']
 
 
 ######################################################################
@@ -24,8 +32,28 @@ class RouteCandidateCreator(object):
     Each element in a candidate is an index refering to the turn within the turns_df.
     """
 
-    def __init__(self, turn_sequence: [SensorTurnModel], turns_df: pd.DataFrame):
+    def __init__(self, turn_sequence: [SensorTurnModel], turns_df: pd.DataFrame,
+                 straight_successors: Optional[StraightSuccessors] = None,
+                 reachability_tables: Optional[ReachabilityTables] = None,
+                 region_prior: Optional[RegionPrior] = None, restrict_to_region: bool = True):
+        """
+        :param straight_successors: the straight travel options of the turns_df like the ones of a network bundle,
+                                    otherwise they are created from the turns_df
+        :param reachability_tables: the precomputed paths of the straight_successors to speed up matching turn pairs
+        :param region_prior: the rough area of the trip, that turn candidates and straight travel are restricted to
+        :param restrict_to_region: restrict the turns_df to the area of the region_prior, disable it, if the turns_df
+                                   and the straight_successors are already restricted to it
+        """
+        if restrict_to_region and region_prior is not None and region_prior.area is not None:
+            # straight travel doesn't leave the region, so the straight successors of the full turns_df don't apply
+            turns_df = region_prior.restrict_turns(turns_df)
+            straight_successors, reachability_tables = None, None
+        self.region_prior = region_prior
         self.turns_df = turns_df[USE_COLS]
+        if straight_successors is None:
+            straight_successors = create_straight_successors(self.turns_df)
+        self.straight_successors = straight_successors
+        self.reachability_tables = reachability_tables
         self.turn_candidates_dict = self.__init_turn_candidates_dict(turn_sequence)
         self.turn_sequence = turn_sequence
 
@@ -75,6 +103,9 @@ class RouteCandidateCreator(object):
         # Also take all intersection_id's for each "turn from sensor" and add them to the route_candidates
         for part_route_index, turn in enumerate(turn_sequence):
             turn_candidates_dict[part_route_index] = get_turn_candidates(only_turns_df, turn)
+            if self.region_prior is not None:
+                turn_candidates_dict[part_route_index] = self.region_prior.restrict_turn_candidates(
+                    part_route_index, turn_candidates_dict[part_route_index])
 
         return turn_candidates_dict
 
@@ -115,13 +146,58 @@ class RouteCandidateCreator(object):
         pair_matcher = TurnPairMatcher(self.turn_candidates_dict[target_turn_index],
                                        self.turn_sequence[start_turn_index].distance_after,
                                        measured_heading_change,
-                                       self.turns_df)
+                                       self.straight_successors,
+                                       self.reachability_tables)
         return match_all_turn_pairs_a_b(pair_matcher, self.turn_candidates_dict[start_turn_index])
 
 
+def create_route_candidates_on_tiers(turn_sequence: [SensorTurnModel], turns_df: pd.DataFrame,
+                                     road_tiers: [int] = None,
+                                     straight_successors: Optional[StraightSuccessors] = None,
+                                     reachability_tables: Optional[ReachabilityTables] = None,
+                                     region_prior: Optional[RegionPrior] = None,
+                                     turn_center_index: Optional[SpatialIndex] = None) \
+        -> Tuple[RouteCandidateCreator, List[List[int]]]:
+    """
+    Run the attack on the reduced street graph of each road class tier one after another and stop at the first tier,
+    where route candidates are found. As turn ids are kept in each tier, the candidates refer to the full turns_df.
+    :param straight_successors: the straight travel options of the full turns_df, e.g. of the network bundle
+    :param reachability_tables: the precomputed paths of these straight_successors, only used on the full street graph
+    :param region_prior: the rough area of the trip to restrict the attack to
+    :param turn_center_index: the spatial index over the intersections of the turns_df, e.g. of the network bundle, to
+                              find the turns within the region without checking all turns
+    :return: the RouteCandidateCreator of the last tier and its route candidates
+    """
+    if road_tiers is None:
+        road_tiers = ATTACK_ROAD_TIERS
+    if region_prior is not None and region_prior.area is not None:
+        # restrict once for all tiers; straight travel doesn't leave the region, so the straight successors of the
+        # full turns_df don't apply and the ones of the region are reduced to each tier
+        turns_df = region_prior.restrict_turns(turns_df, turn_center_index)
+        straight_successors, reachability_tables = create_straight_successors(turns_df), None
+
+    route_candidate_creator, route_candidates = None, []
+    for tier in road_tiers:
+        tier_successors = straight_successors.for_tier(tier) if straight_successors is not None else None
+        tier_reachability_tables = reachability_tables if tier >= ALL_ROADS_TIER else None
+        route_candidate_creator = RouteCandidateCreator(turn_sequence, get_turns_of_tier(turns_df, tier),
+                                                        tier_successors, tier_reachability_tables, region_prior,
+                                                        restrict_to_region=False)
+        route_candidates = route_candidate_creator.create_new_route_candidates()
+        print("Created %d route candidates on road tier %d." % (len(route_candidates), tier))
+        if route_candidates:
+            break
+
+    return route_candidate_creator, route_candidates
+
+
 def get_all_route_candidates(turn_sequence: [SensorTurnModel], traffic_lights: [TrafficLightModel],
                              measurements_df: pd.DataFrame,
-                             turns_df: pd.DataFrame, road_segments_df: pd.DataFrame) -> [[int]]:
+                             turns_df: pd.DataFrame, road_segments_df: pd.DataFrame,
+                             straight_successors: Optional[StraightSuccessors] = None,
+                             reachability_tables: Optional[ReachabilityTables] = None,
+                             region_prior: Optional[RegionPrior] = None,
+                             turn_center_index: Optional[SpatialIndex] = None) -> [[int]]:
     """
         High-Level Interface to receive all route candidates for the given turn_sequence
         Get the full route of every route_candidate, if the route_candidate has a valid direction.
@@ -129,7 +205,8 @@ def get_all_route_candidates(turn_sequence: [SensorTurnModel], traffic_lights: [
         wouldn't work like that.
         :return: a list of route_candidates where each candidate contains ALL intersections on the path.
     """
-    route_candidate_creator = RouteCandidateCreator(turn_sequence, turns_df)
-    route_candidates = route_candidate_creator.create_new_route_candidates()
+    route_candidate_creator, route_candidates = create_route_candidates_on_tiers(
+        turn_sequence, turns_df, straight_successors=straight_successors, reachability_tables=reachability_tables,
+        region_prior=region_prior, turn_center_index=turn_center_index)
     return get_ranked_route_candidates(route_candidates, route_candidate_creator.turn_pair_to_segment_route,
                                        turn_sequence, traffic_lights, measurements_df, turns_df, road_segments_df)
@@ -1,18 +1,16 @@
-from multiprocessing import Pool
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
-from attack_parameters import TURN_THRESHOLD, TURN_ANGLE_ERROR_TOLERANCE, STRAIGHT_DRIVE_THRESHOLD, \
-    DISTANCE_ERROR_TOLERANCE, MAGNETOMETER_DIRECTION_ERROR, ROAD_WIDTH_THRESHOLD, MAX_HEADING_CHANGE_DEVIATION
+from attack_parameters import TURN_THRESHOLD, TURN_ANGLE_ERROR_TOLERANCE, DISTANCE_ERROR_TOLERANCE, \
+    MAGNETOMETER_DIRECTION_ERROR, ROAD_WIDTH_THRESHOLD, MAX_HEADING_CHANGE_DEVIATION
+from graph_preparation.helper.reachability_tables import ReachabilityTables
+from graph_preparation.helper.straight_successors import StraightSuccessors
 from schema.sensor_models import SensorTurnModel, RoundaboutTurnModel
 from utils.angle_helper import get_binary_directions_with_tolerance
 from utils.functions import merge_dicts
-
-######################################################################
-
-TRAVEL_OPTION_USE_COLS = ['segment_start_id', 'segment_target_id', 'distance_after', 'intersection_id',
-                          'heading_change']
+from utils.worker_pool import map_with_shared_state, get_worker_state
 
 
 ######################################################################
@@ -22,13 +20,12 @@ class TurnPairMatcher(object):
                  turn_candidates_b: pd.DataFrame,
                  distance_a_b: float,
                  heading_change_a_b: float,
-                 turns_df: pd.DataFrame):
-        # databases for queries
-        # only the rows within the "straight driving" threshold are relevant here
-        # remove segment skipping units, as these don't provide additional info about paths
-        self.travel_options = turns_df[(turns_df['angle'] > -STRAIGHT_DRIVE_THRESHOLD) &
-                                       (turns_df['angle'] < STRAIGHT_DRIVE_THRESHOLD) &
-                                       (~turns_df['is_segment_skipping'])][TRAVEL_OPTION_USE_COLS]
+                 straight_successors: StraightSuccessors,
+                 reachability_tables: Optional[ReachabilityTables] = None):
+        # database for queries: the travel options within the "straight driving" threshold of each segment
+        self.straight_successors = straight_successors
+        # precomputed paths of the straight_successors, that replace exploring them up to their maximum distance
+        self.reachability_tables = reachability_tables
 
         # segments desired to reach, as here the next turn would start
         self.start_segments_of_turn_b = turn_candidates_b['segment_start_id']
@@ -44,16 +41,27 @@ class TurnPairMatcher(object):
         # store all routes, that can be taken, when driving straight along the road from intersection
         # start_id to center_id. start_id should be the turn whose valid matches are being searched for
         possible_routes_from_current_a = []
-        # store the current route taken from 'a' to track the route to a corresponding target
-        current_route_to_candidate = [target_seg]
-        self.__find_intersections_by_distance(next_start_segment=target_seg,
-                                              curr_distance_bridged=0.0,
-                                              distance_to_target=distance_start_center,
-                                              curr_heading_change=0.0,
-                                              heading_change_to_target=0.0,
-                                              possible_routes_from_a=possible_routes_from_current_a,
-                                              current_route_node_path=current_route_to_candidate,
-                                              passed_intersections=[])
+        # the distance of the paths after the segment of 'a' in the tables excludes distance_start_center
+        min_path_distance = float(self.lower_bound_distance) - float(distance_start_center)
+        max_path_distance = float(self.upper_bound_distance) - float(distance_start_center)
+        if self.reachability_tables is not None and self.reachability_tables.covers(target_seg, max_path_distance):
+            # range query for the same routes in the same order, that the recursive search below finds
+            rows = self.reachability_tables.find_paths(target_seg, min_path_distance, max_path_distance)
+            rows = rows[(np.abs(self.heading_change_a_b - self.reachability_tables.heading_changes[rows]) <
+                         MAX_HEADING_CHANGE_DEVIATION) &
+                        np.isin(self.reachability_tables.last_segment_ids[rows], self.start_segments_of_turn_b)]
+            possible_routes_from_current_a = [self.reachability_tables.get_path(row) for row in rows.tolist()]
+        else:
+            # store the current route taken from 'a' to track the route to a corresponding target
+            current_route_to_candidate = [target_seg]
+            self.__find_intersections_by_distance(next_start_segment=target_seg,
+                                                  curr_distance_bridged=0.0,
+                                                  distance_to_target=distance_start_center,
+                                                  curr_heading_change=0.0,
+                                                  heading_change_to_target=0.0,
+                                                  possible_routes_from_a=possible_routes_from_current_a,
+                                                  current_route_node_path=current_route_to_candidate,
+                                                  passed_intersections=[])
 
         # return all routes with turns, that are reachable from 'a' and are possible turn candidates for 'b'
         valid_candidates = [route for route in possible_routes_from_current_a if
@@ -90,16 +98,17 @@ class TurnPairMatcher(object):
             possible_routes_from_a.append([node for node in current_route_node_path])
 
         # get all intersections, that can be reached without turning
-        next_targets = self.travel_options[self.travel_options['segment_start_id'] == next_start_segment]
+        start, end = self.straight_successors.get_successor_range(next_start_segment)
 
         # do not consider heading change directly before a possible turns, so add heading_change_to_target afterward
         curr_heading_change += heading_change_to_target
 
         # recursive call; recursion also stops, when no intersection is reachable without a turn
-        for next_target, next_intersection, next_distance, next_heading_change in zip(next_targets['segment_target_id'],
-                                                                                      next_targets['intersection_id'],
-                                                                                      next_targets['distance_after'],
-                                                                                      next_targets['heading_change']):
+        for next_target, next_intersection, next_distance, next_heading_change in zip(
+                self.straight_successors.target_segment_ids[start:end].tolist(),
+                self.straight_successors.intersection_ids[start:end].tolist(),
+                self.straight_successors.distances[start:end].tolist(),
+                self.straight_successors.heading_changes[start:end].tolist()):
             # don't allow loops when 'driving straight', as it's unlikely with the high straight travel threshold
             if next_intersection in passed_intersections:
                 continue
@@ -121,6 +130,11 @@ class TurnPairMatcher(object):
             passed_intersections.pop()
 
 
+def __match_turn_to_candidates(turn_id: int, target_seg: int,
+                               distance_start_center: float) -> Dict[Tuple[int, int], List[int]]:
+    return get_worker_state().match_turn_to_candidates(turn_id, target_seg, distance_start_center)
+
+
 def match_all_turn_pairs_a_b(turn_pair_matcher: TurnPairMatcher, turn_candidates_a: pd.DataFrame) \
         -> Dict[Tuple[int, int], List[int]]:
     """
@@ -131,12 +145,12 @@ def match_all_turn_pairs_a_b(turn_pair_matcher: TurnPairMatcher, turn_candidates
     :param turn_pair_matcher: an instance of TurnPairMatcher used to run the matching
     :return: a list of turn-pairs created from the candidates of turn a + b
     """
-    with Pool() as pool:
-        matched_turns = pool.starmap(turn_pair_matcher.match_turn_to_candidates,
-                                     zip(turn_candidates_a.index,
-                                         turn_candidates_a['segment_target_id'],
-                                         turn_candidates_a['distance_after'])
-                                     )
+    # workers receive the turn_pair_matcher with its lookups once instead of with every turn candidate
+    matched_turns = map_with_shared_state(__match_turn_to_candidates,
+                                          zip(turn_candidates_a.index,
+                                              turn_candidates_a['segment_target_id'],
+                                              turn_candidates_a['distance_after']),
+                                          turn_pair_matcher, star=True)
     return merge_dicts(matched_turns)
 
 
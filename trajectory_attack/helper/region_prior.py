@@ -0,0 +1,81 @@
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from osm_to_csv.clip_area import ClipArea
+from utils.distance_helper import VINCENTY, calc_distances, get_degree_margins
+from utils.spatial_index import SpatialIndex
+
+"""
+A region prior restricts the attack to the rough area a trip happened in, e.g. a home district or the coverage of a
+cell tower. Turns at intersections outside the region are neither turn candidates nor passed by straight travel, so the
+search space of the attack scales with the size of the region instead of the size of the street network.
+"""
+
+
+######################################################################
+
+
+class RadiusArea(object):
+    """ Area within a radius in meters around a center like the coverage of a cell tower """
+
+    def __init__(self, lat: float, lng: float, radius: float):
+        self.lat = lat
+        self.lng = lng
+        self.radius = radius
+
+    def __repr__(self):
+        return "RadiusArea(%r, %r, %r)" % (self.lat, self.lng, self.radius)
+
+    def get_bbox(self) -> Tuple[float, float, float, float]:
+        """ (min_lat, min_lng, max_lat, max_lng) around the circle """
+        margin_lat, margin_lng = get_degree_margins(self.lat, self.lat, self.radius)
+        return self.lat - margin_lat, self.lng - margin_lng, self.lat + margin_lat, self.lng + margin_lng
+
+    def contains(self, lats, lngs) -> np.ndarray:
+        """ Check for every coordinate, if it lies within the area """
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        return calc_distances(np.full(lats.shape, self.lat), np.full(lngs.shape, self.lng), lats, lngs,
+                              mode=VINCENTY) <= self.radius
+
+
+Area = Union[ClipArea, RadiusArea]
+
+
+def get_turns_in_area(turns_df: pd.DataFrame, area: Area,
+                      turn_center_index: Optional[SpatialIndex] = None) -> pd.DataFrame:
+    """
+    Turns, whose intersection lies within the area
+    :param turn_center_index: spatial index over the intersections of the turns_df like the TURN_CENTERS_INDEX of a
+                              network bundle, so only the turns around the area are checked
+    """
+    if turn_center_index is not None:
+        turns_df = turns_df.loc[turn_center_index.query_bbox(*area.get_bbox())]
+    return turns_df[area.contains(turns_df['intersection_lat'].to_numpy(), turns_df['intersection_lng'].to_numpy())]
+
+
+class RegionPrior(object):
+    """ The rough area of a trip, optionally narrowed down for single turns of the turn sequence """
+
+    def __init__(self, area: Optional[Area] = None, turn_areas: Optional[Dict[int, Area]] = None):
+        """
+        :param area: the area of the whole trip; the attack only searches within it
+        :param turn_areas: areas for the turn candidates of single turns, by their index within the turn sequence,
+                           e.g. the area of a cell tower at the time of the turn
+        """
+        self.area = area
+        self.turn_areas = turn_areas or {}
+
+    def restrict_turns(self, turns_df: pd.DataFrame, turn_center_index: Optional[SpatialIndex] = None) -> pd.DataFrame:
+        """ the turns the attack searches, i.e. all turns within the area of the trip """
+        if self.area is None:
+            return turns_df
+        return get_turns_in_area(turns_df, self.area, turn_center_index)
+
+    def restrict_turn_candidates(self, turn_index: int, turn_candidates: pd.DataFrame) -> pd.DataFrame:
+        """ :param turn_candidates: candidates of a turn of the turn sequence with the intersection positions """
+        if turn_index not in self.turn_areas:
+            return turn_candidates
+        return get_turns_in_area(turn_candidates, self.turn_areas[turn_index])
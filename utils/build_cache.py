@@ -0,0 +1,103 @@
+import hashlib
+import os
+import pickle
+import timeit
+from types import ModuleType
+from typing import Callable, Dict, List, Optional, Sequence
+
+######################################################################
+
+CACHE_FILE_EXTENSION = '.pickle'
+# size of the blocks to hash input files with
+HASH_BLOCK_SIZE = 1 << 20
+
+
+######################################################################
+
+
+class BuildStage(object):
+    """
+    A stage of a build DAG. Its output is cached under a key, that is derived from the keys of its input stages, the
+    parameters it reads and the source code of the modules it runs, so a stage reruns only if one of them changed.
+    """
+
+    def __init__(self, name: str, func: Callable, inputs: Sequence[str] = (), parameters: Optional[Dict] = None,
+                 code_modules: Sequence[ModuleType] = ()):
+        """
+        :param func: creates the output of the stage from the outputs of the input stages in the order of inputs
+        :param inputs: names of the stages, whose outputs are the arguments of func
+        :param parameters: values of all parameters the stage reads, that aren't part of its inputs
+        :param code_modules: modules with the code of the stage
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.parameters = parameters or {}
+        self.code_modules = list(code_modules)
+
+
+class BuildCache(object):
+    """ Runs the stages of a build DAG and persists the output of each stage in the cache dir """
+
+    def __init__(self, stages: List[BuildStage], cache_dir: str):
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache_dir = cache_dir
+        self.keys = {}
+        self.outputs = {}
+
+    def get_key(self, stage_name: str) -> str:
+        """ the key of a stage doesn't need any output, so cached outputs of upstream stages are never loaded """
+        if stage_name not in self.keys:
+            stage = self.stages[stage_name]
+            stage_hash = hashlib.sha256(stage.name.encode('utf-8'))
+            stage_hash.update(repr(sorted(stage.parameters.items())).encode('utf-8'))
+            for module in stage.code_modules:
+                with open(module.__file__, 'rb') as module_file:
+                    stage_hash.update(module_file.read())
+            for input_name in stage.inputs:
+                stage_hash.update(self.get_key(input_name).encode('utf-8'))
+            self.keys[stage_name] = stage_hash.hexdigest()
+        return self.keys[stage_name]
+
+    def get_output(self, stage_name: str):
+        """ load the output of a stage from the cache or run the stage with the outputs of its inputs """
+        if stage_name not in self.outputs:
+            stage = self.stages[stage_name]
+            cache_file = self.__get_cache_file(stage_name)
+
+            if os.path.exists(cache_file):
+                with open(cache_file, 'rb') as dump_file:
+                    self.outputs[stage_name] = pickle.load(dump_file)
+                print("Loaded stage %s from cache." % stage_name)
+            else:
+                inputs = [self.get_output(input_name) for input_name in stage.inputs]
+                start_time = timeit.default_timer()
+                output = stage.func(*inputs)
+                end_time = timeit.default_timer()
+                print("Ran stage %s in %.4f seconds." % (stage_name, (end_time - start_time)))
+                self.set_output(stage_name, output)
+
+        return self.outputs[stage_name]
+
+    def set_output(self, stage_name: str, output):
+        """ store an output, that was created outside of the stage like by an update, as the output of the stage """
+        cache_file = self.__get_cache_file(stage_name)
+        self.outputs[stage_name] = output
+
+        # write to a temporary file first, so an interrupted build never leaves a broken cache entry
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file + '.tmp', 'wb') as dump_file:
+            pickle.dump(output, dump_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_file + '.tmp', cache_file)
+
+    def __get_cache_file(self, stage_name: str) -> str:
+        return os.path.join(self.cache_dir, stage_name, self.get_key(stage_name) + CACHE_FILE_EXTENSION)
+
+
+def hash_file(file_path: str) -> str:
+    """ content hash of an input file like an osm dump """
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(HASH_BLOCK_SIZE), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
@@ -0,0 +1,142 @@
+import logging
+import math
+from typing import Tuple
+
+import geopy.distance
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+######################################################################
+
+# Accuracy modes for distance calculation between coordinates
+# exact geodesic from geopy, calculated pair by pair; slow and only meant as reference
+GEODESIC = 'geodesic'
+# vectorized Vincenty formula on the WGS-84 ellipsoid; deviates less than a millimeter from GEODESIC
+VINCENTY = 'vincenty'
+# vectorized great-circle distance on a sphere; fastest, but deviates up to 0.6% from GEODESIC
+HAVERSINE = 'haversine'
+
+# WGS-84 ellipsoid parameters in meters
+WGS84_MAJOR_AXIS = 6378137.0
+WGS84_FLATTENING = 1 / 298.257223563
+WGS84_MINOR_AXIS = (1 - WGS84_FLATTENING) * WGS84_MAJOR_AXIS
+# mean radius of the WGS-84 ellipsoid in meters used for the spherical approximation
+MEAN_EARTH_RADIUS = 6371008.8
+# approximate length of a degree of latitude in meters, e.g. to convert margins in meters to degrees
+METERS_PER_DEGREE_LAT = 111320.0
+# widens margins converted to degrees, as METERS_PER_DEGREE_LAT only approximates the length of a degree
+DEGREE_MARGIN_SAFETY_FACTOR = 1.01
+
+VINCENTY_MAX_ITERATIONS = 200
+VINCENTY_CONVERGENCE_THRESHOLD = 1e-12
+
+
+######################################################################
+
+
+def get_degree_margins(min_lat: float, max_lat: float, meters: float) -> Tuple[float, float]:
+    """
+    Convert a margin in meters around the latitudes from min_lat to max_lat to degrees, that cover at least the margin
+    :return: (margin_lat, margin_lng)
+    """
+    margin_lat = meters * DEGREE_MARGIN_SAFETY_FACTOR / METERS_PER_DEGREE_LAT
+    # longitudes are closest at the latitude farthest from the equator
+    max_abs_lat = min(max(abs(min_lat - margin_lat), abs(max_lat + margin_lat)), 89.0)
+    margin_lng = meters * DEGREE_MARGIN_SAFETY_FACTOR / (METERS_PER_DEGREE_LAT * math.cos(math.radians(max_abs_lat)))
+    return margin_lat, margin_lng
+
+
+def calc_distances(lat_start: np.ndarray, lng_start: np.ndarray, lat_end: np.ndarray, lng_end: np.ndarray,
+                   mode: str = VINCENTY) -> np.ndarray:
+    """
+    Calculate the distances in meters between pairs of coordinates in a single vectorized call
+    :param lat_start: latitudes of the start points in degrees
+    :param lng_start: longitudes of the start points in degrees
+    :param lat_end: latitudes of the end points in degrees
+    :param lng_end: longitudes of the end points in degrees
+    :param mode: accuracy mode, one of GEODESIC, VINCENTY or HAVERSINE
+    :return: an array with the distance in meters for each pair
+    """
+    lat_start = np.asarray(lat_start, dtype=np.float64)
+    lng_start = np.asarray(lng_start, dtype=np.float64)
+    lat_end = np.asarray(lat_end, dtype=np.float64)
+    lng_end = np.asarray(lng_end, dtype=np.float64)
+
+    if mode == VINCENTY:
+        return __calc_vincenty_distances(lat_start, lng_start, lat_end, lng_end)
+    elif mode == HAVERSINE:
+        return __calc_haversine_distances(lat_start, lng_start, lat_end, lng_end)
+    elif mode == GEODESIC:
+        return __calc_geodesic_distances(lat_start, lng_start, lat_end, lng_end)
+    else:
+        raise Exception("Invalid distance mode %s provided." % mode)
+
+
+def __calc_geodesic_distances(lat_start: np.ndarray, lng_start: np.ndarray, lat_end: np.ndarray,
+                              lng_end: np.ndarray) -> np.ndarray:
+    return np.array([geopy.distance.distance(start, end).m
+                     for start, end in zip(zip(lat_start, lng_start), zip(lat_end, lng_end))], dtype=np.float64)
+
+
+def __calc_haversine_distances(lat_start: np.ndarray, lng_start: np.ndarray, lat_end: np.ndarray,
+                               lng_end: np.ndarray) -> np.ndarray:
+    phi_start, phi_end = np.radians(lat_start), np.radians(lat_end)
+    delta_phi = phi_end - phi_start
+    delta_lambda = np.radians(lng_end - lng_start)
+
+    h = np.sin(delta_phi / 2) ** 2 + np.cos(phi_start) * np.cos(phi_end) * np.sin(delta_lambda / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def __calc_vincenty_distances(lat_start: np.ndarray, lng_start: np.ndarray, lat_end: np.ndarray,
+                              lng_end: np.ndarray) -> np.ndarray:
+    """
+    Inverse Vincenty formula iterated for all pairs at once. Pairs that don't converge (nearly antipodal points)
+    fall back to the exact geodesic.
+    https://en.wikipedia.org/wiki/Vincenty%27s_formulae#Inverse_problem
+    """
+    f = WGS84_FLATTENING
+    diff_lng = np.radians(lng_end - lng_start)
+    reduced_lat_start = np.arctan((1 - f) * np.tan(np.radians(lat_start)))
+    reduced_lat_end = np.arctan((1 - f) * np.tan(np.radians(lat_end)))
+    sin_u1, cos_u1 = np.sin(reduced_lat_start), np.cos(reduced_lat_start)
+    sin_u2, cos_u2 = np.sin(reduced_lat_end), np.cos(reduced_lat_end)
+
+    lambda_ = diff_lng
+    is_converged = np.zeros(diff_lng.shape, dtype=bool)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(VINCENTY_MAX_ITERATIONS):
+            sin_lambda, cos_lambda = np.sin(lambda_), np.cos(lambda_)
+            sin_sigma = np.sqrt((cos_u2 * sin_lambda) ** 2 +
+                                (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lambda) ** 2)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lambda
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            # coincident points have a sin_sigma of zero
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lambda / sin_sigma)
+            cos_sq_alpha = 1 - sin_alpha ** 2
+            # lines along the equator have a cos_sq_alpha of zero
+            cos_2_sigma_m = np.where(cos_sq_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos_sq_alpha)
+            c = f / 16 * cos_sq_alpha * (4 + f * (4 - 3 * cos_sq_alpha))
+            previous_lambda = lambda_
+            lambda_ = diff_lng + (1 - c) * f * sin_alpha * (
+                    sigma + c * sin_sigma * (cos_2_sigma_m + c * cos_sigma * (-1 + 2 * cos_2_sigma_m ** 2)))
+
+            is_converged = np.abs(lambda_ - previous_lambda) < VINCENTY_CONVERGENCE_THRESHOLD
+            if is_converged.all():
+                break
+
+    u_sq = cos_sq_alpha * (WGS84_MAJOR_AXIS ** 2 - WGS84_MINOR_AXIS ** 2) / (WGS84_MINOR_AXIS ** 2)
+    a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = b * sin_sigma * (cos_2_sigma_m + b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2_sigma_m ** 2) -
+            b / 6 * cos_2_sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2_sigma_m ** 2)))
+    distances = WGS84_MINOR_AXIS * a * (sigma - delta_sigma)
+
+    if not is_converged.all():
+        log.warning("Vincenty formula did not converge for %d pairs. Falling back to geodesic distance."
+                    % np.count_nonzero(~is_converged))
+        distances[~is_converged] = __calc_geodesic_distances(lat_start[~is_converged], lng_start[~is_converged],
+                                                             lat_end[~is_converged], lng_end[~is_converged])
+    return distances
@@ -1,8 +1,9 @@
 import pickle
 from itertools import groupby
-from typing import Dict, List
+from typing import Dict, List, Mapping
 
 from utils.functions import flatten_list
+from utils.network_bundle import NETWORK_BUNDLE_PATH, load_network_bundle
 
 
 def store_osm_path(osm_path: [int], target_dir: str):
@@ -10,11 +11,9 @@ def store_osm_path(osm_path: [int], target_dir: str):
         pickle.dump(osm_path, dump_file)
 
 
-def get_segment_to_osm_ids_dict(file_target_dir: str) -> Dict[int, List[int]]:
-    """ Load a pickled segment_to_osm_ids dict and return it """
-    with open(file_target_dir + '/db/segment_to_osm_ids.pickle', 'rb') as dump_file:
-        segment_to_osm_ids = pickle.load(dump_file)
-        return segment_to_osm_ids
+def get_segment_to_osm_ids_dict(file_target_dir: str) -> Mapping[int, List[int]]:
+    """ Load the segment_to_osm_ids lookup from the network bundle and return it """
+    return load_network_bundle(file_target_dir + NETWORK_BUNDLE_PATH).segment_to_osm_ids
 
 
 def create_osm_path(segment_ids: [int], segment_to_osm_id_map: Dict[int, List[int]]) -> [int]:
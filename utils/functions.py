@@ -29,22 +29,31 @@ def average_reduce(lst: List[float]) -> float:
 
 def merge_intersecting_sets(sets: List[Set]) -> List[Set[int]]:
     """
-    Given a list of sets: Merge sets based on intersections
-    # https://stackoverflow.com/questions/9110837/python-simple-list-merging-based-on-intersections
-    """
-    merged = True
-    while merged:
-        merged = False
-        results = []
-        while sets:
-            common, rest = sets[0], sets[1:]
-            sets = []
-            for x in rest:
-                if x.isdisjoint(common):
-                    sets.append(x)
-                else:
-                    merged = True
-                    common |= x
-            results.append(common)
-        sets = results
-    return sets
+    Given a list of sets: Merge sets based on intersections.
+    Union-find over the elements, so each element is visited only once instead of repeatedly uniting the sets
+    """
+    parents = {}
+
+    def find_root(element):
+        root = parents.setdefault(element, element)
+        while parents[root] != root:
+            root = parents[root]
+        # compress the path, so later lookups reach the root directly
+        while parents[element] != root:
+            parents[element], element = root, parents[element]
+        return root
+
+    for current_set in sets:
+        elements = iter(current_set)
+        first_root = find_root(next(elements)) if current_set else None
+        for element in elements:
+            root = find_root(element)
+            if root != first_root:
+                parents[root] = first_root
+
+    # group the elements by their root in the order, in which the merged sets first occur
+    merged_sets = {}
+    for current_set in sets:
+        for element in current_set:
+            merged_sets.setdefault(find_root(element), set()).add(element)
+    return list(merged_sets.values())
@@ -0,0 +1,334 @@
+import json
+import os
+import struct
+from collections.abc import Mapping
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from attack_parameters import STRAIGHT_DRIVE_THRESHOLD
+from definitions import NODE_ID_COL_NAME, OSM_ID_COL_NAME, LAT_COL_NAME, LNG_COL_NAME, LABEL_COL_NAME, INTERSECTION
+from graph_preparation.helper.straight_successors import StraightSuccessors, OFFSETS_ARRAY, ROAD_TIERS_ARRAY, \
+    create_straight_successors, has_straight_successor_columns
+from utils.spatial_index import SpatialIndex, create_spatial_index_arrays
+
+"""
+A street network bundle stores the turns, road segments and nodes of a street network together with the osm nodes on
+each road segment, the straight travel options of each road segment and spatial indexes over the intersections and
+turns in a single binary file, that is memory mapped on loading instead of parsing csv files and pickles.
+
+Layout of a bundle:
+    magic bytes | version (uint32) | header size (uint32) | json header | padding | aligned column arrays
+The json header describes each column by its dtype, length and offset within the data section. Ids are downcast to
+int32 and measurements to float32, coordinates are kept as float64. Strings are stored as categorical codes.
+"""
+
+######################################################################
+
+NETWORK_BUNDLE_PATH = '/db/network.bundle'
+
+BUNDLE_MAGIC = b'DAROUTE\x00'
+# increase the version on every change of the layout, so outdated bundles are rejected instead of misread
+BUNDLE_VERSION = 3
+BUNDLE_PREAMBLE = struct.Struct('<8sII')
+BUNDLE_ALIGNMENT = 64
+
+TURNS_TABLE = 'turns'
+SEGMENTS_TABLE = 'segments'
+NODES_TABLE = 'nodes'
+SEGMENT_IDS_ARRAY = 'segment_ids'
+SEGMENT_OSM_OFFSETS_ARRAY = 'segment_osm_offsets'
+SEGMENT_OSM_IDS_ARRAY = 'segment_osm_ids'
+STRAIGHT_SUCCESSORS_PREFIX = 'straight_successors_'
+
+INTERSECTIONS_INDEX = 'intersections'
+TURN_STARTS_INDEX = 'turn_starts'
+TURN_CENTERS_INDEX = 'turn_centers'
+TURN_ENDS_INDEX = 'turn_ends'
+# table and coordinate columns of the positions, that each spatial index is keyed on
+SPATIAL_INDEX_COLUMNS = {INTERSECTIONS_INDEX: (NODES_TABLE, LAT_COL_NAME, LNG_COL_NAME),
+                         TURN_STARTS_INDEX: (TURNS_TABLE, 'start_lat', 'start_lng'),
+                         TURN_CENTERS_INDEX: (TURNS_TABLE, 'intersection_lat', 'intersection_lng'),
+                         TURN_ENDS_INDEX: (TURNS_TABLE, 'end_lat', 'end_lng')}
+
+# float columns of coordinates, that keep their full precision
+LOCATION_COL_SUFFIXES = ('lat', 'lng', LAT_COL_NAME, LNG_COL_NAME)
+# columns of ids and directions, that are always stored as integers, even if they were converted to floats before
+INTEGER_COL_SUFFIXES = ('_id', '_ids', ':ID', OSM_ID_COL_NAME, 'end_direction')
+# suffixes of the columns, that a (lat, lng) tuple column is split into
+POSITION_COL_SUFFIXES = ('_lat', '_lng')
+
+
+######################################################################
+
+
+class ColumnMapping(Mapping):
+    """ Read-only dict replacement, that looks up the values of sorted key columns by binary search """
+
+    def __init__(self, keys: np.ndarray, *value_columns: np.ndarray):
+        order = np.argsort(keys, kind='stable')
+        self.sorted_keys = np.asarray(keys)[order]
+        self.value_columns = [np.asarray(values)[order] for values in value_columns]
+
+    def get_position(self, key) -> int:
+        position = int(np.searchsorted(self.sorted_keys, key))
+        if position == len(self.sorted_keys) or self.sorted_keys[position] != key:
+            raise KeyError(key)
+        return position
+
+    def __getitem__(self, key):
+        position = self.get_position(key)
+        if len(self.value_columns) == 1:
+            return self.value_columns[0][position].item()
+        return tuple(values[position].item() for values in self.value_columns)
+
+    def __iter__(self):
+        return iter(self.sorted_keys.tolist())
+
+    def __len__(self):
+        return len(self.sorted_keys)
+
+
+class RaggedMapping(ColumnMapping):
+    """ Read-only dict replacement, that maps each key to a list of variable length stored in a single array """
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, values: np.ndarray):
+        super().__init__(keys, offsets[:-1], offsets[1:])
+        self.ragged_values = values
+
+    def __getitem__(self, key) -> list:
+        start, end = super().__getitem__(key)
+        return self.ragged_values[start:end].tolist()
+
+
+class NetworkBundle(object):
+    """ The ready-to-use street network of a bundle for the attack """
+
+    def __init__(self, tables: Dict[str, pd.DataFrame], arrays: Dict[str, np.ndarray],
+                 straight_successors: Optional[StraightSuccessors], spatial_indexes: Dict[str, SpatialIndex]):
+        self.turns_df = tables[TURNS_TABLE]
+        self.segments_df = tables[SEGMENTS_TABLE]
+        self.nodes_df = tables[NODES_TABLE]
+
+        self.segment_to_osm_ids = RaggedMapping(arrays[SEGMENT_IDS_ARRAY], arrays[SEGMENT_OSM_OFFSETS_ARRAY],
+                                                arrays[SEGMENT_OSM_IDS_ARRAY])
+        node_ids = self.nodes_df[NODE_ID_COL_NAME].to_numpy()
+        self.node_id_to_osm_id = ColumnMapping(node_ids, self.nodes_df[OSM_ID_COL_NAME].to_numpy())
+        self.node_id_to_latlng = ColumnMapping(node_ids, self.nodes_df[LAT_COL_NAME].to_numpy(),
+                                               self.nodes_df[LNG_COL_NAME].to_numpy())
+        # straight travel options of each segment for the TurnPairMatcher; None without the needed turn columns
+        self.straight_successors = straight_successors
+        # radius and bounding box queries over the intersections by node id and the turns by their index, e.g.
+        # network.spatial_indexes[TURN_CENTERS_INDEX].query_radius(lat, lng, 20.0)
+        self.spatial_indexes = spatial_indexes
+
+
+class BundleData(object):
+    """ The data section of a bundle file, that aligns each added array """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def add_array(self, values: np.ndarray) -> dict:
+        """ :return: the entry of the array for the json header """
+        padding = -self.size % BUNDLE_ALIGNMENT
+        self.chunks.append(bytes(padding))
+        self.chunks.append(np.ascontiguousarray(values).tobytes())
+        entry = {'dtype': values.dtype.str, 'length': len(values), 'offset': self.size + padding}
+        self.size += padding + values.nbytes
+        return entry
+
+
+def write_bundle_file(file_path: str, header: dict, data: BundleData, magic: bytes = BUNDLE_MAGIC,
+                      version: int = BUNDLE_VERSION):
+    """
+    Write a json header and the arrays of the data section in the bundle layout. The bundle is written to a temporary
+    file first and replaces an existing file afterwards, as loaded bundles still map the existing one into memory.
+    """
+    header_bytes = json.dumps(header).encode('utf-8')
+    preamble_size = BUNDLE_PREAMBLE.size + len(header_bytes)
+    with open(file_path + '.tmp', 'wb') as bundle_file:
+        bundle_file.write(BUNDLE_PREAMBLE.pack(magic, version, len(header_bytes)))
+        bundle_file.write(header_bytes)
+        bundle_file.write(bytes(-preamble_size % BUNDLE_ALIGNMENT))
+        for chunk in data.chunks:
+            bundle_file.write(chunk)
+    os.replace(file_path + '.tmp', file_path)
+
+
+def map_bundle_file(file_path: str, magic: bytes = BUNDLE_MAGIC, version: int = BUNDLE_VERSION) \
+        -> Tuple[dict, Callable[[dict], np.ndarray]]:
+    """
+    Memory map a file in the bundle layout
+    :return: the json header and a function, that maps the array of a header entry without copying it
+    """
+    buffer = np.memmap(file_path, dtype=np.uint8, mode='r')
+    file_magic, file_version, header_size = BUNDLE_PREAMBLE.unpack(buffer[:BUNDLE_PREAMBLE.size].tobytes())
+    if file_magic != magic:
+        raise Exception("%s is no %s file." % (file_path, magic.rstrip(b'\x00').decode('ascii')))
+    if file_version != version:
+        raise Exception("%s has version %d, but version %d is expected. Please recreate it."
+                        % (file_path, file_version, version))
+
+    header = json.loads(buffer[BUNDLE_PREAMBLE.size:BUNDLE_PREAMBLE.size + header_size].tobytes())
+    preamble_size = BUNDLE_PREAMBLE.size + header_size
+    data_start = preamble_size + (-preamble_size % BUNDLE_ALIGNMENT)
+
+    def get_array(entry: dict) -> np.ndarray:
+        return np.frombuffer(buffer, dtype=np.dtype(entry['dtype']), count=entry['length'],
+                             offset=data_start + entry['offset'])
+
+    return header, get_array
+
+
+def is_bool_column(values: pd.Series) -> bool:
+    """ bool columns, also the ones of dtype object, that were combined from frames with and without the column """
+    if pd.api.types.is_bool_dtype(values):
+        return True
+    return pd.api.types.is_object_dtype(values) and not values.empty and \
+        all(isinstance(value, (bool, np.bool_)) for value in values)
+
+
+def get_column_dtype(column_name: str, values: pd.Series) -> np.dtype:
+    """ the smallest dtype, that a column is stored with in a bundle """
+    if is_bool_column(values):
+        return np.dtype(np.bool_)
+    elif column_name.endswith(INTEGER_COL_SUFFIXES) and pd.api.types.is_float_dtype(values):
+        # float32 only represents integers up to 2^24 exactly, so ids are converted back to integers
+        if not np.array_equal(values.to_numpy(), np.round(values.to_numpy())):
+            raise Exception("Column %s contains values, that are no integers." % column_name)
+        return get_column_dtype(column_name, values.astype(np.int64))
+    elif pd.api.types.is_integer_dtype(values):
+        is_int32 = values.empty or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max)
+        return np.dtype(np.int32) if is_int32 else np.dtype(np.int64)
+    elif pd.api.types.is_float_dtype(values):
+        return np.dtype(np.float64) if column_name.endswith(LOCATION_COL_SUFFIXES) else np.dtype(np.float32)
+    else:
+        raise Exception("Column %s of dtype %s can't be stored in a network bundle." % (column_name, values.dtype))
+
+
+def split_position_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """ split columns of (lat, lng) tuples like first_node_after_start into a lat and a lng column """
+    for column_name in [column for column in df.columns if pd.api.types.is_object_dtype(df[column])]:
+        if len(df) and isinstance(df[column_name].iloc[0], tuple):
+            positions = np.array(df[column_name].tolist(), dtype=np.float64).reshape(-1, 2)
+            position = df.columns.get_loc(column_name)
+            df = df.drop(columns=column_name)
+            for i, suffix in enumerate(POSITION_COL_SUFFIXES):
+                df.insert(position + i, column_name + suffix, positions[:, i])
+    return df
+
+
+def create_ragged_arrays(segment_to_osm_ids: Dict[int, List[int]]) -> Dict[str, np.ndarray]:
+    segment_ids = np.array(sorted(segment_to_osm_ids.keys()), dtype=np.int64)
+    lengths = np.array([len(segment_to_osm_ids[segment_id]) for segment_id in segment_ids.tolist()], dtype=np.int64)
+    osm_ids = np.fromiter((osm_id for segment_id in segment_ids.tolist() for osm_id in segment_to_osm_ids[segment_id]),
+                          dtype=np.int64, count=int(lengths.sum()))
+    return {SEGMENT_IDS_ARRAY: segment_ids.astype(get_column_dtype(SEGMENT_IDS_ARRAY, pd.Series(segment_ids))),
+            SEGMENT_OSM_OFFSETS_ARRAY: np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            SEGMENT_OSM_IDS_ARRAY: osm_ids}
+
+
+def create_straight_successor_arrays(turns_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """ the straight successors with the dtypes of the turn columns they are created from """
+    straight_successors = create_straight_successors(turns_df)
+    arrays = {}
+    for array_name, values in straight_successors.to_arrays().items():
+        if array_name not in (OFFSETS_ARRAY, ROAD_TIERS_ARRAY):
+            values = values.astype(get_column_dtype(array_name, pd.Series(values)))
+        arrays[STRAIGHT_SUCCESSORS_PREFIX + array_name] = values
+    return arrays
+
+
+def write_network_bundle(file_path: str,
+                         turns_df: pd.DataFrame,
+                         segments_df: pd.DataFrame,
+                         nodes_df: pd.DataFrame,
+                         segment_to_osm_ids: Dict[int, List[int]]):
+    """
+    Store the street network in a single bundle file
+    :param segments_df: road segments, a named index like segment_id is stored as well
+    :param segment_to_osm_ids: the osm ids of all nodes on each road segment
+    """
+    data, header = BundleData(), {'version': BUNDLE_VERSION, 'tables': {}, 'arrays': {}, 'spatial_indexes': {}}
+    split_tables = {}
+    for table_name, df in [(TURNS_TABLE, turns_df), (SEGMENTS_TABLE, segments_df), (NODES_TABLE, nodes_df)]:
+        index_name = df.index.name
+        df = split_position_columns(df.reset_index() if index_name is not None else df)
+        split_tables[table_name] = df
+        columns = []
+        for column_name in df.columns:
+            values = df[column_name]
+            if not is_bool_column(values) and (pd.api.types.is_object_dtype(values) or
+                                               pd.api.types.is_string_dtype(values) or
+                                               isinstance(values.dtype, pd.CategoricalDtype)):
+                categorical = pd.Categorical(values)
+                entry = data.add_array(categorical.codes.astype(np.int32))
+                entry['categories'] = categorical.categories.tolist()
+            else:
+                entry = data.add_array(values.to_numpy(dtype=get_column_dtype(column_name, values)))
+            columns.append(dict(entry, name=column_name))
+        header['tables'][table_name] = {'length': len(df), 'index': index_name, 'columns': columns}
+
+    arrays = create_ragged_arrays(segment_to_osm_ids)
+    if has_straight_successor_columns(turns_df):
+        arrays.update(create_straight_successor_arrays(turns_df))
+        header['straight_drive_threshold'] = STRAIGHT_DRIVE_THRESHOLD
+    for array_name, values in arrays.items():
+        header['arrays'][array_name] = data.add_array(values)
+
+    for index_name, (table_name, lat_column, lng_column) in SPATIAL_INDEX_COLUMNS.items():
+        df = split_tables[table_name]
+        if lat_column not in df.columns or lng_column not in df.columns:
+            continue
+        positions = None
+        if table_name == NODES_TABLE and LABEL_COL_NAME in df.columns:
+            positions = np.flatnonzero((df[LABEL_COL_NAME] == INTERSECTION).to_numpy())
+        grid, cell_offsets, order = create_spatial_index_arrays(df[lat_column].to_numpy(), df[lng_column].to_numpy(),
+                                                                positions)
+        header['spatial_indexes'][index_name] = {'grid': grid, 'cell_offsets': data.add_array(cell_offsets),
+                                                 'order': data.add_array(order)}
+
+    write_bundle_file(file_path, header, data)
+
+
+def load_network_bundle(file_path: str) -> NetworkBundle:
+    """ Memory map a bundle and create the turns_df, segments_df and nodes_df with the lookups for the attack """
+    header, get_array = map_bundle_file(file_path)
+
+    loaded_tables = {}
+    for table_name, table in header['tables'].items():
+        columns = {}
+        for entry in table['columns']:
+            values = get_array(entry)
+            if 'categories' in entry:
+                values = pd.Categorical.from_codes(values, entry['categories'])
+            columns[entry['name']] = values
+        # the columns stay views of the memory mapped file
+        df = pd.DataFrame(columns, copy=False)
+        if table['index'] is not None:
+            df.set_index(table['index'], inplace=True)
+        loaded_tables[table_name] = df
+
+    arrays = {array_name: get_array(entry) for array_name, entry in header['arrays'].items()}
+
+    # straight successors of a bundle written with another threshold are created anew from its turns
+    straight_successors = None
+    if header.get('straight_drive_threshold') == STRAIGHT_DRIVE_THRESHOLD:
+        straight_successors = StraightSuccessors.from_arrays(
+            {array_name[len(STRAIGHT_SUCCESSORS_PREFIX):]: values for array_name, values in arrays.items()
+             if array_name.startswith(STRAIGHT_SUCCESSORS_PREFIX)})
+    elif has_straight_successor_columns(loaded_tables[TURNS_TABLE]):
+        straight_successors = create_straight_successors(loaded_tables[TURNS_TABLE])
+
+    spatial_indexes = {}
+    for index_name, entry in header['spatial_indexes'].items():
+        table_name, lat_column, lng_column = SPATIAL_INDEX_COLUMNS[index_name]
+        df = loaded_tables[table_name]
+        item_ids = df[NODE_ID_COL_NAME].to_numpy() if table_name == NODES_TABLE else df.index.to_numpy()
+        spatial_indexes[index_name] = SpatialIndex(df[lat_column].to_numpy(), df[lng_column].to_numpy(), item_ids,
+                                                   entry['grid'], get_array(entry['cell_offsets']),
+                                                   get_array(entry['order']))
+    return NetworkBundle(loaded_tables, arrays, straight_successors, spatial_indexes)
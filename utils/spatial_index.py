@@ -0,0 +1,119 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+from utils.distance_helper import METERS_PER_DEGREE_LAT, HAVERSINE, VINCENTY, calc_distances, get_degree_margins
+
+######################################################################
+
+# edge length of the grid cells in meters
+GRID_CELL_SIZE = 250.0
+# relative deviation of HAVERSINE distances, within which the distance to the radius is decided by VINCENTY
+HAVERSINE_MAX_DEVIATION = 0.01
+
+
+######################################################################
+
+
+class SpatialIndex(object):
+    """
+    Uniform grid over the positions of items like intersections or turns for radius and bounding box queries. The grid
+    is laid over equirectangular projected coordinates, so each cell spans a fixed number of degrees, that corresponds
+    to GRID_CELL_SIZE meters at the center of the grid. The items within a cell are the positions
+    order[cell_offsets[cell]:cell_offsets[cell + 1]] of lats, lngs and item_ids, cells are numbered row by row.
+    """
+
+    def __init__(self, lats: np.ndarray, lngs: np.ndarray, item_ids: np.ndarray, grid: dict,
+                 cell_offsets: np.ndarray, order: np.ndarray):
+        """
+        :param item_ids: the ids, that queries return, e.g. the node ids or the index of the turns_df
+        :param grid: min_lat, min_lng, cell_height and cell_width in degrees and the number of rows and cols
+        """
+        self.lats = lats
+        self.lngs = lngs
+        self.item_ids = item_ids
+        self.grid = grid
+        self.cell_offsets = cell_offsets
+        self.order = order
+
+    def query_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> np.ndarray:
+        """ ids of all items within the bounding box in the order of item_ids """
+        positions = self.__get_positions_in_cells(min_lat, min_lng, max_lat, max_lng)
+        lats, lngs = self.lats[positions], self.lngs[positions]
+        return self.item_ids[np.sort(positions[(lats >= min_lat) & (lats <= max_lat) &
+                                               (lngs >= min_lng) & (lngs <= max_lng)])]
+
+    def query_radius(self, lat: float, lng: float, radius: float) -> np.ndarray:
+        """ ids of all items within radius meters around a position in the order of item_ids """
+        margin_lat, margin_lng = get_degree_margins(lat, lat, radius)
+        positions = self.__get_positions_in_cells(lat - margin_lat, lng - margin_lng, lat + margin_lat,
+                                                  lng + margin_lng)
+        lats, lngs = self.lats[positions], self.lngs[positions]
+        distances = calc_distances(np.full(len(positions), lat), np.full(len(positions), lng), lats, lngs,
+                                   mode=HAVERSINE)
+        is_close_call = np.abs(distances - radius) <= radius * HAVERSINE_MAX_DEVIATION
+        if is_close_call.any():
+            distances[is_close_call] = calc_distances(np.full(is_close_call.sum(), lat),
+                                                      np.full(is_close_call.sum(), lng),
+                                                      lats[is_close_call], lngs[is_close_call], mode=VINCENTY)
+        return self.item_ids[np.sort(positions[distances <= radius])]
+
+    def __get_positions_in_cells(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> np.ndarray:
+        """ positions of the items within all cells, that overlap the bounding box """
+        grid = self.grid
+        if len(self.order) == 0 or max_lat < min_lat or max_lng < min_lng:
+            return np.zeros(0, dtype=np.int64)
+
+        min_row, max_row = self.__get_cell_range(min_lat, max_lat, grid['min_lat'], grid['cell_height'], grid['rows'])
+        min_col, max_col = self.__get_cell_range(min_lng, max_lng, grid['min_lng'], grid['cell_width'], grid['cols'])
+
+        # the cells of a row within the column range are consecutive
+        row_starts = np.arange(min_row, max_row + 1) * grid['cols']
+        return np.concatenate([self.order[self.cell_offsets[row_start + min_col]:
+                                          self.cell_offsets[row_start + max_col + 1]]
+                               for row_start in row_starts.tolist()]).astype(np.int64)
+
+    # noinspection PyMethodMayBeStatic
+    def __get_cell_range(self, min_value: float, max_value: float, origin: float, cell_length: float,
+                         cells: int) -> Tuple[int, int]:
+        """ first and last cell of a row or column, that overlap the range """
+        first_cell = min(max(int(math.floor((min_value - origin) / cell_length)), 0), cells - 1)
+        last_cell = min(max(int(math.floor((max_value - origin) / cell_length)), 0), cells - 1)
+        return first_cell, last_cell
+
+
+def create_spatial_index_arrays(lats: np.ndarray, lngs: np.ndarray, positions: Optional[np.ndarray] = None,
+                                cell_size: float = GRID_CELL_SIZE) -> Tuple[dict, np.ndarray, np.ndarray]:
+    """
+    Lay a grid over the bounding box of the positions and sort the positions by their cell
+    :param positions: the positions of lats and lngs to index, all by default; positions without coordinates are skipped
+    :return: the grid description, the offsets of each cell and the positions sorted by cell
+    """
+    lats, lngs = np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64)
+    if positions is None:
+        positions = np.arange(len(lats))
+    positions = np.asarray(positions, dtype=np.int64)
+    positions = positions[~(np.isnan(lats[positions]) | np.isnan(lngs[positions]))]
+
+    if len(positions):
+        min_lat, max_lat = float(lats[positions].min()), float(lats[positions].max())
+        min_lng, max_lng = float(lngs[positions].min()), float(lngs[positions].max())
+    else:
+        min_lat = max_lat = min_lng = max_lng = 0.0
+    center_lat = min(max((min_lat + max_lat) / 2, -89.0), 89.0)
+    cell_height = cell_size / METERS_PER_DEGREE_LAT
+    cell_width = cell_size / (METERS_PER_DEGREE_LAT * math.cos(math.radians(center_lat)))
+    rows = int(math.floor((max_lat - min_lat) / cell_height)) + 1
+    cols = int(math.floor((max_lng - min_lng) / cell_width)) + 1
+    grid = {'min_lat': min_lat, 'min_lng': min_lng, 'cell_height': cell_height, 'cell_width': cell_width,
+            'rows': rows, 'cols': cols}
+
+    cell_rows = np.clip(np.floor((lats[positions] - min_lat) / cell_height), 0, rows - 1).astype(np.int64)
+    cell_cols = np.clip(np.floor((lngs[positions] - min_lng) / cell_width), 0, cols - 1).astype(np.int64)
+    cells = cell_rows * cols + cell_cols
+    # a stable sort keeps the positions of a cell in ascending order
+    order = positions[np.argsort(cells, kind='stable')]
+    cell_offsets = np.zeros(rows * cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cells, minlength=rows * cols), out=cell_offsets[1:])
+    return grid, cell_offsets, order.astype(np.int32 if len(lats) <= np.iinfo(np.int32).max else np.int64)
@@ -0,0 +1,42 @@
+import math
+import os
+from multiprocessing import Pool
+from typing import Callable, Iterable, List
+
+######################################################################
+
+# number of chunks of tasks per worker; fewer chunks reduce the overhead per task, more chunks balance the load
+CHUNKS_PER_WORKER = 4
+
+######################################################################
+
+# read-only state of the current pool, set once in every worker
+__worker_state = None
+
+
+def __set_worker_state(state):
+    global __worker_state
+    __worker_state = state
+
+
+def get_worker_state():
+    """ the read-only state, that map_with_shared_state handed to the workers """
+    return __worker_state
+
+
+def map_with_shared_state(func: Callable, tasks: Iterable, state, star: bool = False) -> List:
+    """
+    Map func over the tasks in a process pool, while the read-only state is handed to each worker only once by the pool
+    initializer instead of pickling it with every task like a bound method. Forked workers inherit the state without
+    pickling it at all. func has to be a module-level function, that retrieves the state by get_worker_state.
+    :param star: unpack each task as arguments of func like Pool.starmap
+    """
+    tasks = list(tasks)
+    processes = os.cpu_count() or 1
+    # submit the tasks in a few coarse chunks per worker
+    chunk_size = max(1, math.ceil(len(tasks) / (processes * CHUNKS_PER_WORKER)))
+
+    with Pool(processes, initializer=__set_worker_state, initargs=(state,)) as pool:
+        if star:
+            return pool.starmap(func, tasks, chunk_size)
+        return pool.map(func, tasks, chunk_size)
@@ -1,9 +1,9 @@
-import pickle
 from typing import Dict, List
 
 import pandas as pd
 
 from definitions import NODE_ID_COL_NAME, ROOT_DIR, OSM_ID_COL_NAME
+from utils.network_bundle import NETWORK_BUNDLE_PATH, write_network_bundle
 from waltereit_attack.graph_preparation.create_turns_database import create_all_possible_turns
 from waltereit_attack.graph_preparation.helper.connections_between_intersections import \
     create_connections_between_intersections
@@ -22,7 +22,6 @@ pd.set_option('display.max_rows', 500)
 pd.set_option('display.max_columns', 500)
 pd.set_option('display.width', 1000)
 FILE_TARGET_DIR = ROOT_DIR + "/data/target_maps/" + TARGET_LOCATION
-SEGMENT_TO_OSM_DICT_NAME = '/db/segment_to_osm_ids.pickle'
 
 
 ######################################################################
@@ -51,16 +50,11 @@ if __name__ == '__main__':
     all_road_segments = create_all_road_segments(all_intersection_connections)
     turns = create_all_possible_turns(all_road_segments, nodes)
 
-    # store turns database for attack
-    turns.to_csv(FILE_TARGET_DIR + '/db/turns_df.csv', index=False)
-    # store road_segments database for attack
+    # store turns, road segments, nodes and the osm ids on road segments in a single bundle for the attack
     road_segments_df = pd.DataFrame.from_records([road_segment.to_dict() for road_segment in all_road_segments])
     road_segments_df.set_index('segment_id', inplace=True)
-    road_segments_df.to_csv(FILE_TARGET_DIR + '/db/road_segments_df.csv', index=False)
-    # store a dict to retrieve all osm ids on road segments
     node_to_osm_id = nodes.set_index(NODE_ID_COL_NAME)[OSM_ID_COL_NAME].to_dict()
     segments_to_osm_nodes = __create_segment_id_to_osm_nodes_map(all_road_segments, node_to_osm_id)
-    with open(FILE_TARGET_DIR + SEGMENT_TO_OSM_DICT_NAME, 'wb') as dump_file:
-        pickle.dump(segments_to_osm_nodes, dump_file)
+    write_network_bundle(FILE_TARGET_DIR + NETWORK_BUNDLE_PATH, turns, road_segments_df, nodes, segments_to_osm_nodes)
 
 
@@ -1,6 +1,5 @@
 import logging
 import os
-import pickle
 import timeit
 import unittest
 from datetime import datetime
@@ -8,7 +7,6 @@ from typing import List, Tuple
 
 import pandas as pd
 
-from definitions import NODE_ID_COL_NAME, OSM_ID_COL_NAME
 from narain_attack.convert_from_narain_format import convert_from_narain_format
 from narain_attack.sensor_data_processing.utils import FileUtils
 from schema.RouteTestResultModel import RouteTestResultModel
@@ -16,6 +14,7 @@ from schema.TestRouteModel import TestRouteModel
 from schema.sensor_models import SensorTurnModel, TrafficLightModel, RoundaboutTurnModel
 from sensor_analyze.preprocess_trip import SensorPreprocessor
 from utils import log
+from utils.network_bundle import NETWORK_BUNDLE_PATH, load_network_bundle
 from utils.test_utils import get_total_distance, run_evaluation
 from waltereit_attack.attack.create_route_candidates import get_all_route_candidates
 from waltereit_attack.attack.schema import RouteSectionModel, RouteSectionCandidateModel
@@ -43,12 +42,12 @@ class TestRouteCandidatesNarainData(unittest.TestCase):
             os.makedirs(DAROUTE_FORMAT_DIR)
 
         # Load database information
-        cls.turns_df = pd.read_csv(AREA_TARGET_PATH + "/db/turns_df.csv")
-        cls.nodes_df = pd.read_csv(AREA_TARGET_PATH + "/csv/nodes.csv")
-        cls.node_id_to_osm_id = cls.nodes_df.set_index(NODE_ID_COL_NAME)[OSM_ID_COL_NAME].to_dict()
-        cls.segments_df = pd.read_csv(AREA_TARGET_PATH + "/db/road_segments_df.csv")
-        with open(AREA_TARGET_PATH + '/db/segment_to_osm_ids.pickle', 'rb') as dump_file:
-            cls.segment_to_osm_path = pickle.load(dump_file)
+        network = load_network_bundle(AREA_TARGET_PATH + NETWORK_BUNDLE_PATH)
+        cls.turns_df = network.turns_df
+        cls.nodes_df = network.nodes_df
+        cls.node_id_to_osm_id = network.node_id_to_osm_id
+        cls.segments_df = network.segments_df
+        cls.segment_to_osm_path = network.segment_to_osm_ids
 
         # Init logger
         log.setup(log_filename=LOG_TARGET_DIR + "test_routes_" + cls.test_run_start + ".log")